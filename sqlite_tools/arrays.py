@@ -0,0 +1,413 @@
+"""
+CPT and SPT measurements as NumPy arrays, without building a DataFrame.
+
+The measurement functions in sqlite_tools.query go through pandas, which creates a
+Python object per value before building the DataFrame, even though CPT processing code
+usually only needs the depth, qc, fs and u2 arrays. The functions in this module return
+one contiguous NumPy array per column instead.
+
+If the ADBC SQLite driver (the adbc-driver-sqlite package, installed with the "adbc"
+extra) is installed, the rows are read into Arrow buffers by the driver, and the arrays
+are taken from those buffers, so no Python objects are created per row. The ADBC
+connections are kept open between calls, and are closed with close_adbc_connections.
+Otherwise the rows are read with sqlite3 in batches, and each batch is converted into a
+typed array straight away, so only one batch of row tuples is alive at a time.
+
+>>> cpt_arrays = cpt_measurement_arrays_for_one_nzgd(1, conn)
+>>> cpt_arrays.qc.mean()
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+
+from sqlite_tools import core
+from sqlite_tools.connection import ConnectionPool, as_connection
+
+# The number of rows read from a sqlite3 cursor per batch
+FETCH_BATCH_SIZE = 65_536
+
+BACKENDS = ("auto", "adbc", "sqlite3")
+
+# The ADBC connection of each thread and database file, keyed by the thread identifier
+# and the path of the file. They are kept here rather than in a threading.local, so
+# that close_adbc_connections can close the connections of every thread.
+_adbc_connections: dict[tuple[int, str], Any] = {}
+_adbc_connections_lock = threading.Lock()
+
+
+class CptMeasurementArrays(NamedTuple):
+    """The CPT measurements of one or more records, as one array per column."""
+
+    depth: np.ndarray
+    """The depths of the measurements in metres, as float64."""
+    qc: np.ndarray
+    """The cone resistances, as float64. Missing values are NaN."""
+    fs: np.ndarray
+    """The sleeve frictions, as float64. Missing values are NaN."""
+    u2: np.ndarray
+    """The pore pressures, as float64. Missing values are NaN."""
+    cpt_id: np.ndarray
+    """The CPT ID of each measurement, as int64."""
+    nzgd_id: np.ndarray
+    """The NZGD ID of each measurement, as int64."""
+
+
+class SptMeasurementArrays(NamedTuple):
+    """The SPT measurements of one or more records, as one array per column."""
+
+    depth: np.ndarray
+    """The depths of the measurements in metres, as float64."""
+    n: np.ndarray
+    """The SPT N values, as float64. Missing values are NaN."""
+    nzgd_id: np.ndarray
+    """The NZGD ID of each measurement, as int64."""
+
+
+def _adbc_connection(db_path: str) -> Any | None:
+    """
+    Gets the calling thread's read-only ADBC connection to a database file.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database file.
+
+    Returns
+    -------
+    adbc_driver_manager.dbapi.Connection or None
+        The connection, or None if the ADBC SQLite driver is not installed.
+    """
+    try:
+        import adbc_driver_sqlite.dbapi
+    except ImportError:
+        return None
+
+    key = (threading.get_ident(), db_path)
+    with _adbc_connections_lock:
+        adbc_conn = _adbc_connections.get(key)
+    if adbc_conn is None:
+        adbc_conn = adbc_driver_sqlite.dbapi.connect(
+            f"{Path(db_path).as_uri()}?mode=ro"
+        )
+        with _adbc_connections_lock:
+            _adbc_connections[key] = adbc_conn
+    return adbc_conn
+
+
+def close_adbc_connections(
+    conn: sqlite3.Connection | ConnectionPool | None = None,
+) -> None:
+    """
+    Closes the ADBC connections opened by the functions of this module.
+
+    The ADBC backend keeps a connection per thread and database file open between
+    calls. A thread that reads arrays after its connection is closed opens a new one.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection or ConnectionPool or None, optional
+        A connection to the database file whose ADBC connections are closed, or a pool
+        to take a connection from. If None (default), the ADBC connections of every
+        database file are closed.
+    """
+    db_path = None if conn is None else core.database_path(as_connection(conn))
+    with _adbc_connections_lock:
+        closed_keys = [
+            key for key in _adbc_connections if db_path is None or key[1] == db_path
+        ]
+        closed_connections = [_adbc_connections.pop(key) for key in closed_keys]
+    for adbc_conn in closed_connections:
+        adbc_conn.close()
+
+
+def _fetch_arrays_sqlite3(
+    sql: str, params: Sequence[Any], conn: sqlite3.Connection, dtypes: Sequence[type]
+) -> list[np.ndarray]:
+    """
+    Runs a query with sqlite3, and converts each batch of rows into arrays.
+
+    Parameters
+    ----------
+    sql : str
+        The SQL query.
+    params : Sequence[Any]
+        The bind parameters of the query.
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    dtypes : Sequence[type]
+        The dtype of each column of the result.
+
+    Returns
+    -------
+    list[np.ndarray]
+        One contiguous array per column.
+    """
+    cursor = conn.execute(sql, params)
+    # Every column is converted to float64 first, as NULLs become NaN. The integer
+    # columns are IDs, which are represented exactly by float64.
+    batches = [np.empty((0, len(dtypes)), dtype=np.float64)]
+    while rows := cursor.fetchmany(FETCH_BATCH_SIZE):
+        batches.append(np.array(rows, dtype=np.float64))
+    values = np.concatenate(batches)
+    return [
+        np.ascontiguousarray(values[:, column], dtype=dtype)
+        for column, dtype in enumerate(dtypes)
+    ]
+
+
+def _fetch_arrays_adbc(
+    sql: str, params: Sequence[Any], adbc_conn: Any, dtypes: Sequence[type]
+) -> list[np.ndarray]:
+    """
+    Runs a query with the ADBC SQLite driver, and takes the arrays from its Arrow table.
+
+    Parameters
+    ----------
+    sql : str
+        The SQL query.
+    params : Sequence[Any]
+        The bind parameters of the query.
+    adbc_conn : adbc_driver_manager.dbapi.Connection
+        The ADBC connection.
+    dtypes : Sequence[type]
+        The dtype of each column of the result.
+
+    Returns
+    -------
+    list[np.ndarray]
+        One contiguous array per column.
+    """
+    with adbc_conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        table = cursor.fetch_arrow_table()
+    # Columns without nulls in a single chunk are converted without copying. Columns
+    # with nulls are converted to float64 with NaN first.
+    return [
+        np.ascontiguousarray(
+            table.column(column).to_numpy(zero_copy_only=False), dtype=dtype
+        )
+        for column, dtype in enumerate(dtypes)
+    ]
+
+
+def _measurement_arrays(
+    query_template: str,
+    nzgd_ids: Iterable[int],
+    conn: sqlite3.Connection | ConnectionPool,
+    dtypes: Sequence[type],
+    backend: str,
+) -> list[np.ndarray]:
+    """
+    Runs a measurement query for many NZGD IDs, in chunks, and returns its arrays.
+
+    Parameters
+    ----------
+    query_template : str
+        The SQL query, containing a "{placeholders}" field for the IN (...) list. Its
+        last column must be the NZGD ID.
+    nzgd_ids : Iterable[int]
+        The NZGD IDs to query. Duplicate IDs are only queried once.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    dtypes : Sequence[type]
+        The dtype of each column of the result.
+    backend : str
+        "adbc", "sqlite3", or "auto" to use ADBC if it is installed.
+
+    Returns
+    -------
+    list[np.ndarray]
+        One contiguous array per column, ordered by the given NZGD IDs, with the order
+        of the query kept within each ID.
+
+    Raises
+    ------
+    ValueError
+        If the backend is not supported.
+    ImportError
+        If the backend is "adbc" but the ADBC SQLite driver is not installed.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unsupported backend {backend!r}. "
+            f"Supported backends are: {', '.join(BACKENDS)}"
+        )
+    conn = as_connection(conn)
+
+    adbc_conn = None
+    if backend != "sqlite3":
+        # ADBC opens its own connection, so in-memory databases are always read
+        # with sqlite3
+        db_path = core.database_path(conn)
+        adbc_conn = _adbc_connection(db_path) if db_path else None
+        if adbc_conn is None and backend == "adbc":
+            raise ImportError(
+                "The adbc backend requires adbc-driver-sqlite to be installed, "
+                "and a database file rather than an in-memory database"
+            )
+
+    chunk_columns = []
+    for chunk in core.chunks(core.normalise_nzgd_ids(nzgd_ids), core.MAX_SQL_VARIABLES):
+        sql = query_template.format(placeholders=",".join("?" * len(chunk)))
+        if adbc_conn is not None:
+            columns = _fetch_arrays_adbc(sql, chunk, adbc_conn, dtypes)
+        else:
+            columns = _fetch_arrays_sqlite3(sql, chunk, conn, dtypes)
+
+        if len(chunk) > 1:
+            # The query orders the rows by NZGD ID, so reorder them to follow the
+            # order of the requested IDs. A stable sort keeps the depth order within
+            # each ID.
+            chunk_ids = np.array(chunk)
+            chunk_sorter = np.argsort(chunk_ids)
+            id_position = chunk_sorter[
+                np.searchsorted(chunk_ids, columns[-1], sorter=chunk_sorter)
+            ]
+            order = np.argsort(id_position, kind="stable")
+            columns = [column[order] for column in columns]
+        chunk_columns.append(columns)
+
+    if not chunk_columns:
+        return [np.empty(0, dtype=dtype) for dtype in dtypes]
+    if len(chunk_columns) == 1:
+        return chunk_columns[0]
+    return [np.concatenate(columns) for columns in zip(*chunk_columns)]
+
+
+def cpt_measurement_arrays_for_one_nzgd(
+    selected_nzgd_id: int,
+    conn: sqlite3.Connection | ConnectionPool,
+    backend: str = "auto",
+) -> CptMeasurementArrays:
+    """
+    Extracts the CPT measurements of an NZGD ID as NumPy arrays.
+
+    The arrays hold the same values, in the same order, as the columns of
+    query.cpt_measurements_for_one_nzgd.
+
+    Parameters
+    ----------
+    selected_nzgd_id : int
+        The selected NZGD ID.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    backend : str, optional
+        "adbc" to read with the ADBC SQLite driver, "sqlite3" to read with the sqlite3
+        module, or "auto" (default) to use ADBC if it is installed.
+
+    Returns
+    -------
+    CptMeasurementArrays
+        The measurements, ordered by depth.
+    """
+    return cpt_measurement_arrays_for_nzgd_ids([selected_nzgd_id], conn, backend)
+
+
+def cpt_measurement_arrays_for_nzgd_ids(
+    nzgd_ids: Iterable[int],
+    conn: sqlite3.Connection | ConnectionPool,
+    backend: str = "auto",
+) -> CptMeasurementArrays:
+    """
+    Extracts the CPT measurements of many NZGD IDs as NumPy arrays.
+
+    The arrays hold the same values, in the same order, as the columns of
+    query.cpt_measurements_for_nzgd_ids.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    backend : str, optional
+        "adbc" to read with the ADBC SQLite driver, "sqlite3" to read with the sqlite3
+        module, or "auto" (default) to use ADBC if it is installed.
+
+    Returns
+    -------
+    CptMeasurementArrays
+        The measurements, ordered by the given NZGD IDs and then by depth.
+    """
+    return CptMeasurementArrays(
+        *_measurement_arrays(
+            core.CPT_MEASUREMENTS_FOR_NZGD_IDS_QUERY,
+            nzgd_ids,
+            conn,
+            [np.float64, np.float64, np.float64, np.float64, np.int64, np.int64],
+            backend,
+        )
+    )
+
+
+def spt_measurement_arrays_for_one_nzgd(
+    selected_nzgd_id: int,
+    conn: sqlite3.Connection | ConnectionPool,
+    backend: str = "auto",
+) -> SptMeasurementArrays:
+    """
+    Extracts the SPT measurements of an NZGD ID as NumPy arrays.
+
+    The arrays hold the same values, in the same order, as the columns of
+    query.spt_measurements_for_one_nzgd.
+
+    Parameters
+    ----------
+    selected_nzgd_id : int
+        The selected NZGD ID.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    backend : str, optional
+        "adbc" to read with the ADBC SQLite driver, "sqlite3" to read with the sqlite3
+        module, or "auto" (default) to use ADBC if it is installed.
+
+    Returns
+    -------
+    SptMeasurementArrays
+        The measurements, ordered by depth.
+    """
+    return spt_measurement_arrays_for_nzgd_ids([selected_nzgd_id], conn, backend)
+
+
+def spt_measurement_arrays_for_nzgd_ids(
+    nzgd_ids: Iterable[int],
+    conn: sqlite3.Connection | ConnectionPool,
+    backend: str = "auto",
+) -> SptMeasurementArrays:
+    """
+    Extracts the SPT measurements of many NZGD IDs as NumPy arrays.
+
+    The arrays hold the same values, in the same order, as the columns of
+    query.spt_measurements_for_nzgd_ids.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    backend : str, optional
+        "adbc" to read with the ADBC SQLite driver, "sqlite3" to read with the sqlite3
+        module, or "auto" (default) to use ADBC if it is installed.
+
+    Returns
+    -------
+    SptMeasurementArrays
+        The measurements, ordered by the given NZGD IDs and then by depth.
+    """
+    return SptMeasurementArrays(
+        *_measurement_arrays(
+            core.SPT_MEASUREMENTS_FOR_NZGD_IDS_QUERY,
+            nzgd_ids,
+            conn,
+            [np.float64, np.float64, np.int64],
+            backend,
+        )
+    )
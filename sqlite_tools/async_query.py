@@ -0,0 +1,392 @@
+"""
+Awaitable versions of the public query functions in sqlite_tools.query.
+
+The functions in sqlite_tools.query are synchronous, so calling them from an asyncio
+event loop blocks it until the query finishes. AsyncQuery runs them on a bounded thread
+pool instead, where each worker thread has its own read-only connection, so that many
+queries can run concurrently without blocking the event loop.
+
+Examples
+--------
+>>> async_query = AsyncQuery("nzgd.db", max_workers=4)
+>>> cpt_vs30_df, spt_vs30_df = await asyncio.gather(
+...     async_query.cpt_vs30s_for_one_nzgd_id(1),
+...     async_query.spt_vs30s_for_one_nzgd_id(2),
+... )
+>>> await async_query.close()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import sqlite3
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from sqlite_tools import query
+from sqlite_tools.connection import ConnectionPool
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# How often a cancelled query is interrupted until its worker thread returns, in seconds
+INTERRUPT_INTERVAL_S = 0.05
+
+
+class AsyncQuery:
+    """
+    Runs the public query functions on a bounded thread pool, for use with asyncio.
+
+    Each method has the same arguments as the function of the same name in
+    sqlite_tools.query, except that the connection is not passed, as each worker
+    thread uses its own read-only connection.
+
+    Cancelling a task that is waiting for a slot or a worker thread means its query
+    never runs. Cancelling a task whose query is already running interrupts the query
+    with sqlite3.Connection.interrupt, which is safe because each worker thread's
+    connection only runs one query at a time. The slot of a cancelled query is only
+    released once its worker thread has returned, so max_concurrency always holds.
+
+    Parameters
+    ----------
+    db_path : Path
+        The path of the NZGD database file.
+    max_workers : int, optional
+        The number of worker threads, which is the number of queries that can run
+        at once. Default is 4.
+    max_concurrency : int or None, optional
+        The maximum number of queries that can be running or queued at once. Further
+        calls wait until a slot is free. If None (default), this is 4 * max_workers.
+    immutable : bool, optional
+        If True, the database is opened with immutable=1. Default is False.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        max_workers: int = 4,
+        max_concurrency: int | None = None,
+        immutable: bool = False,
+    ) -> None:
+        """Creates the thread pool. Connections are only opened when first used."""
+        self._pool = ConnectionPool(db_path, immutable=immutable)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sqlite_tools"
+        )
+        self._max_concurrency = max_concurrency or 4 * max_workers
+        # Created on first use, as before Python 3.10 a semaphore is bound to the
+        # event loop that is current when it is created
+        self._semaphore: asyncio.Semaphore | None = None
+        self._semaphore_loop: asyncio.AbstractEventLoop | None = None
+
+    def _loop_semaphore(self) -> asyncio.Semaphore:
+        """
+        Gets the semaphore that limits the concurrency, for the running event loop.
+
+        A new semaphore is created if the AsyncQuery is used from a different event
+        loop than before, such as in a later call to asyncio.run.
+
+        Returns
+        -------
+        asyncio.Semaphore
+            The semaphore of the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def run(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Runs any function that takes a connection as its conn keyword argument.
+
+        Parameters
+        ----------
+        function : Callable[..., Any]
+            The function to run, such as one of the functions in sqlite_tools.query.
+        *args : Any
+            The positional arguments of the function.
+        **kwargs : Any
+            The keyword arguments of the function, other than conn.
+
+        Returns
+        -------
+        Any
+            The return value of the function.
+        """
+        async with self._loop_semaphore():
+            running_conns: list[sqlite3.Connection] = []
+            running_conns_lock = threading.Lock()
+            executor_future = self._executor.submit(
+                self._run_in_worker,
+                running_conns,
+                running_conns_lock,
+                function,
+                args,
+                kwargs,
+            )
+            future = asyncio.wrap_future(executor_future)
+            try:
+                # Shielded, so that on cancellation the query can be interrupted
+                # and the worker thread freed before the slot is released
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Cancelling the executor future only succeeds if the job has not
+                # started. Otherwise, the query is interrupted and the slot is held
+                # until the worker thread has returned.
+                if not executor_future.cancel():
+                    await self._interrupt(future, running_conns, running_conns_lock)
+                raise
+
+    @staticmethod
+    async def _interrupt(
+        future: asyncio.Future,
+        running_conns: list[sqlite3.Connection],
+        running_conns_lock: threading.Lock,
+    ) -> None:
+        """
+        Interrupts a running job until its worker thread returns.
+
+        The interrupt is repeated, as interrupting a connection before its first
+        statement starts has no effect.
+
+        Parameters
+        ----------
+        future : asyncio.Future
+            The future of the job.
+        running_conns : list[sqlite3.Connection]
+            The connection of the job, once its worker thread has taken it.
+        running_conns_lock : threading.Lock
+            Held while the connection is added to or removed from running_conns.
+        """
+        while not future.done():
+            with running_conns_lock:
+                # The connection is only in the list while it runs this job, so
+                # a later job on the same worker thread is never interrupted
+                for conn in running_conns:
+                    conn.interrupt()
+            with contextlib.suppress(asyncio.CancelledError):
+                await asyncio.wait({future}, timeout=INTERRUPT_INTERVAL_S)
+        if not future.cancelled():
+            # The interrupted query raises sqlite3.OperationalError, which is retrieved
+            # here so it is not logged as never retrieved
+            future.exception()
+
+    def _run_in_worker(
+        self,
+        running_conns: list[sqlite3.Connection],
+        running_conns_lock: threading.Lock,
+        function: Callable[..., Any],
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> Any:
+        """
+        Runs a function on a worker thread, with that thread's connection.
+
+        Parameters
+        ----------
+        running_conns : list[sqlite3.Connection]
+            The connection is in this list while the function runs, so that the
+            awaiting task can interrupt the query if it is cancelled.
+        running_conns_lock : threading.Lock
+            Held while the connection is added to or removed from running_conns.
+        function : Callable[..., Any]
+            The function to run.
+        args : tuple[Any, ...]
+            The positional arguments of the function.
+        kwargs : dict[str, Any]
+            The keyword arguments of the function, other than conn.
+
+        Returns
+        -------
+        Any
+            The return value of the function.
+        """
+        conn = self._pool.connection()
+        with running_conns_lock:
+            running_conns.append(conn)
+        try:
+            return function(*args, conn=conn, **kwargs)
+        finally:
+            with running_conns_lock:
+                running_conns.remove(conn)
+
+    async def cpt_measurements_for_one_nzgd(
+        self, selected_nzgd_id: int
+    ) -> pd.DataFrame:
+        """Awaitable version of query.cpt_measurements_for_one_nzgd."""
+        return await self.run(query.cpt_measurements_for_one_nzgd, selected_nzgd_id)
+
+    async def cpt_measurements_for_nzgd_ids(
+        self, nzgd_ids: Iterable[int]
+    ) -> pd.DataFrame:
+        """Awaitable version of query.cpt_measurements_for_nzgd_ids."""
+        return await self.run(query.cpt_measurements_for_nzgd_ids, list(nzgd_ids))
+
+    async def spt_measurements_for_one_nzgd(
+        self, selected_nzgd_id: int
+    ) -> pd.DataFrame:
+        """Awaitable version of query.spt_measurements_for_one_nzgd."""
+        return await self.run(query.spt_measurements_for_one_nzgd, selected_nzgd_id)
+
+    async def spt_measurements_for_nzgd_ids(
+        self, nzgd_ids: Iterable[int]
+    ) -> pd.DataFrame:
+        """Awaitable version of query.spt_measurements_for_nzgd_ids."""
+        return await self.run(query.spt_measurements_for_nzgd_ids, list(nzgd_ids))
+
+    async def spt_soil_types_for_one_nzgd(
+        self, selected_nzgd_id: int, format_layer_thickness: bool = True
+    ) -> pd.DataFrame:
+        """Awaitable version of query.spt_soil_types_for_one_nzgd."""
+        return await self.run(
+            query.spt_soil_types_for_one_nzgd,
+            selected_nzgd_id,
+            format_layer_thickness=format_layer_thickness,
+        )
+
+    async def spt_soil_types_for_nzgd_ids(
+        self, nzgd_ids: Iterable[int], format_layer_thickness: bool = True
+    ) -> pd.DataFrame:
+        """Awaitable version of query.spt_soil_types_for_nzgd_ids."""
+        return await self.run(
+            query.spt_soil_types_for_nzgd_ids,
+            list(nzgd_ids),
+            format_layer_thickness=format_layer_thickness,
+        )
+
+    async def cpt_vs30s_for_one_nzgd_id(self, selected_nzgd_id: int) -> pd.DataFrame:
+        """Awaitable version of query.cpt_vs30s_for_one_nzgd_id."""
+        return await self.run(query.cpt_vs30s_for_one_nzgd_id, selected_nzgd_id)
+
+    async def cpt_vs30s_for_nzgd_ids(self, nzgd_ids: Iterable[int]) -> pd.DataFrame:
+        """Awaitable version of query.cpt_vs30s_for_nzgd_ids."""
+        return await self.run(query.cpt_vs30s_for_nzgd_ids, list(nzgd_ids))
+
+    async def spt_vs30s_for_one_nzgd_id(self, selected_nzgd_id: int) -> pd.DataFrame:
+        """Awaitable version of query.spt_vs30s_for_one_nzgd_id."""
+        return await self.run(query.spt_vs30s_for_one_nzgd_id, selected_nzgd_id)
+
+    async def spt_vs30s_for_nzgd_ids(self, nzgd_ids: Iterable[int]) -> pd.DataFrame:
+        """Awaitable version of query.spt_vs30s_for_nzgd_ids."""
+        return await self.run(query.spt_vs30s_for_nzgd_ids, list(nzgd_ids))
+
+    async def all_vs30s_given_correlations(
+        self,
+        selected_vs_to_vs30_correlation: str,
+        selected_cpt_to_vs_correlation: str,
+        selected_spt_to_vs_correlation: str,
+        selected_hammer_type: str,
+        compact: bool = False,
+    ) -> pd.DataFrame:
+        """Awaitable version of query.all_vs30s_given_correlations."""
+        return await self.run(
+            query.all_vs30s_given_correlations,
+            selected_vs_to_vs30_correlation,
+            selected_cpt_to_vs_correlation,
+            selected_spt_to_vs_correlation,
+            selected_hammer_type,
+            compact=compact,
+        )
+
+    async def filtered_vs30s(
+        self,
+        selected_vs_to_vs30_correlation: str,
+        selected_cpt_to_vs_correlation: str,
+        selected_spt_to_vs_correlation: str,
+        selected_hammer_type: str,
+        filters: query.Vs30Filters | None = None,
+        columns: Iterable[str] | None = None,
+        compact: bool = False,
+    ) -> pd.DataFrame:
+        """Awaitable version of query.filtered_vs30s."""
+        return await self.run(
+            query.filtered_vs30s,
+            selected_vs_to_vs30_correlation,
+            selected_cpt_to_vs_correlation,
+            selected_spt_to_vs_correlation,
+            selected_hammer_type,
+            filters=filters,
+            columns=None if columns is None else list(columns),
+            compact=compact,
+        )
+
+    async def vs30s_for_correlation_combinations(
+        self,
+        vs_to_vs30_correlations: Iterable[str] | None,
+        cpt_to_vs_correlations: Iterable[str] | None,
+        spt_to_vs_correlations: Iterable[str] | None,
+        hammer_types: Iterable[str] | None,
+        wide: bool = False,
+    ) -> pd.DataFrame:
+        """Awaitable version of query.vs30s_for_correlation_combinations."""
+        return await self.run(
+            query.vs30s_for_correlation_combinations,
+            *[
+                None if names is None else list(names)
+                for names in (
+                    vs_to_vs30_correlations,
+                    cpt_to_vs_correlations,
+                    spt_to_vs_correlations,
+                    hammer_types,
+                )
+            ],
+            wide=wide,
+        )
+
+    async def vs30_residual_statistics(
+        self,
+        selected_vs_to_vs30_correlation: str,
+        selected_cpt_to_vs_correlation: str,
+        selected_spt_to_vs_correlation: str,
+        selected_hammer_type: str,
+        group_by: Iterable[str] = ("region",),
+        filters: query.Vs30Filters | None = None,
+        quantiles: Iterable[float] = (0.1, 0.5, 0.9),
+    ) -> pd.DataFrame:
+        """Awaitable version of query.vs30_residual_statistics."""
+        return await self.run(
+            query.vs30_residual_statistics,
+            selected_vs_to_vs30_correlation,
+            selected_cpt_to_vs_correlation,
+            selected_spt_to_vs_correlation,
+            selected_hammer_type,
+            group_by=list(group_by),
+            filters=filters,
+            quantiles=list(quantiles),
+        )
+
+    async def get_westerhoff_model_gwl(
+        self, nzgd_id: int | list[int] | None = None
+    ) -> pd.DataFrame:
+        """Awaitable version of query.get_westerhoff_model_gwl."""
+        return await self.run(query.get_westerhoff_model_gwl, nzgd_id=nzgd_id)
+
+    async def record_details(
+        self,
+        nzgd_ids: int | Iterable[int],
+        include_measurements: bool = False,
+        include_soil_types: bool = False,
+    ) -> query.RecordDetails:
+        """Awaitable version of query.record_details."""
+        if not isinstance(nzgd_ids, int):
+            nzgd_ids = list(nzgd_ids)
+        return await self.run(
+            query.record_details,
+            nzgd_ids,
+            include_measurements=include_measurements,
+            include_soil_types=include_soil_types,
+        )
+
+    async def close(self) -> None:
+        """Waits for running queries to finish, then closes the threads and connections."""
+        await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self._executor.shutdown, wait=True)
+        )
+        self._pool.close()
@@ -0,0 +1,478 @@
+"""
+Benchmarks of the public query functions against a synthetic NZGD-shaped database.
+
+The real NZGD database cannot be shipped to CI, so the benchmarks run against a database
+created by sqlite_tools.synthetic, which runs offline on any machine. The results are
+written as JSON so they can be compared between versions to catch regressions.
+
+The cold import time of the import-light modules is also benchmarked, each in a new
+interpreter. If importing one of them imports pandas or numpy, the command fails, so
+a regression in the startup time of short-lived tools is caught.
+
+Run the benchmarks from the command line with
+
+    python -m sqlite_tools.benchmark --n-records 10000 --output results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import functools
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from sqlite_tools import core, query, synthetic
+
+# The modules that must not import the heavy dependencies, whose cold import time is
+# benchmarked
+IMPORT_LIGHT_MODULES = (
+    "sqlite_tools.core",
+    "sqlite_tools.query",
+    "sqlite_tools.async_query",
+)
+
+# The dependencies that the import-light modules only import when they are first used
+HEAVY_MODULES = ("numpy", "pandas")
+
+# Run in a new interpreter to time a cold import of a module. Prints the import time
+# in seconds, and the heavy modules that were imported with it.
+_IMPORT_TIMER = """
+import sys
+import time
+
+start_time = time.perf_counter()
+import {module}
+import_time_s = time.perf_counter() - start_time
+print(import_time_s, *sorted(set({heavy_modules}) & set(sys.modules)))
+"""
+
+
+def _time_calls(
+    name: str, case: str, calls: list[Callable[[], Any]], n_items: int | None = None
+) -> dict[str, Any]:
+    """
+    Times a list of calls and summarises the timings.
+
+    Parameters
+    ----------
+    name : str
+        The name of the benchmarked function.
+    case : str
+        A short description of what is benchmarked, such as "single_id".
+    calls : list[Callable[[], Any]]
+        The calls to time. Each call returns a DataFrame, core.Rows,
+        query.RecordDetails or an iterable of DataFrames.
+    n_items : int or None, optional
+        The number of NZGD IDs handled by each call, used to calculate the
+        throughput. Default is None, in which case throughput is not reported.
+
+    Returns
+    -------
+    dict[str, Any]
+        The benchmark result, containing the timings in seconds and the number of
+        rows returned per call.
+    """
+    timings = []
+    n_rows = 0
+    for call in calls:
+        start_time = time.perf_counter()
+        result = call()
+        if isinstance(result, core.Rows):
+            result = result.rows
+        elif isinstance(result, query.RecordDetails):
+            # Count the rows of every DataFrame that was requested
+            result = sum(
+                len(record_df) for record_df in result if record_df is not None
+            )
+        elif not isinstance(result, pd.DataFrame):
+            # Exhaust generators, so that the time taken to stream the data is included
+            result = sum(len(chunk_df) for chunk_df in result)
+        timings.append(time.perf_counter() - start_time)
+        n_rows += result if isinstance(result, int) else len(result)
+
+    benchmark_result = {
+        "function": name,
+        "case": case,
+        "n_calls": len(timings),
+        "mean_s": statistics.fmean(timings),
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "max_s": max(timings),
+        "mean_rows": n_rows / len(timings),
+    }
+    if n_items is not None:
+        benchmark_result["ids_per_s"] = n_items / benchmark_result["mean_s"]
+    return benchmark_result
+
+
+def _peak_memory(call: Callable[[], Any]) -> int:
+    """
+    Measures the peak memory allocated by a call, as traced by tracemalloc.
+
+    Parameters
+    ----------
+    call : Callable[[], Any]
+        The call to measure.
+
+    Returns
+    -------
+    int
+        The peak traced memory in bytes.
+    """
+    tracemalloc.start()
+    try:
+        call()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak_bytes
+
+
+def run_import_benchmarks(
+    modules: tuple[str, ...] = IMPORT_LIGHT_MODULES, n_repeats: int = 5
+) -> list[dict[str, Any]]:
+    """
+    Benchmarks the cold import time of modules, each in a new interpreter.
+
+    Parameters
+    ----------
+    modules : tuple[str, ...], optional
+        The names of the modules to import. Default is IMPORT_LIGHT_MODULES.
+    n_repeats : int, optional
+        The number of times to import each module. Default is 5.
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        One result per module, containing the import times in seconds and the
+        modules of HEAVY_MODULES that were imported with it.
+    """
+    results = []
+    for module in modules:
+        timings = []
+        for _ in range(n_repeats):
+            completed_process = subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    _IMPORT_TIMER.format(module=module, heavy_modules=HEAVY_MODULES),
+                ],
+                capture_output=True,
+                check=True,
+                text=True,
+            )
+            import_time_s, *imported_heavy_modules = completed_process.stdout.split()
+            timings.append(float(import_time_s))
+
+        results.append(
+            {
+                "function": module,
+                "case": "cold_import",
+                "n_calls": len(timings),
+                "mean_s": statistics.fmean(timings),
+                "median_s": statistics.median(timings),
+                "min_s": min(timings),
+                "max_s": max(timings),
+                "imported_heavy_modules": imported_heavy_modules,
+            }
+        )
+    return results
+
+
+def run_benchmarks(
+    conn: sqlite3.Connection,
+    n_single_calls: int = 100,
+    batch_size: int = 1000,
+    n_repeats: int = 3,
+    seed: int = 0,
+) -> list[dict[str, Any]]:
+    """
+    Benchmarks every public query function.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The connection to the database to benchmark against.
+    n_single_calls : int, optional
+        The number of randomly selected NZGD IDs to time the single-ID functions with.
+        Default is 100.
+    batch_size : int, optional
+        The number of NZGD IDs per call of the batched functions. Default is 1000.
+    n_repeats : int, optional
+        The number of times to repeat the bulk benchmarks. Default is 3.
+    seed : int, optional
+        The seed of the random number generator that selects the NZGD IDs. Default is 0.
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        One result per benchmark.
+    """
+    rng = np.random.default_rng(seed)
+    cpt_nzgd_ids = np.array(
+        [row[0] for row in conn.execute("SELECT DISTINCT nzgd_id FROM cptreport")]
+    )
+    spt_nzgd_ids = np.array(
+        [row[0] for row in conn.execute("SELECT borehole_id FROM sptreport")]
+    )
+    single_cpt_ids = rng.choice(cpt_nzgd_ids, n_single_calls).tolist()
+    single_spt_ids = rng.choice(spt_nzgd_ids, n_single_calls).tolist()
+    batch_cpt_ids = rng.choice(
+        cpt_nzgd_ids, min(batch_size, cpt_nzgd_ids.size), replace=False
+    ).tolist()
+    batch_spt_ids = rng.choice(
+        spt_nzgd_ids, min(batch_size, spt_nzgd_ids.size), replace=False
+    ).tolist()
+
+    results = []
+    for single_function, batch_function, single_ids, batch_ids in [
+        (
+            query.cpt_measurements_for_one_nzgd,
+            query.cpt_measurements_for_nzgd_ids,
+            single_cpt_ids,
+            batch_cpt_ids,
+        ),
+        (
+            query.spt_measurements_for_one_nzgd,
+            query.spt_measurements_for_nzgd_ids,
+            single_spt_ids,
+            batch_spt_ids,
+        ),
+        (
+            query.spt_soil_types_for_one_nzgd,
+            query.spt_soil_types_for_nzgd_ids,
+            single_spt_ids,
+            batch_spt_ids,
+        ),
+        (
+            query.cpt_vs30s_for_one_nzgd_id,
+            query.cpt_vs30s_for_nzgd_ids,
+            single_cpt_ids,
+            batch_cpt_ids,
+        ),
+        (
+            query.spt_vs30s_for_one_nzgd_id,
+            query.spt_vs30s_for_nzgd_ids,
+            single_spt_ids,
+            batch_spt_ids,
+        ),
+        (
+            core.cpt_measurement_rows_for_one_nzgd,
+            core.cpt_measurement_rows_for_nzgd_ids,
+            single_cpt_ids,
+            batch_cpt_ids,
+        ),
+        (
+            core.spt_measurement_rows_for_one_nzgd,
+            core.spt_measurement_rows_for_nzgd_ids,
+            single_spt_ids,
+            batch_spt_ids,
+        ),
+    ]:
+        results.append(
+            _time_calls(
+                single_function.__name__,
+                "single_id",
+                [
+                    functools.partial(single_function, nzgd_id, conn)
+                    for nzgd_id in single_ids
+                ],
+                n_items=1,
+            )
+        )
+        results.append(
+            _time_calls(
+                batch_function.__name__,
+                f"batch_{len(batch_ids)}",
+                [functools.partial(batch_function, batch_ids, conn)] * n_repeats,
+                n_items=len(batch_ids),
+            )
+        )
+
+    results.append(
+        _time_calls(
+            query.get_westerhoff_model_gwl.__name__,
+            f"batch_{len(batch_cpt_ids)}",
+            [lambda: query.get_westerhoff_model_gwl(conn, batch_cpt_ids)] * n_repeats,
+            n_items=len(batch_cpt_ids),
+        )
+    )
+    results.append(
+        _time_calls(
+            query.iter_cpt_measurements.__name__,
+            "whole_database",
+            [lambda: query.iter_cpt_measurements(conn)] * n_repeats,
+        )
+    )
+
+    lookups = query.lookup_tables(conn)
+    selected_names = [next(iter(lookups[lookup])) for lookup in query.LOOKUP_TABLES]
+
+    def all_vs30s_call() -> pd.DataFrame:
+        """Runs all_vs30s_given_correlations with the first name of each lookup."""
+        return query.all_vs30s_given_correlations(*selected_names, conn)
+
+    all_vs30s_result = _time_calls(
+        query.all_vs30s_given_correlations.__name__,
+        "first_combination",
+        [all_vs30s_call] * n_repeats,
+    )
+    all_vs30s_result["peak_memory_bytes"] = _peak_memory(all_vs30s_call)
+    results.append(all_vs30s_result)
+
+    results.append(
+        _time_calls(
+            query.filtered_vs30s.__name__,
+            "first_combination",
+            [lambda: query.filtered_vs30s(*selected_names, conn)] * n_repeats,
+        )
+    )
+    batch_filters = query.Vs30Filters(nzgd_ids=batch_cpt_ids + batch_spt_ids)
+    results.append(
+        _time_calls(
+            query.filtered_vs30s.__name__,
+            f"first_combination_batch_{len(batch_filters.nzgd_ids)}",
+            [lambda: query.filtered_vs30s(*selected_names, conn, filters=batch_filters)]
+            * n_repeats,
+            n_items=len(batch_filters.nzgd_ids),
+        )
+    )
+    results.append(
+        _time_calls(
+            query.vs30_residual_statistics.__name__,
+            "first_combination_by_region",
+            [lambda: query.vs30_residual_statistics(*selected_names, conn)] * n_repeats,
+        )
+    )
+    results.append(
+        _time_calls(
+            query.vs30s_for_correlation_combinations.__name__,
+            "all_combinations",
+            [
+                lambda: query.vs30s_for_correlation_combinations(
+                    None, None, None, None, conn
+                )
+            ]
+            * n_repeats,
+        )
+    )
+
+    results.append(
+        _time_calls(
+            query.record_details.__name__,
+            "single_id",
+            [
+                functools.partial(query.record_details, nzgd_id, conn)
+                for nzgd_id in single_cpt_ids + single_spt_ids
+            ],
+            n_items=1,
+        )
+    )
+    results.append(
+        _time_calls(
+            query.record_details.__name__,
+            f"batch_{len(batch_filters.nzgd_ids)}_with_measurements",
+            [
+                functools.partial(
+                    query.record_details,
+                    batch_filters.nzgd_ids,
+                    conn,
+                    include_measurements=True,
+                    include_soil_types=True,
+                )
+            ]
+            * n_repeats,
+            n_items=len(batch_filters.nzgd_ids),
+        )
+    )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the sqlite_tools query functions against a synthetic "
+        "NZGD-shaped database, and write the results as JSON."
+    )
+    parser.add_argument(
+        "--db-path",
+        type=Path,
+        help="Path to an existing database to benchmark against. If not given, a "
+        "synthetic database is created in a temporary directory.",
+    )
+    parser.add_argument("--n-records", type=int, default=10_000)
+    parser.add_argument("--mean-cpt-measurements", type=int, default=500)
+    parser.add_argument("--n-single-calls", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--n-repeats", type=int, default=3)
+    parser.add_argument(
+        "--imports-only",
+        action="store_true",
+        help="Only benchmark the import times, without a database.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Path to write the JSON results to (default stdout).",
+    )
+    args = parser.parse_args()
+
+    benchmark_results = run_import_benchmarks()
+    if not args.imports_only:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = args.db_path
+            if db_path is None:
+                db_path = synthetic.create_synthetic_database(
+                    Path(temp_dir) / "synthetic_nzgd.db",
+                    n_records=args.n_records,
+                    mean_cpt_measurements=args.mean_cpt_measurements,
+                )
+            with contextlib.closing(sqlite3.connect(db_path)) as conn:
+                benchmark_results += run_benchmarks(
+                    conn,
+                    n_single_calls=args.n_single_calls,
+                    batch_size=args.batch_size,
+                    n_repeats=args.n_repeats,
+                )
+
+    output = {
+        "python_version": platform.python_version(),
+        "sqlite_version": sqlite3.sqlite_version,
+        "pandas_version": pd.__version__,
+        "db_path": str(args.db_path) if args.db_path else None,
+        "n_records": None if args.db_path else args.n_records,
+        "results": benchmark_results,
+    }
+    output_json = json.dumps(output, indent=2)
+    if args.output:
+        args.output.write_text(output_json)
+    else:
+        print(output_json)
+
+    heavy_imports = {
+        benchmark_result["function"]: benchmark_result["imported_heavy_modules"]
+        for benchmark_result in benchmark_results
+        if benchmark_result.get("imported_heavy_modules")
+    }
+    if heavy_imports:
+        sys.exit(
+            "Importing these modules also imported heavy dependencies: "
+            + ", ".join(
+                f"{module} ({', '.join(modules)})"
+                for module, modules in heavy_imports.items()
+            )
+        )
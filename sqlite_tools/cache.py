@@ -0,0 +1,263 @@
+"""
+An opt-in in-memory cache of the per-record query results.
+
+Web app users often open the same popular records, and every time the per-record query
+functions re-query the database and rebuild the DataFrame. RecordCache keeps the most
+recently used results in memory, bounded by both the number of entries and their total
+size, and drops the results of a database file as soon as the file changes.
+
+Examples
+--------
+>>> record_cache = RecordCache(max_entries=1000)
+>>> cpt_measurements_for_one_nzgd = record_cache.wrap(query.cpt_measurements_for_one_nzgd)
+>>> cpt_df = cpt_measurements_for_one_nzgd(1, conn)  # queries the database
+>>> cpt_df = cpt_measurements_for_one_nzgd(1, conn)  # served from the cache
+>>> record_cache.stats()
+CacheStats(hits=1, misses=1, evictions=0, invalidations=0, n_entries=1, n_bytes=...)
+"""
+
+from __future__ import annotations
+
+import functools
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+import pandas as pd
+
+from sqlite_tools import core, query
+from sqlite_tools.connection import ConnectionPool, as_connection
+
+# With copy-on-write (always enabled from pandas 3.0), a shallow copy is enough to stop
+# changes to a returned DataFrame from reaching the cached DataFrame
+_COPY_ON_WRITE = int(pd.__version__.split(".", 1)[0]) >= 3
+
+# The default maximum total size of the cached DataFrames
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class CacheStats(NamedTuple):
+    """The statistics of a RecordCache."""
+
+    hits: int
+    """The number of calls served from the cache."""
+    misses: int
+    """The number of calls that queried the database."""
+    evictions: int
+    """The number of entries removed to stay within the size limits."""
+    invalidations: int
+    """The number of entries removed because their database file changed."""
+    n_entries: int
+    """The number of cached entries."""
+    n_bytes: int
+    """The total size of the cached DataFrames in bytes."""
+
+
+class _CacheEntry(NamedTuple):
+    """A cached DataFrame and the version of the database file it was read from."""
+
+    version: tuple[int, int, int, int]
+    data: pd.DataFrame
+    n_bytes: int
+
+
+class RecordCache:
+    """
+    A least recently used cache of the results of the per-record query functions.
+
+    Results are keyed by the function, its arguments and the database file. Each
+    returned DataFrame is a copy, so changing it does not change the cached result.
+    In-memory databases are never cached.
+
+    The cache is invalidated when the database file changes, which is detected from
+    the modification time and size of the file and of its write-ahead log, so commits
+    by any connection are detected, including commits that are not yet checkpointed.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        The maximum number of cached results. Default is 1024.
+    max_bytes : int, optional
+        The maximum total size of the cached DataFrames in bytes, as measured by
+        DataFrame.memory_usage(deep=True). Results larger than this are not cached.
+        Default is 256 MiB.
+    """
+
+    def __init__(
+        self, max_entries: int = 1024, max_bytes: int = DEFAULT_MAX_BYTES
+    ) -> None:
+        """Creates an empty cache."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, _CacheEntry] = OrderedDict()
+        self._n_bytes = 0
+        # The version of each database file when it was last checked, keyed by its path
+        self._file_versions: dict[str, tuple[int, int, int, int]] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def _check_database(self, db_path: str) -> tuple[int, int, int, int]:
+        """
+        Gets the version of a database file, invalidating its entries if it changed.
+
+        Parameters
+        ----------
+        db_path : str
+            The path of the database file.
+
+        Returns
+        -------
+        tuple[int, int, int, int]
+            The version of the file, from core.database_version.
+        """
+        version = core.database_version(db_path)
+
+        with self._lock:
+            if self._file_versions.get(db_path, version) != version:
+                self._invalidate(db_path)
+            self._file_versions[db_path] = version
+
+        return version
+
+    def _invalidate(self, db_path: str) -> None:
+        """
+        Removes the entries of a database file. The lock must be held by the caller.
+
+        Parameters
+        ----------
+        db_path : str
+            The path of the database file.
+        """
+        stale_keys = [key for key in self._entries if key[0] == db_path]
+        for key in stale_keys:
+            self._n_bytes -= self._entries.pop(key).n_bytes
+        self._invalidations += len(stale_keys)
+
+    def call(
+        self,
+        function: Callable[..., pd.DataFrame],
+        selected_nzgd_id: int,
+        conn: sqlite3.Connection | ConnectionPool,
+        **kwargs: Any,
+    ) -> pd.DataFrame:
+        """
+        Calls a per-record query function, using the cached result if available.
+
+        Parameters
+        ----------
+        function : Callable[..., pd.DataFrame]
+            A function that takes an NZGD ID and a connection, such as
+            query.cpt_measurements_for_one_nzgd.
+        selected_nzgd_id : int
+            The selected NZGD ID.
+        conn : sqlite3.Connection or ConnectionPool
+            The SQLite database connection, or a pool to take a connection from.
+        **kwargs : Any
+            Other keyword arguments of the function, which are part of the cache key.
+
+        Returns
+        -------
+        pd.DataFrame
+            A copy of the result of the function.
+        """
+        conn = as_connection(conn)
+        db_path = query.database_path(conn)
+        if not db_path:
+            return function(selected_nzgd_id, conn, **kwargs)
+
+        version = self._check_database(db_path)
+        key = (
+            db_path,
+            function.__module__,
+            function.__qualname__,
+            int(selected_nzgd_id),
+            tuple(sorted(kwargs.items())),
+        )
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry.data.copy(deep=not _COPY_ON_WRITE)
+            self._misses += 1
+
+        data = function(selected_nzgd_id, conn, **kwargs)
+        n_bytes = int(data.memory_usage(deep=True).sum())
+        if n_bytes > self.max_bytes:
+            return data
+
+        with self._lock:
+            previous_entry = self._entries.pop(key, None)
+            if previous_entry is not None:
+                self._n_bytes -= previous_entry.n_bytes
+            self._entries[key] = _CacheEntry(version, data, n_bytes)
+            self._n_bytes += n_bytes
+            while (
+                len(self._entries) > self.max_entries or self._n_bytes > self.max_bytes
+            ):
+                _, evicted_entry = self._entries.popitem(last=False)
+                self._n_bytes -= evicted_entry.n_bytes
+                self._evictions += 1
+
+        return data.copy(deep=not _COPY_ON_WRITE)
+
+    def wrap(
+        self, function: Callable[..., pd.DataFrame]
+    ) -> Callable[..., pd.DataFrame]:
+        """
+        Wraps a per-record query function so that its results are cached.
+
+        Parameters
+        ----------
+        function : Callable[..., pd.DataFrame]
+            A function that takes an NZGD ID and a connection, such as
+            query.spt_soil_types_for_one_nzgd.
+
+        Returns
+        -------
+        Callable[..., pd.DataFrame]
+            A function with the same arguments, which uses this cache.
+        """
+
+        @functools.wraps(function)
+        def cached_function(
+            selected_nzgd_id: int,
+            conn: sqlite3.Connection | ConnectionPool,
+            **kwargs: Any,
+        ) -> pd.DataFrame:
+            """Calls the wrapped function through the cache."""
+            return self.call(function, selected_nzgd_id, conn, **kwargs)
+
+        return cached_function
+
+    def stats(self) -> CacheStats:
+        """
+        Gets the hit, miss and size statistics of the cache.
+
+        Returns
+        -------
+        CacheStats
+            The statistics since the cache was created.
+        """
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+                n_entries=len(self._entries),
+                n_bytes=self._n_bytes,
+            )
+
+    def clear(self) -> None:
+        """Removes every cached entry. The statistics are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._n_bytes = 0
+            self._file_versions.clear()
@@ -0,0 +1,177 @@
+"""
+Read-only connections to the NZGD SQLite database, tuned for querying.
+
+The database is only ever read by sqlite_tools, so connections are opened read-only
+with PRAGMAs that speed up reads: memory-mapped I/O, a larger page cache and in-memory
+temporary storage. ConnectionPool hands out one such connection per thread, so that
+multithreaded web servers can serve concurrent requests without sharing a connection
+or reopening the database file for every request.
+
+All of the public functions in sqlite_tools.query accept either a sqlite3.Connection
+or a ConnectionPool.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+
+# The default PRAGMA values. mmap_size is in bytes, and a negative cache_size
+# is in KiB rather than pages.
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_SIZE_KIB = 64 * 1024
+
+
+def connect_read_only(
+    db_path: Path,
+    immutable: bool = False,
+    mmap_size: int = DEFAULT_MMAP_SIZE,
+    cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB,
+    check_same_thread: bool = True,
+) -> sqlite3.Connection:
+    """
+    Opens a read-only connection to a database file, with PRAGMAs tuned for reading.
+
+    Parameters
+    ----------
+    db_path : Path
+        The path of the database file.
+    immutable : bool, optional
+        If True, SQLite assumes the file cannot change while it is open, so it skips
+        all file locking and change detection. Only use this if nothing writes to the
+        file while it is open. Default is False.
+    mmap_size : int, optional
+        The maximum number of bytes of the file to access with memory-mapped I/O.
+        Default is 256 MiB.
+    cache_size_kib : int, optional
+        The size of the page cache in KiB. Default is 64 MiB.
+    check_same_thread : bool, optional
+        If True (default), the connection can only be used by the thread that created it.
+
+    Returns
+    -------
+    sqlite3.Connection
+        The read-only connection.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the database file does not exist.
+    """
+    db_path = Path(db_path).resolve()
+    if not db_path.is_file():
+        # Without this check, SQLite raises an unhelpful "unable to open database file"
+        raise FileNotFoundError(f"Database file not found: {db_path}")
+
+    uri = f"{db_path.as_uri()}?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=check_same_thread)
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    conn.execute(f"PRAGMA cache_size = {-int(cache_size_kib)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA query_only = 1")
+
+    return conn
+
+
+class ConnectionPool:
+    """
+    A pool of read-only connections to a database file, with one connection per thread.
+
+    Each thread gets its own connection the first time it asks for one, and then gets
+    the same connection on every later call. The pool can be passed to any of the
+    public functions in sqlite_tools.query in place of a connection.
+
+    Parameters
+    ----------
+    db_path : Path
+        The path of the database file.
+    immutable : bool, optional
+        If True, the connections are opened with immutable=1. See connect_read_only.
+        Default is False.
+    mmap_size : int, optional
+        The mmap_size of each connection in bytes. Default is 256 MiB.
+    cache_size_kib : int, optional
+        The page cache size of each connection in KiB. Default is 64 MiB.
+
+    Examples
+    --------
+    >>> pool = ConnectionPool("nzgd.db")
+    >>> cpt_df = query.cpt_measurements_for_one_nzgd(1, pool)
+    >>> pool.close()
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        immutable: bool = False,
+        mmap_size: int = DEFAULT_MMAP_SIZE,
+        cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB,
+    ) -> None:
+        """Creates the pool. Connections are only opened when they are first used."""
+        self.db_path = Path(db_path)
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Gets the connection of the calling thread, opening it if needed.
+
+        Returns
+        -------
+        sqlite3.Connection
+            The calling thread's read-only connection.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread is disabled so that close can close the connections
+            # of every thread. Each connection is still only used by its own thread.
+            conn = connect_read_only(
+                self.db_path,
+                immutable=self.immutable,
+                mmap_size=self.mmap_size,
+                cache_size_kib=self.cache_size_kib,
+                check_same_thread=False,
+            )
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """
+        Closes the connections of every thread.
+
+        Threads that use the pool after it is closed open new connections.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
+
+def as_connection(conn: sqlite3.Connection | ConnectionPool) -> sqlite3.Connection:
+    """
+    Gets a connection from either a connection or a pool.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection or ConnectionPool
+        A connection, or a pool to take the calling thread's connection from.
+
+    Returns
+    -------
+    sqlite3.Connection
+        The connection.
+    """
+    if isinstance(conn, ConnectionPool):
+        return conn.connection()
+    return conn
@@ -0,0 +1,729 @@
+"""
+The import-light core of sqlite_tools, which returns query results as plain tuples.
+
+Importing pandas and numpy takes several times longer than a query for a single record,
+so it dominates the run time of short-lived command line tools and workers. This module
+only uses the standard library, and returns the rows of each query as tuples straight
+from sqlite3, with the names of their columns:
+
+>>> rows = core.cpt_measurement_rows_for_one_nzgd(1, conn)
+>>> rows.columns
+('depth', 'qc', 'fs', 'u2', 'cpt_id', 'nzgd_id')
+>>> core.lookup_id(conn, "hammer_type", "Auto")
+
+The DataFrame-returning functions of sqlite_tools.query run the same SQL, and add the
+derived columns. sqlite_tools.query only imports pandas and numpy the first time one of
+them is used, so importing it to call lookup_id or the functions of this module stays
+fast. The functions of this module are not instrumented.
+"""
+
+from __future__ import annotations
+
+import importlib
+import os
+import sqlite3
+from collections.abc import Iterable, Iterator
+from types import ModuleType
+from typing import Any, NamedTuple
+
+from sqlite_tools.connection import ConnectionPool, as_connection
+
+# The maximum number of bound parameters used in a single SQL statement. Older SQLite
+# builds (before 3.32.0) have a default SQLITE_MAX_VARIABLE_NUMBER of 999, so stay
+# comfortably below that regardless of the SQLite version Python was built against.
+MAX_SQL_VARIABLES = 900
+
+
+class LazyModule:
+    """
+    A module that is only imported when one of its attributes is first used.
+
+    Parameters
+    ----------
+    name : str
+        The name of the module, such as "pandas".
+    """
+
+    def __init__(self, name: str) -> None:
+        """Stores the name of the module without importing it."""
+        self._name = name
+        self._module: ModuleType | None = None
+
+    def __getattr__(self, attribute: str) -> Any:
+        """Imports the module if needed, and gets one of its attributes."""
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    def __repr__(self) -> str:
+        """Shows the name of the module and whether it has been imported."""
+        state = "imported" if self._module is not None else "not imported"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+
+class Rows(NamedTuple):
+    """The result of a query as plain tuples."""
+
+    columns: tuple[str, ...]
+    """The names of the columns."""
+    rows: list[tuple[Any, ...]]
+    """The rows, with a value per column."""
+
+
+def normalise_nzgd_ids(nzgd_ids: Iterable[int]) -> list[int]:
+    """
+    Converts an iterable of NZGD IDs into a list of unique Python ints.
+
+    The order of first appearance is preserved. Python ints are required because
+    sqlite3 cannot bind NumPy integer types as query parameters.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The NZGD IDs. Can be any iterable, such as a list, a NumPy array or a pd.Series.
+
+    Returns
+    -------
+    list[int]
+        The unique NZGD IDs as Python ints.
+    """
+    return list(dict.fromkeys(int(nzgd_id) for nzgd_id in nzgd_ids))
+
+
+def chunks(values: list[int], chunk_size: int) -> Iterator[list[int]]:
+    """
+    Splits a list into consecutive chunks of at most chunk_size elements.
+
+    Parameters
+    ----------
+    values : list[int]
+        The values to split.
+    chunk_size : int
+        The maximum number of values per chunk.
+
+    Yields
+    ------
+    list[int]
+        The next chunk of values.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, but got {chunk_size}")
+    for start in range(0, len(values), chunk_size):
+        yield values[start : start + chunk_size]
+
+
+def fetch_rows(
+    sql: str,
+    conn: sqlite3.Connection | ConnectionPool,
+    params: Iterable[Any] | None = None,
+) -> Rows:
+    """
+    Runs a SQL query and gets its rows as tuples.
+
+    Parameters
+    ----------
+    sql : str
+        The SQL query.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    params : Iterable[Any] or None, optional
+        The bind parameters of the query. Default is None.
+
+    Returns
+    -------
+    Rows
+        The names of the columns and the rows of the result.
+    """
+    conn = as_connection(conn)
+    cursor = conn.execute(sql, tuple(params or ()))
+    rows = cursor.fetchall()
+    return Rows(tuple(description[0] for description in cursor.description), rows)
+
+
+def fetch_rows_for_nzgd_ids(
+    query_template: str,
+    nzgd_ids: Iterable[int],
+    conn: sqlite3.Connection | ConnectionPool,
+    id_column: str = "nzgd_id",
+    chunk_size: int = MAX_SQL_VARIABLES,
+) -> Rows:
+    """
+    Runs a query for many NZGD IDs using chunked IN (...) lists, and gets its rows.
+
+    The query is run once per chunk of at most chunk_size IDs, so the number of bound
+    parameters always stays below SQLite's variable limit. The rows are ordered to
+    follow the order of nzgd_ids, with the row order that the query gives within each
+    ID preserved.
+
+    Parameters
+    ----------
+    query_template : str
+        The SQL query, containing a "{placeholders}" field where the comma-separated
+        "?" placeholders of the IN (...) list will be inserted.
+    nzgd_ids : Iterable[int]
+        The NZGD IDs to query. Duplicate IDs are only queried once.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    id_column : str, optional
+        The name of the column in the query result that contains the NZGD ID.
+        Default is "nzgd_id".
+    chunk_size : int, optional
+        The maximum number of IDs per query. Default is MAX_SQL_VARIABLES.
+
+    Returns
+    -------
+    Rows
+        The names of the columns and the concatenated rows of every chunk.
+    """
+    conn = as_connection(conn)
+    unique_ids = normalise_nzgd_ids(nzgd_ids)
+    if not unique_ids:
+        # Run the query with an empty IN list to get the names of the columns
+        return fetch_rows(query_template.format(placeholders=""), conn)
+
+    columns: tuple[str, ...] = ()
+    rows: list[tuple[Any, ...]] = []
+    for chunk in chunks(unique_ids, chunk_size):
+        placeholders = ",".join("?" * len(chunk))
+        chunk_rows = fetch_rows(
+            query_template.format(placeholders=placeholders), conn, chunk
+        )
+        columns = chunk_rows.columns
+        # sort is stable, so the query's own row order is kept within each ID
+        id_index = columns.index(id_column)
+        id_position = {nzgd_id: position for position, nzgd_id in enumerate(chunk)}
+        rows.extend(sorted(chunk_rows.rows, key=lambda row: id_position[row[id_index]]))
+    return Rows(columns, rows)
+
+
+# The small tables that map the names of the correlations and hammer types to their ids.
+# The keys are the names used with lookup_id, and the values are the table name and the
+# name of its id column.
+LOOKUP_TABLES = {
+    "vs_to_vs30_correlation": ("vstovs30correlation", "vs_to_vs30_correlation_id"),
+    "cpt_to_vs_correlation": ("cpttovscorrelation", "cpt_to_vs_correlation_id"),
+    "spt_to_vs_correlation": ("spttovscorrelation", "correlation_id"),
+    "hammer_type": ("spttovs30hammertype", "hammer_id"),
+}
+
+# Cache of the lookup tables, keyed by the path of the database file
+_lookup_cache: dict[str, dict[str, dict[str, int]]] = {}
+
+
+def database_path(conn: sqlite3.Connection | ConnectionPool) -> str:
+    """
+    Gets the absolute path of the main database file of a connection.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    str
+        The path of the database file, or an empty string for in-memory
+        and temporary databases.
+    """
+    conn = as_connection(conn)
+    for _, name, file_path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return file_path or ""
+    return ""
+
+
+def database_version(db_path: str) -> tuple[int, int, int, int]:
+    """
+    Gets the version of a database file, including the changes in its write-ahead log.
+
+    In WAL mode, commits are only written to the database file when the write-ahead log
+    is checkpointed, so the log is included to detect every commit. The version can be
+    compared between connections and processes.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database file.
+
+    Returns
+    -------
+    tuple[int, int, int, int]
+        The size and modification time in nanoseconds of the database file, followed
+        by those of its write-ahead log. They are 0 for the write-ahead log if it does
+        not exist or is empty, as an empty log holds no changes.
+    """
+    file_stat = os.stat(db_path)
+    try:
+        wal_stat = os.stat(f"{db_path}-wal")
+    except FileNotFoundError:
+        wal_stat = None
+    if wal_stat is None or wal_stat.st_size == 0:
+        wal_version = (0, 0)
+    else:
+        wal_version = (wal_stat.st_size, wal_stat.st_mtime_ns)
+    return (file_stat.st_size, file_stat.st_mtime_ns, *wal_version)
+
+
+def lookup_tables(
+    conn: sqlite3.Connection | ConnectionPool,
+) -> dict[str, dict[str, int]]:
+    """
+    Gets the mappings from names to ids of the correlations and hammer types.
+
+    The tables are only read from the database the first time this is called for a
+    database file, and are then served from a cache until clear_lookup_cache is called.
+    In-memory databases are not cached.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    dict[str, dict[str, int]]
+        A dictionary with the keys of LOOKUP_TABLES, where each value is a dictionary
+        mapping the names in that table to their ids.
+    """
+    conn = as_connection(conn)
+    db_path = database_path(conn)
+    if db_path in _lookup_cache:
+        return _lookup_cache[db_path]
+
+    tables = {}
+    for lookup, (table_name, id_column) in LOOKUP_TABLES.items():
+        rows = conn.execute(f"SELECT name, {id_column} FROM {table_name}").fetchall()
+        tables[lookup] = {name: int(id_value) for name, id_value in rows}
+
+    if db_path:
+        _lookup_cache[db_path] = tables
+
+    return tables
+
+
+def lookup_id(conn: sqlite3.Connection | ConnectionPool, lookup: str, name: str) -> int:
+    """
+    Gets the id of a correlation or hammer type from its name.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    lookup : str
+        The kind of name to look up. One of "vs_to_vs30_correlation",
+        "cpt_to_vs_correlation", "spt_to_vs_correlation" and "hammer_type".
+    name : str
+        The name to look up, such as "boore_2004" or "Auto".
+
+    Returns
+    -------
+    int
+        The id of the name.
+
+    Raises
+    ------
+    ValueError
+        If the name is not in the database. The error message lists the valid names.
+    """
+    conn = as_connection(conn)
+    if lookup not in LOOKUP_TABLES:
+        raise ValueError(
+            f"Unknown lookup {lookup!r}. Valid lookups are: {', '.join(LOOKUP_TABLES)}"
+        )
+
+    name_to_id = lookup_tables(conn)[lookup]
+    try:
+        return name_to_id[name]
+    except KeyError:
+        raise ValueError(
+            f"Invalid {lookup} {name!r}. "
+            f"Valid options are: {', '.join(sorted(name_to_id))}"
+        ) from None
+
+
+def clear_lookup_cache(conn: sqlite3.Connection | ConnectionPool | None = None) -> None:
+    """
+    Clears the cached correlation and hammer type lookup tables.
+
+    This only needs to be called if the lookup tables in a database file have changed
+    while the program is running.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection, ConnectionPool or None, optional
+        If given, only the cache for the database file of this connection is cleared.
+        If None (default), the whole cache is cleared.
+    """
+    if conn is None:
+        _lookup_cache.clear()
+    else:
+        _lookup_cache.pop(database_path(conn), None)
+
+
+# The queries for the CPT and SPT measurements of one NZGD record, and of many NZGD
+# records with a "{placeholders}" field for the IN (...) list of NZGD IDs
+CPT_MEASUREMENTS_QUERY = """SELECT 
+    cptmeasurements.depth,
+    cptmeasurements.qc,
+    cptmeasurements.fs,
+    cptmeasurements.u2,
+    cptmeasurements.cpt_id,
+    cptreport.nzgd_id
+    FROM cptmeasurements
+    JOIN cptreport ON cptmeasurements.cpt_id = cptreport.cpt_id
+    WHERE cptreport.nzgd_id = ?
+    ORDER BY cptmeasurements.depth ASC;"""
+
+CPT_MEASUREMENTS_FOR_NZGD_IDS_QUERY = """SELECT 
+    cptmeasurements.depth,
+    cptmeasurements.qc,
+    cptmeasurements.fs,
+    cptmeasurements.u2,
+    cptmeasurements.cpt_id,
+    cptreport.nzgd_id
+    FROM cptmeasurements
+    JOIN cptreport ON cptmeasurements.cpt_id = cptreport.cpt_id
+    WHERE cptreport.nzgd_id IN ({placeholders})
+    ORDER BY cptreport.nzgd_id ASC, cptmeasurements.depth ASC;"""
+
+# The CPT measurements of the whole database, ordered so that the measurements of each
+# sounding are consecutive
+ALL_CPT_MEASUREMENTS_QUERY = """SELECT 
+    cptmeasurements.depth,
+    cptmeasurements.qc,
+    cptmeasurements.fs,
+    cptmeasurements.u2,
+    cptmeasurements.cpt_id,
+    cptreport.nzgd_id
+    FROM cptmeasurements
+    JOIN cptreport ON cptmeasurements.cpt_id = cptreport.cpt_id
+    ORDER BY cptmeasurements.cpt_id ASC, cptmeasurements.depth ASC;"""
+
+SPT_MEASUREMENTS_QUERY = """SELECT 
+    sptmeasurements.depth,
+    sptmeasurements.n,
+    sptmeasurements.borehole_id AS nzgd_id
+    FROM sptmeasurements
+    WHERE sptmeasurements.borehole_id = ?
+    ORDER BY sptmeasurements.depth ASC;"""
+
+SPT_MEASUREMENTS_FOR_NZGD_IDS_QUERY = """SELECT 
+    sptmeasurements.depth,
+    sptmeasurements.n,
+    sptmeasurements.borehole_id AS nzgd_id
+    FROM sptmeasurements
+    WHERE sptmeasurements.borehole_id IN ({placeholders})
+    ORDER BY sptmeasurements.borehole_id ASC, sptmeasurements.depth ASC;"""
+
+
+# The query for the soil layers of SPT boreholes. The soil types of each layer are
+# concatenated with GROUP_CONCAT and the layer thicknesses are calculated with the LEAD
+# window function, so all of the per-layer work is done by SQLite in a single pass.
+# The top depths are rounded to 4 decimals to avoid floating point precision issues
+# when grouping the soil types of a layer.
+SPT_SOIL_TYPES_QUERY = """
+WITH soil_types AS (
+    SELECT
+        sptreport.borehole_id,
+        sptreport.nzgd_id,
+        ROUND(soilmeasurements.top_depth, 4) AS top_depth,
+        soiltypes.name AS soil_type
+    FROM sptreport
+    JOIN soilmeasurements ON soilmeasurements.report_id = sptreport.borehole_id
+    JOIN soilmeasurementsoiltype ON soilmeasurementsoiltype.soil_measurement_id = soilmeasurements.measurement_id
+    JOIN soiltypes ON soilmeasurementsoiltype.soil_type_id = soiltypes.id
+    WHERE sptreport.borehole_id IN ({placeholders})
+    ORDER BY sptreport.borehole_id ASC, soilmeasurements.top_depth ASC
+), soil_layers AS (
+    SELECT borehole_id, nzgd_id, top_depth, GROUP_CONCAT(soil_type, ' + ') AS soil_type
+    FROM soil_types
+    GROUP BY borehole_id, top_depth
+)
+SELECT
+    top_depth,
+    nzgd_id,
+    soil_type,
+    LEAD(top_depth) OVER (PARTITION BY borehole_id ORDER BY top_depth) - top_depth AS layer_thickness
+FROM soil_layers
+ORDER BY borehole_id ASC, top_depth ASC;"""
+
+
+# The SELECT and JOIN parts of the queries for the pre-computed Vs30 values of individual records.
+# The WHERE clause is added by each function that uses them. The depth extents of SPT
+# boreholes are not stored in sptreport, so they are calculated with correlated subqueries,
+# which are index lookups on sptmeasurements(borehole_id, depth) rather than a second
+# query that extracts all of the measurements.
+CPT_VS30_QUERY = """SELECT 
+    cptvs30estimates.cpt_id,
+    cptvs30estimates.nzgd_id,
+    cptvs30estimates.vs30,
+    cptvs30estimates.vs30_stddev, 
+    cptreport.cpt_file,
+    cptreport.tip_net_area_ratio,
+    cptreport.measured_gwl,
+    cptreport.deepest_depth,
+    cptreport.shallowest_depth,   
+    cpttovscorrelation.name AS cpt_to_vs_correlation,
+    vstovs30correlation.name AS vs_to_vs30_correlation,
+    nzgdrecord.type_prefix,    
+    nzgdrecord.original_reference,
+    nzgdrecord.investigation_date,
+    nzgdrecord.published_date,
+    nzgdrecord.latitude,
+    nzgdrecord.longitude,
+    nzgdrecord.model_vs30_foster_2019,
+    nzgdrecord.model_vs30_stddev_foster_2019,
+    nzgdrecord.model_gwl_westerhoff_2019,
+    region.name AS region,
+    district.name AS district,
+    city.name AS city,
+    suburb.name AS suburb
+    FROM cptvs30estimates
+    JOIN cpttovscorrelation 
+      ON cptvs30estimates.cpt_to_vs_correlation_id = cpttovscorrelation.cpt_to_vs_correlation_id
+    JOIN vstovs30correlation 
+      ON cptvs30estimates.vs_to_vs30_correlation_id = vstovs30correlation.vs_to_vs30_correlation_id
+    JOIN cptreport
+      ON cptvs30estimates.cpt_id = cptreport.cpt_id
+    JOIN nzgdrecord
+      ON cptvs30estimates.nzgd_id = nzgdrecord.nzgd_id
+    JOIN region
+        ON nzgdrecord.region_id = region.region_id
+    JOIN district
+        ON nzgdrecord.district_id = district.district_id
+    JOIN suburb
+        ON nzgdrecord.suburb_id = suburb.suburb_id
+    JOIN city
+        ON nzgdrecord.city_id = city.city_id"""
+
+SPT_VS30_QUERY = """SELECT
+    sptvs30estimates.spt_id,
+    sptvs30estimates.borehole_diameter AS spt_borehole_diameter_for_vs30_calculation,
+    sptvs30estimates.vs30,    
+    sptvs30estimates.vs30_stddev,
+    sptvs30estimates.vs30_used_efficiency AS spt_vs30_calculation_used_efficiency,
+    sptvs30estimates.vs30_used_soil_info AS spt_vs30_calculation_used_soil_info,
+    sptreport.borehole_file,
+    sptreport.efficiency as spt_efficiency,
+    sptreport.borehole_diameter as spt_borehole_diameter,
+    sptreport.measured_gwl,
+    spttovscorrelation.name AS spt_to_vs_correlation,
+    vstovs30correlation.name AS vs_to_vs30_correlation,
+    nzgdrecord.type_prefix,
+    nzgdrecord.original_reference,
+    nzgdrecord.investigation_date,
+    nzgdrecord.published_date,
+    nzgdrecord.latitude,
+    nzgdrecord.longitude,
+    nzgdrecord.model_vs30_foster_2019,
+    nzgdrecord.model_vs30_stddev_foster_2019,
+    nzgdrecord.model_gwl_westerhoff_2019,
+    spttovs30hammertype.name AS hammer_type,
+    region.name AS region,
+    district.name AS district,
+    city.name AS city,
+    suburb.name AS suburb,
+    (SELECT MAX(sptmeasurements.depth) FROM sptmeasurements
+      WHERE sptmeasurements.borehole_id = sptvs30estimates.spt_id) AS deepest_depth,
+    (SELECT MIN(sptmeasurements.depth) FROM sptmeasurements
+      WHERE sptmeasurements.borehole_id = sptvs30estimates.spt_id) AS shallowest_depth
+    FROM sptvs30estimates
+    JOIN spttovscorrelation
+      ON sptvs30estimates.spt_to_vs_correlation_id = spttovscorrelation.correlation_id
+    JOIN vstovs30correlation
+      ON sptvs30estimates.vs_to_vs30_correlation_id = vstovs30correlation.vs_to_vs30_correlation_id
+    JOIN sptreport
+      ON sptvs30estimates.spt_id = sptreport.borehole_id
+    JOIN spttovs30hammertype
+      ON sptvs30estimates.hammer_type_id = spttovs30hammertype.hammer_id
+    JOIN nzgdrecord
+      ON sptvs30estimates.spt_id = nzgdrecord.nzgd_id
+    JOIN region
+        ON nzgdrecord.region_id = region.region_id
+    JOIN district
+        ON nzgdrecord.district_id = district.district_id
+    JOIN suburb
+        ON nzgdrecord.suburb_id = suburb.suburb_id
+    JOIN city
+        ON nzgdrecord.city_id = city.city_id"""
+
+# The order of the Vs30 estimates within each NZGD ID, appended after the WHERE clause
+# of CPT_VS30_QUERY and SPT_VS30_QUERY. Without it, SQLite may return the estimates of
+# a record in a different order for a single NZGD ID and for many NZGD IDs.
+CPT_VS30_ORDER_BY = """
+    ORDER BY cptvs30estimates.nzgd_id, cptvs30estimates.cpt_id,
+      cptvs30estimates.cpt_to_vs_correlation_id,
+      cptvs30estimates.vs_to_vs30_correlation_id;"""
+
+SPT_VS30_ORDER_BY = """
+    ORDER BY sptvs30estimates.spt_id, sptvs30estimates.spt_to_vs_correlation_id,
+      sptvs30estimates.vs_to_vs30_correlation_id, sptvs30estimates.hammer_type_id;"""
+
+
+def cpt_measurement_rows_for_one_nzgd(
+    selected_nzgd_id: int, conn: sqlite3.Connection | ConnectionPool
+) -> Rows:
+    """
+    Extracts the CPT measurements of an NZGD record as tuples.
+
+    Parameters
+    ----------
+    selected_nzgd_id : int
+        The selected NZGD ID.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    Rows
+        The rows of query.cpt_measurements_for_one_nzgd.
+    """
+    return fetch_rows(CPT_MEASUREMENTS_QUERY, conn, (selected_nzgd_id,))
+
+
+def cpt_measurement_rows_for_nzgd_ids(
+    nzgd_ids: Iterable[int], conn: sqlite3.Connection | ConnectionPool
+) -> Rows:
+    """
+    Extracts the CPT measurements of many NZGD records as tuples.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    Rows
+        The rows of query.cpt_measurements_for_nzgd_ids, ordered by the given NZGD IDs
+        and then by depth.
+    """
+    return fetch_rows_for_nzgd_ids(CPT_MEASUREMENTS_FOR_NZGD_IDS_QUERY, nzgd_ids, conn)
+
+
+def spt_measurement_rows_for_one_nzgd(
+    selected_nzgd_id: int, conn: sqlite3.Connection | ConnectionPool
+) -> Rows:
+    """
+    Extracts the SPT measurements of an NZGD record as tuples.
+
+    Parameters
+    ----------
+    selected_nzgd_id : int
+        The selected NZGD ID.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    Rows
+        The rows of query.spt_measurements_for_one_nzgd.
+    """
+    return fetch_rows(SPT_MEASUREMENTS_QUERY, conn, (selected_nzgd_id,))
+
+
+def spt_measurement_rows_for_nzgd_ids(
+    nzgd_ids: Iterable[int], conn: sqlite3.Connection | ConnectionPool
+) -> Rows:
+    """
+    Extracts the SPT measurements of many NZGD records as tuples.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    Rows
+        The rows of query.spt_measurements_for_nzgd_ids, ordered by the given NZGD IDs
+        and then by depth.
+    """
+    return fetch_rows_for_nzgd_ids(SPT_MEASUREMENTS_FOR_NZGD_IDS_QUERY, nzgd_ids, conn)
+
+
+def spt_soil_type_rows_for_nzgd_ids(
+    nzgd_ids: Iterable[int], conn: sqlite3.Connection | ConnectionPool
+) -> Rows:
+    """
+    Extracts the soil layers of many SPT boreholes as tuples.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    Rows
+        The rows of query.spt_soil_types_for_nzgd_ids with format_layer_thickness set
+        to False, except that the layer thickness of the last layer of each borehole
+        is None. Ordered by the given NZGD IDs and then by depth.
+    """
+    return fetch_rows_for_nzgd_ids(SPT_SOIL_TYPES_QUERY, nzgd_ids, conn)
+
+
+def cpt_vs30_rows_for_nzgd_ids(
+    nzgd_ids: Iterable[int], conn: sqlite3.Connection | ConnectionPool
+) -> Rows:
+    """
+    Extracts the CPT Vs30 estimates of many NZGD records as tuples.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    Rows
+        The columns of CPT_VS30_QUERY, ordered by the given NZGD IDs. The derived
+        columns of query.cpt_vs30s_for_nzgd_ids, such as the residuals, are not included.
+    """
+    return fetch_rows_for_nzgd_ids(
+        CPT_VS30_QUERY
+        + """
+    WHERE cptvs30estimates.nzgd_id IN ({placeholders})"""
+        + CPT_VS30_ORDER_BY,
+        nzgd_ids,
+        conn,
+    )
+
+
+def spt_vs30_rows_for_nzgd_ids(
+    nzgd_ids: Iterable[int], conn: sqlite3.Connection | ConnectionPool
+) -> Rows:
+    """
+    Extracts the SPT Vs30 estimates of many NZGD records as tuples.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    Rows
+        The columns of SPT_VS30_QUERY, where spt_id is the NZGD ID, ordered by the
+        given NZGD IDs. The derived columns of query.spt_vs30s_for_nzgd_ids, such as
+        the residuals, are not included.
+    """
+    return fetch_rows_for_nzgd_ids(
+        SPT_VS30_QUERY
+        + """
+    WHERE sptvs30estimates.spt_id IN ({placeholders})"""
+        + SPT_VS30_ORDER_BY,
+        nzgd_ids,
+        conn,
+        id_column="spt_id",
+    )
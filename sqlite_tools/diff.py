@@ -0,0 +1,385 @@
+"""
+Finds the records that changed between two versions of the NZGD database.
+
+Each record is summarised by a content hash per table, computed in a single streaming
+pass over each table, so the tables are never loaded into memory. The hash of a record
+in a table combines a hash of every row of that table that belongs to the record, and
+does not depend on the order of the rows, so it only changes when the content of the
+record changes. Surrogate ids, such as measurement_id, vs30_id and cpt_id, can be
+renumbered between versions without any change to the data, so they are not hashed.
+Where a row refers to another row by its surrogate id, the natural key of the other row
+is hashed instead, such as the file name of a CPT or the name of a region or correlation.
+
+A record is in a version of the database if it has a row in nzgdrecord, so a record
+that is removed from nzgdrecord is reported as removed, even if some of its rows are
+left in the other tables.
+
+Comparing the hashes of two versions gives the NZGD IDs that were added, removed or
+modified, so caches and exports of the old version can be updated for those records
+only:
+
+>>> database_diff = diff_databases("nzgd_old.db", "nzgd_new.db")
+>>> database_diff.changed_nzgd_ids
+[12, 345, 6789]
+
+Compare two database files from the command line with
+
+    python -m sqlite_tools.diff /path/to/nzgd_old.db /path/to/nzgd_new.db
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from sqlite_tools.connection import ConnectionPool, as_connection, connect_read_only
+
+# The number of rows read from the database at a time
+FETCH_BATCH_SIZE = 10_000
+
+# Record hashes are sums of row hashes modulo 2**64
+_HASH_MASK = (1 << 64) - 1
+
+
+class _HashedTable(NamedTuple):
+    """How the rows of a table are assigned to records and hashed."""
+
+    table: str
+    """The name of the table."""
+    key: str
+    """The SQL expression of the NZGD ID that each row belongs to."""
+    joins: str = ""
+    """The joins needed for the key or the columns."""
+    columns: tuple[str, ...] | None = None
+    """The SQL expressions of the hashed columns. If None, every column of the table."""
+    excluded_columns: tuple[str, ...] = ()
+    """The surrogate id columns that are not hashed, when columns is None."""
+    joined_columns: tuple[str, ...] = ()
+    """
+    The SQL expressions of the natural keys of the rows that the excluded columns refer
+    to, which are hashed after the columns of the table, when columns is None.
+    """
+
+
+# The tables that are hashed, keyed by the name used in the results. SPT boreholes are
+# identified by their borehole_id, which is the NZGD ID, as in sqlite_tools.query.
+HASHED_TABLES = {
+    "nzgdrecord": _HashedTable(
+        "nzgdrecord",
+        "nzgdrecord.nzgd_id",
+        joins="LEFT JOIN region ON nzgdrecord.region_id = region.region_id "
+        "LEFT JOIN district ON nzgdrecord.district_id = district.district_id "
+        "LEFT JOIN city ON nzgdrecord.city_id = city.city_id "
+        "LEFT JOIN suburb ON nzgdrecord.suburb_id = suburb.suburb_id",
+        excluded_columns=("region_id", "district_id", "city_id", "suburb_id"),
+        joined_columns=("region.name", "district.name", "city.name", "suburb.name"),
+    ),
+    # The soundings of a record are identified by their cpt_file rather than cpt_id
+    "cptreport": _HashedTable(
+        "cptreport", "cptreport.nzgd_id", excluded_columns=("cpt_id",)
+    ),
+    "cptmeasurements": _HashedTable(
+        "cptmeasurements",
+        "cptreport.nzgd_id",
+        joins="JOIN cptreport ON cptmeasurements.cpt_id = cptreport.cpt_id",
+        excluded_columns=("measurement_id", "cpt_id"),
+        joined_columns=("cptreport.cpt_file",),
+    ),
+    "sptreport": _HashedTable("sptreport", "sptreport.borehole_id"),
+    "sptmeasurements": _HashedTable(
+        "sptmeasurements",
+        "sptmeasurements.borehole_id",
+        excluded_columns=("measurement_id",),
+    ),
+    "soilmeasurements": _HashedTable(
+        "soilmeasurements",
+        "soilmeasurements.report_id",
+        excluded_columns=("measurement_id",),
+    ),
+    # The soil types are linked to the soil measurements by their surrogate ids, so
+    # they are hashed by the depth of the measurement and the name of the soil type
+    "soiltypes": _HashedTable(
+        "soilmeasurementsoiltype",
+        "soilmeasurements.report_id",
+        joins="JOIN soilmeasurements "
+        "ON soilmeasurementsoiltype.soil_measurement_id = soilmeasurements.measurement_id "
+        "JOIN soiltypes ON soilmeasurementsoiltype.soil_type_id = soiltypes.id",
+        columns=("soilmeasurements.top_depth", "soiltypes.name"),
+    ),
+    "cptvs30estimates": _HashedTable(
+        "cptvs30estimates",
+        "cptvs30estimates.nzgd_id",
+        joins="LEFT JOIN cptreport ON cptvs30estimates.cpt_id = cptreport.cpt_id "
+        "LEFT JOIN cpttovscorrelation ON cptvs30estimates.cpt_to_vs_correlation_id "
+        "= cpttovscorrelation.cpt_to_vs_correlation_id "
+        "LEFT JOIN vstovs30correlation ON cptvs30estimates.vs_to_vs30_correlation_id "
+        "= vstovs30correlation.vs_to_vs30_correlation_id",
+        excluded_columns=(
+            "vs30_id",
+            "cpt_id",
+            "cpt_to_vs_correlation_id",
+            "vs_to_vs30_correlation_id",
+        ),
+        joined_columns=(
+            "cptreport.cpt_file",
+            "cpttovscorrelation.name",
+            "vstovs30correlation.name",
+        ),
+    ),
+    "sptvs30estimates": _HashedTable(
+        "sptvs30estimates",
+        "sptvs30estimates.spt_id",
+        joins="LEFT JOIN spttovscorrelation ON sptvs30estimates.spt_to_vs_correlation_id "
+        "= spttovscorrelation.correlation_id "
+        "LEFT JOIN vstovs30correlation ON sptvs30estimates.vs_to_vs30_correlation_id "
+        "= vstovs30correlation.vs_to_vs30_correlation_id "
+        "LEFT JOIN spttovs30hammertype ON sptvs30estimates.hammer_type_id "
+        "= spttovs30hammertype.hammer_id",
+        excluded_columns=(
+            "vs30_id",
+            "spt_to_vs_correlation_id",
+            "vs_to_vs30_correlation_id",
+            "hammer_type_id",
+        ),
+        joined_columns=(
+            "spttovscorrelation.name",
+            "vstovs30correlation.name",
+            "spttovs30hammertype.name",
+        ),
+    ),
+}
+
+
+class DatabaseDiff(NamedTuple):
+    """The records that changed between two versions of the NZGD database."""
+
+    added_nzgd_ids: list[int]
+    """The NZGD IDs that are only in the new version, in ascending order."""
+    removed_nzgd_ids: list[int]
+    """The NZGD IDs that are only in the old version, in ascending order."""
+    modified_nzgd_ids: list[int]
+    """The NZGD IDs whose content changed, in ascending order."""
+    modified_tables: dict[int, list[str]]
+    """The tables (from HASHED_TABLES) in which each modified record changed."""
+
+    @property
+    def changed_nzgd_ids(self) -> list[int]:
+        """The added, removed and modified NZGD IDs, in ascending order."""
+        return sorted(
+            self.added_nzgd_ids + self.removed_nzgd_ids + self.modified_nzgd_ids
+        )
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> list[str] | None:
+    """
+    Gets the names of the columns of a table.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    table : str
+        The name of the table.
+
+    Returns
+    -------
+    list[str] or None
+        The names of the columns, or None if the table does not exist.
+    """
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    return columns or None
+
+
+def _hash_table(conn: sqlite3.Connection, hashed_table: _HashedTable) -> pd.Series:
+    """
+    Computes the content hash of every record in a table, in a single streaming pass.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    hashed_table : _HashedTable
+        The table to hash.
+
+    Returns
+    -------
+    pd.Series
+        The hash of each record as uint64, indexed by NZGD ID.
+    """
+    columns = hashed_table.columns
+    if columns is None:
+        columns = (
+            *(
+                f"{hashed_table.table}.{column}"
+                for column in _table_columns(conn, hashed_table.table)
+                if column not in hashed_table.excluded_columns
+            ),
+            *hashed_table.joined_columns,
+        )
+
+    hashes: dict[int, int] = {}
+    cursor = conn.execute(
+        f"SELECT {hashed_table.key}, {', '.join(columns)} "
+        f"FROM {hashed_table.table} {hashed_table.joins}"
+    )
+    while rows := cursor.fetchmany(FETCH_BATCH_SIZE):
+        for nzgd_id, *values in rows:
+            # repr is exact for floats, and distinguishes NULL, integers, floats
+            # and strings, so any change to a value changes the row hash
+            row_hash = int.from_bytes(
+                hashlib.blake2b(repr(values).encode(), digest_size=8).digest(),
+                "little",
+            )
+            # Adding the row hashes makes the record hash independent of row order
+            hashes[nzgd_id] = (hashes.get(nzgd_id, 0) + row_hash) & _HASH_MASK
+
+    return pd.Series(
+        np.fromiter(hashes.values(), dtype=np.uint64, count=len(hashes)),
+        index=pd.Index(list(hashes), name="nzgd_id", dtype=np.int64),
+        dtype=np.uint64,
+    )
+
+
+def record_hashes(conn: sqlite3.Connection | ConnectionPool) -> pd.DataFrame:
+    """
+    Computes the content hash of every record in each table of HASHED_TABLES.
+
+    Tables that are not in the database are skipped, as older versions of the database
+    may not have every table.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    pd.DataFrame
+        The hashes as uint64, indexed by NZGD ID in ascending order, with a column per
+        hashed table. A record without rows in a table has a hash of 0 in that table.
+    """
+    conn = as_connection(conn)
+
+    table_hashes = {}
+    for name, hashed_table in HASHED_TABLES.items():
+        if _table_columns(conn, hashed_table.table) is not None:
+            table_hashes[name] = _hash_table(conn, hashed_table)
+
+    nzgd_ids = pd.Index([], name="nzgd_id", dtype=np.int64)
+    for hashes in table_hashes.values():
+        nzgd_ids = nzgd_ids.union(hashes.index)
+    # Each table is reindexed separately with an integer fill value, as aligning the
+    # tables in one step fills with NaN, and the float64 columns lose hash bits
+    return pd.DataFrame(
+        {
+            name: hashes.reindex(nzgd_ids, fill_value=0)
+            for name, hashes in table_hashes.items()
+        },
+        index=nzgd_ids.sort_values(),
+    )
+
+
+def diff_record_hashes(
+    old_hashes_df: pd.DataFrame, new_hashes_df: pd.DataFrame
+) -> DatabaseDiff:
+    """
+    Compares the record hashes of two versions of the database.
+
+    A record is in a version if it has a row in nzgdrecord, which is when its
+    nzgdrecord hash is not 0. Only the tables that were hashed in both versions are
+    compared.
+
+    Parameters
+    ----------
+    old_hashes_df : pd.DataFrame
+        The record hashes of the old version, from record_hashes.
+    new_hashes_df : pd.DataFrame
+        The record hashes of the new version, from record_hashes.
+
+    Returns
+    -------
+    DatabaseDiff
+        The added, removed and modified records.
+    """
+    tables = [table for table in old_hashes_df.columns if table in new_hashes_df]
+    old_nzgd_ids = old_hashes_df.index[old_hashes_df["nzgdrecord"] != 0]
+    new_nzgd_ids = new_hashes_df.index[new_hashes_df["nzgdrecord"] != 0]
+    added_nzgd_ids = new_nzgd_ids.difference(old_nzgd_ids)
+    removed_nzgd_ids = old_nzgd_ids.difference(new_nzgd_ids)
+
+    # Records with rows in other tables but not in nzgdrecord are compared too, so
+    # that changes to them are not missed
+    compared_nzgd_ids = (
+        old_hashes_df.index.union(new_hashes_df.index)
+        .difference(added_nzgd_ids)
+        .difference(removed_nzgd_ids)
+        .sort_values()
+    )
+    is_changed = old_hashes_df[tables].reindex(
+        compared_nzgd_ids, fill_value=0
+    ) != new_hashes_df[tables].reindex(compared_nzgd_ids, fill_value=0)
+    is_changed = is_changed[is_changed.any(axis=1)]
+
+    return DatabaseDiff(
+        added_nzgd_ids=added_nzgd_ids.sort_values().tolist(),
+        removed_nzgd_ids=removed_nzgd_ids.sort_values().tolist(),
+        modified_nzgd_ids=is_changed.index.tolist(),
+        modified_tables={
+            int(nzgd_id): [table for table, changed in row.items() if changed]
+            for nzgd_id, row in is_changed.iterrows()
+        },
+    )
+
+
+def diff_databases(old_db_path: Path, new_db_path: Path) -> DatabaseDiff:
+    """
+    Compares two versions of the NZGD database file.
+
+    Parameters
+    ----------
+    old_db_path : Path
+        The path of the old version of the database file.
+    new_db_path : Path
+        The path of the new version of the database file.
+
+    Returns
+    -------
+    DatabaseDiff
+        The added, removed and modified records.
+    """
+    with contextlib.closing(connect_read_only(old_db_path)) as old_conn:
+        old_hashes_df = record_hashes(old_conn)
+    with contextlib.closing(connect_read_only(new_db_path)) as new_conn:
+        new_hashes_df = record_hashes(new_conn)
+    return diff_record_hashes(old_hashes_df, new_hashes_df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="List the NZGD IDs that were added, removed or modified between "
+        "two versions of the NZGD SQLite database."
+    )
+    parser.add_argument("old_db_path", type=Path, help="Path to the old database.")
+    parser.add_argument("new_db_path", type=Path, help="Path to the new database.")
+    parser.add_argument(
+        "--output", type=Path, help="Path to write the changes to as JSON."
+    )
+    args = parser.parse_args()
+
+    database_diff = diff_databases(args.old_db_path, args.new_db_path)
+    print(
+        f"{len(database_diff.added_nzgd_ids)} added, "
+        f"{len(database_diff.removed_nzgd_ids)} removed, "
+        f"{len(database_diff.modified_nzgd_ids)} modified records"
+    )
+    if args.output is not None:
+        args.output.write_text(json.dumps(database_diff._asdict(), indent=2))
+        print(f"Wrote the changes to {args.output}")
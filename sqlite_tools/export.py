@@ -0,0 +1,370 @@
+"""
+Parallel export of the CPT and SPT data of the whole database to sharded files.
+
+The NZGD IDs of every CPT and SPT record are split into shards of a fixed number of
+records, and the shards are exported by a pool of worker processes, each with its own
+read-only connection. Each shard is written to its own file per table:
+
+    output_dir/
+        export_manifest.json
+        cpt_measurements/shard_00000.parquet
+        spt_measurements/shard_00000.parquet
+        spt_soil_types/shard_00000.parquet
+
+Shard files are written atomically, so an interrupted export can be resumed by running
+it again, which skips the shards that were already written.
+
+Export the whole database from the command line with
+
+    python -m sqlite_tools.export /path/to/nzgd.db /path/to/output_dir --n-workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import contextlib
+import functools
+import json
+import os
+import sqlite3
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import NamedTuple
+
+from sqlite_tools import query, snapshot
+from sqlite_tools.connection import connect_read_only
+
+# The tables written for each kind of record, and the functions that extract them.
+# The layer thicknesses are exported as numbers, rather than as display strings.
+EXPORT_TABLES = {
+    "cpt": {"cpt_measurements": query.cpt_measurements_for_nzgd_ids},
+    "spt": {
+        "spt_measurements": query.spt_measurements_for_nzgd_ids,
+        "spt_soil_types": functools.partial(
+            query.spt_soil_types_for_nzgd_ids, format_layer_thickness=False
+        ),
+    },
+}
+
+FILE_FORMATS = ("parquet", "csv")
+
+MANIFEST_FILE_NAME = "export_manifest.json"
+
+# The read-only connection of each worker process, opened by _init_worker
+_worker_conn: sqlite3.Connection | None = None
+
+
+class ExportProgress(NamedTuple):
+    """The progress of an export, reported after each shard is written."""
+
+    n_shards_done: int
+    """The number of shards written so far, not counting skipped shards."""
+    n_shards_total: int
+    """The number of shards to write, not counting skipped shards."""
+    n_records: int
+    """The number of records written so far."""
+    n_rows: int
+    """The number of rows written so far, summed over the tables."""
+    elapsed_s: float
+    """The time since the export started, in seconds."""
+
+    @property
+    def records_per_s(self) -> float:
+        """The number of records written per second."""
+        return self.n_records / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    @property
+    def rows_per_s(self) -> float:
+        """The number of rows written per second."""
+        return self.n_rows / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+
+class _Shard(NamedTuple):
+    """A shard of the records of one kind."""
+
+    kind: str
+    index: int
+    nzgd_ids: list[int]
+
+
+def _shard_path(output_dir: Path, table: str, index: int, file_format: str) -> Path:
+    """
+    Gets the path of the file of a table for a shard.
+
+    Parameters
+    ----------
+    output_dir : Path
+        The output directory of the export.
+    table : str
+        The name of the table, such as "cpt_measurements".
+    index : int
+        The index of the shard.
+    file_format : str
+        The file format, "parquet" or "csv".
+
+    Returns
+    -------
+    Path
+        The path of the shard file.
+    """
+    return output_dir / table / f"shard_{index:05d}.{file_format}"
+
+
+def _init_worker(db_path: str) -> None:
+    """
+    Opens the read-only connection of a worker process.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database file.
+    """
+    global _worker_conn
+    _worker_conn = connect_read_only(db_path)
+
+
+def _export_shard(shard: _Shard, output_dir: Path, file_format: str) -> int:
+    """
+    Exports the tables of a shard, using the connection of the worker process.
+
+    Parameters
+    ----------
+    shard : _Shard
+        The shard to export.
+    output_dir : Path
+        The output directory of the export.
+    file_format : str
+        The file format, "parquet" or "csv".
+
+    Returns
+    -------
+    int
+        The number of rows written, summed over the tables.
+    """
+    n_rows = 0
+    for table, extract in EXPORT_TABLES[shard.kind].items():
+        table_df = extract(shard.nzgd_ids, _worker_conn)
+        file_path = _shard_path(output_dir, table, shard.index, file_format)
+
+        # Write to a temporary file first, so that an interrupted export never leaves
+        # a partial shard file that would be skipped when resuming
+        temp_file_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.tmp")
+        if file_format == "parquet":
+            table_df.to_parquet(temp_file_path, index=False)
+        else:
+            table_df.to_csv(temp_file_path, index=False)
+        os.replace(temp_file_path, file_path)
+
+        n_rows += len(table_df)
+    return n_rows
+
+
+def _check_manifest(output_dir: Path, manifest: dict, overwrite: bool) -> None:
+    """
+    Checks that an existing export in the output directory can be resumed.
+
+    Parameters
+    ----------
+    output_dir : Path
+        The output directory of the export.
+    manifest : dict
+        The manifest of the new export.
+    overwrite : bool
+        If True, existing exports are replaced rather than checked.
+
+    Raises
+    ------
+    ValueError
+        If the output directory contains an export of a different database version,
+        or with a different shard size or file format.
+    """
+    manifest_path = output_dir / MANIFEST_FILE_NAME
+    if manifest_path.exists() and not overwrite:
+        existing_manifest = json.loads(manifest_path.read_text())
+        if existing_manifest != manifest:
+            raise ValueError(
+                f"{output_dir} contains a different export ({existing_manifest}), "
+                "so it cannot be resumed. Use overwrite=True to replace it."
+            )
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+
+
+def export_database(
+    db_path: Path,
+    output_dir: Path,
+    file_format: str = "parquet",
+    n_workers: int | None = None,
+    shard_size: int = 500,
+    overwrite: bool = False,
+    progress: Callable[[ExportProgress], None] | None = None,
+) -> ExportProgress:
+    """
+    Exports the CPT measurements, SPT measurements and SPT soil types of every record.
+
+    Parameters
+    ----------
+    db_path : Path
+        The path of the database file.
+    output_dir : Path
+        The directory to write the shard files to.
+    file_format : str, optional
+        The file format of the shards, "parquet" (default) or "csv". Parquet requires
+        pyarrow (or fastparquet) to be installed.
+    n_workers : int or None, optional
+        The number of worker processes. If None (default), the number of CPUs is used.
+    shard_size : int, optional
+        The number of records per shard. Default is 500.
+    overwrite : bool, optional
+        If True, every shard is written, replacing any existing files. If False
+        (default), shards whose files all exist are skipped, so an interrupted export
+        is resumed.
+    progress : Callable[[ExportProgress], None] or None, optional
+        A function called with the progress after each shard is written.
+        Default is None.
+
+    Returns
+    -------
+    ExportProgress
+        The final progress, with the totals and throughput of the export.
+
+    Raises
+    ------
+    ValueError
+        If the file format is not supported, or if the output directory contains an
+        export that cannot be resumed.
+    """
+    if file_format not in FILE_FORMATS:
+        raise ValueError(
+            f"Unsupported file format {file_format!r}. "
+            f"Supported formats are: {', '.join(FILE_FORMATS)}"
+        )
+    if shard_size < 1:
+        raise ValueError(f"shard_size must be at least 1, but got {shard_size}")
+
+    db_path = Path(db_path).resolve()
+    output_dir = Path(output_dir)
+
+    with contextlib.closing(connect_read_only(db_path)) as conn:
+        db_token = snapshot.database_token(conn)
+        nzgd_ids = {
+            "cpt": [
+                row[0]
+                for row in conn.execute(
+                    "SELECT DISTINCT nzgd_id FROM cptreport ORDER BY nzgd_id"
+                )
+            ],
+            "spt": [
+                row[0]
+                for row in conn.execute(
+                    "SELECT borehole_id FROM sptreport ORDER BY borehole_id"
+                )
+            ],
+        }
+
+    for tables in EXPORT_TABLES.values():
+        for table in tables:
+            table_dir = output_dir / table
+            table_dir.mkdir(parents=True, exist_ok=True)
+            if overwrite:
+                # Remove the shards of the previous export, as it may have had more
+                # shards than this one
+                for file_format_ in FILE_FORMATS:
+                    for file_path in table_dir.glob(f"shard_*.{file_format_}"):
+                        file_path.unlink()
+    _check_manifest(
+        output_dir,
+        {
+            "database_token": db_token,
+            "shard_size": shard_size,
+            "file_format": file_format,
+        },
+        overwrite,
+    )
+
+    shards = []
+    for kind, kind_nzgd_ids in nzgd_ids.items():
+        for index, start in enumerate(range(0, len(kind_nzgd_ids), shard_size)):
+            shard = _Shard(kind, index, kind_nzgd_ids[start : start + shard_size])
+            shard_done = all(
+                _shard_path(output_dir, table, index, file_format).exists()
+                for table in EXPORT_TABLES[kind]
+            )
+            if overwrite or not shard_done:
+                shards.append(shard)
+
+    start_time = time.perf_counter()
+    current_progress = ExportProgress(0, len(shards), 0, 0, 0.0)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=n_workers, initializer=_init_worker, initargs=(str(db_path),)
+    ) as executor:
+        futures = {
+            executor.submit(_export_shard, shard, output_dir, file_format): shard
+            for shard in shards
+        }
+        for future in concurrent.futures.as_completed(futures):
+            current_progress = ExportProgress(
+                n_shards_done=current_progress.n_shards_done + 1,
+                n_shards_total=len(shards),
+                n_records=current_progress.n_records + len(futures[future].nzgd_ids),
+                n_rows=current_progress.n_rows + future.result(),
+                elapsed_s=time.perf_counter() - start_time,
+            )
+            if progress is not None:
+                progress(current_progress)
+
+    return current_progress
+
+
+def _print_progress(export_progress: ExportProgress) -> None:
+    """
+    Prints the progress of an export.
+
+    Parameters
+    ----------
+    export_progress : ExportProgress
+        The progress to print.
+    """
+    print(
+        f"{export_progress.n_shards_done}/{export_progress.n_shards_total} shards, "
+        f"{export_progress.n_records} records, {export_progress.n_rows} rows in "
+        f"{export_progress.elapsed_s:.1f} s "
+        f"({export_progress.records_per_s:.0f} records/s, "
+        f"{export_progress.rows_per_s:.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the CPT measurements, SPT measurements and SPT soil types "
+        "of every record to sharded Parquet or CSV files, using a pool of processes."
+    )
+    parser.add_argument("db_path", type=Path, help="Path to the NZGD SQLite database.")
+    parser.add_argument(
+        "output_dir", type=Path, help="Directory to write the shard files to."
+    )
+    parser.add_argument("--format", choices=FILE_FORMATS, default="parquet")
+    parser.add_argument(
+        "--n-workers",
+        type=int,
+        help="Number of worker processes (default: the number of CPUs).",
+    )
+    parser.add_argument("--shard-size", type=int, default=500)
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Rewrite every shard rather than resuming a previous export.",
+    )
+    args = parser.parse_args()
+
+    final_progress = export_database(
+        args.db_path,
+        args.output_dir,
+        file_format=args.format,
+        n_workers=args.n_workers,
+        shard_size=args.shard_size,
+        overwrite=args.overwrite,
+        progress=_print_progress,
+    )
+    print(f"Exported {args.db_path} to {args.output_dir}")
@@ -0,0 +1,341 @@
+"""
+Functions to check and create the indexes that the queries in sqlite_tools.query rely on.
+
+Copies of the NZGD SQLite database come from several sources, and a copy without the
+right indexes turns millisecond lookups into multi-second full table scans. The
+functions in this module report missing indexes and full table scans, and can create
+the missing indexes on a writable copy of the database.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import re
+import sqlite3
+from pathlib import Path
+from typing import NamedTuple
+
+from sqlite_tools import query
+
+
+class RecommendedIndex(NamedTuple):
+    """An index that the queries in sqlite_tools.query rely on."""
+
+    name: str
+    """The name to give the index when creating it."""
+    table: str
+    """The name of the indexed table."""
+    columns: tuple[str, ...]
+    """The indexed columns, in order."""
+
+
+RECOMMENDED_INDEXES = (
+    RecommendedIndex("ix_cptreport_nzgd_id", "cptreport", ("nzgd_id",)),
+    RecommendedIndex(
+        "ix_cptmeasurements_cpt_id_depth", "cptmeasurements", ("cpt_id", "depth")
+    ),
+    RecommendedIndex(
+        "ix_sptmeasurements_borehole_id_depth",
+        "sptmeasurements",
+        ("borehole_id", "depth"),
+    ),
+    RecommendedIndex(
+        "ix_soilmeasurements_report_id", "soilmeasurements", ("report_id",)
+    ),
+    RecommendedIndex(
+        "ix_soilmeasurementsoiltype_soil_measurement_id",
+        "soilmeasurementsoiltype",
+        ("soil_measurement_id",),
+    ),
+    RecommendedIndex(
+        "ix_cptvs30estimates_correlation_ids",
+        "cptvs30estimates",
+        ("vs_to_vs30_correlation_id", "cpt_to_vs_correlation_id"),
+    ),
+    RecommendedIndex("ix_cptvs30estimates_nzgd_id", "cptvs30estimates", ("nzgd_id",)),
+    RecommendedIndex("ix_sptvs30estimates_spt_id", "sptvs30estimates", ("spt_id",)),
+    RecommendedIndex(
+        "ix_sptvs30estimates_correlation_ids",
+        "sptvs30estimates",
+        ("vs_to_vs30_correlation_id", "spt_to_vs_correlation_id", "hammer_type_id"),
+    ),
+)
+
+
+# vs30s_for_correlation_combinations reads the metadata of every investigation once,
+# rather than once per combination, so it scans the report tables by design
+_EXPECTED_SCANS = {"vs30s_for_correlation_combinations": {"cptreport", "sptreport"}}
+
+
+# Matches "FROM table AS alias" and "JOIN table alias" in SQL statements
+_TABLE_ALIAS_PATTERN = re.compile(
+    r"\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b)(\w+)",
+    re.IGNORECASE,
+)
+
+
+def _indexed_column_prefixes(conn: sqlite3.Connection, table: str) -> list[tuple]:
+    """
+    Gets the indexed columns of every index on a table.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    table : str
+        The name of the table.
+
+    Returns
+    -------
+    list[tuple]
+        The tuple of indexed columns of each index, in index order.
+    """
+    indexed_columns = []
+    for index_row in conn.execute(f"PRAGMA index_list({table})"):
+        index_name = index_row[1]
+        index_info = conn.execute(f"PRAGMA index_info({index_name})").fetchall()
+        indexed_columns.append(
+            tuple(column_name for _, _, column_name in sorted(index_info))
+        )
+    return indexed_columns
+
+
+def missing_indexes(conn: sqlite3.Connection) -> list[RecommendedIndex]:
+    """
+    Finds the recommended indexes that the database does not have.
+
+    A recommended index is treated as present if any index on the table starts with
+    the recommended columns, in the same order.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The SQLite database connection.
+
+    Returns
+    -------
+    list[RecommendedIndex]
+        The recommended indexes that are missing.
+    """
+    missing = []
+    for recommended_index in RECOMMENDED_INDEXES:
+        n_columns = len(recommended_index.columns)
+        indexed_columns = _indexed_column_prefixes(conn, recommended_index.table)
+        if not any(
+            columns[:n_columns] == recommended_index.columns
+            for columns in indexed_columns
+        ):
+            missing.append(recommended_index)
+    return missing
+
+
+def _traced_statements(conn: sqlite3.Connection) -> dict[str, list[str]]:
+    """
+    Runs each public query function once and records the SQL statements it executes.
+
+    The functions are run with the first NZGD IDs of each investigation type and the
+    first name in each lookup table, so the recorded statements are the ones that
+    sqlite_tools.query actually ships, with representative parameters bound.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The SQLite database connection.
+
+    Returns
+    -------
+    dict[str, list[str]]
+        The SELECT statements executed by each function, keyed by function name.
+    """
+    cpt_nzgd_id = conn.execute("SELECT MIN(nzgd_id) FROM cptreport").fetchone()[0]
+    spt_nzgd_id = conn.execute("SELECT MIN(borehole_id) FROM sptreport").fetchone()[0]
+    lookups = query.lookup_tables(conn)
+    selected_names = [next(iter(lookups[lookup]), "") for lookup in query.LOOKUP_TABLES]
+    selected_names_lists = [[selected_name] for selected_name in selected_names]
+
+    calls = {
+        "cpt_measurements_for_one_nzgd": lambda: query.cpt_measurements_for_one_nzgd(
+            cpt_nzgd_id, conn
+        ),
+        "spt_measurements_for_one_nzgd": lambda: query.spt_measurements_for_one_nzgd(
+            spt_nzgd_id, conn
+        ),
+        "spt_soil_types_for_one_nzgd": lambda: query.spt_soil_types_for_one_nzgd(
+            spt_nzgd_id, conn
+        ),
+        "cpt_vs30s_for_one_nzgd_id": lambda: query.cpt_vs30s_for_one_nzgd_id(
+            cpt_nzgd_id, conn
+        ),
+        "spt_vs30s_for_one_nzgd_id": lambda: query.spt_vs30s_for_one_nzgd_id(
+            spt_nzgd_id, conn
+        ),
+        "cpt_measurements_for_nzgd_ids": lambda: query.cpt_measurements_for_nzgd_ids(
+            [cpt_nzgd_id], conn
+        ),
+        # Only the first chunk is read, which is enough to trace the statement
+        "iter_cpt_measurements": lambda: next(
+            query.iter_cpt_measurements(conn, chunk_size=1, per_sounding=False), None
+        ),
+        "spt_measurements_for_nzgd_ids": lambda: query.spt_measurements_for_nzgd_ids(
+            [spt_nzgd_id], conn
+        ),
+        "spt_soil_types_for_nzgd_ids": lambda: query.spt_soil_types_for_nzgd_ids(
+            [spt_nzgd_id], conn
+        ),
+        "cpt_vs30s_for_nzgd_ids": lambda: query.cpt_vs30s_for_nzgd_ids(
+            [cpt_nzgd_id], conn
+        ),
+        "spt_vs30s_for_nzgd_ids": lambda: query.spt_vs30s_for_nzgd_ids(
+            [spt_nzgd_id], conn
+        ),
+        "filtered_vs30s": lambda: query.filtered_vs30s(*selected_names, conn),
+        "vs30_residual_statistics": lambda: query.vs30_residual_statistics(
+            *selected_names, conn
+        ),
+        "vs30s_for_correlation_combinations": lambda: (
+            query.vs30s_for_correlation_combinations(*selected_names_lists, conn)
+        ),
+        "all_vs30s_given_correlations": lambda: query.all_vs30s_given_correlations(
+            *selected_names, conn
+        ),
+        "get_westerhoff_model_gwl": lambda: query.get_westerhoff_model_gwl(
+            conn, [cpt_nzgd_id, spt_nzgd_id]
+        ),
+        "record_details": lambda: query.record_details(
+            [cpt_nzgd_id, spt_nzgd_id],
+            conn,
+            include_measurements=True,
+            include_soil_types=True,
+        ),
+    }
+
+    statements = {}
+    for function_name, call in calls.items():
+        executed = []
+        conn.set_trace_callback(executed.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        statements[function_name] = [
+            statement
+            for statement in executed
+            if statement.lstrip().upper().startswith(("SELECT", "WITH"))
+        ]
+    return statements
+
+
+def full_scans(conn: sqlite3.Connection) -> dict[str, list[str]]:
+    """
+    Finds the full table scans in the query plans of the public query functions.
+
+    Each public function in sqlite_tools.query is run once, and EXPLAIN QUERY PLAN is
+    run on every statement it executes. Scans of the small lookup tables (regions,
+    correlations, etc.) are expected and are not reported, and neither are the scans
+    of the report tables by vs30s_for_correlation_combinations, which reads the
+    metadata of every investigation.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The SQLite database connection.
+
+    Returns
+    -------
+    dict[str, list[str]]
+        The query plan lines that are full table scans, keyed by function name.
+        Functions without full table scans are not included.
+    """
+    table_names = {
+        table_name
+        for (table_name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )
+    }
+    # These tables only have a handful of rows, so scanning them is cheap
+    small_tables = {"region", "district", "city", "suburb", "soiltypes"} | {
+        table_name for table_name, _ in query.LOOKUP_TABLES.values()
+    }
+
+    scans = {}
+    for function_name, statements in _traced_statements(conn).items():
+        for statement in statements:
+            # Query plans refer to tables by their alias, if they have one
+            aliases = {
+                alias: table_name
+                for table_name, alias in _TABLE_ALIAS_PATTERN.findall(statement)
+            }
+            for *_, detail in conn.execute(f"EXPLAIN QUERY PLAN {statement}"):
+                words = detail.split()
+                # A full table scan has a plan line of "SCAN <table>", while a scan of an
+                # index has "USING ... INDEX" in the line. Scans of common table
+                # expressions and subqueries are not scans of a table, so are skipped.
+                if words[0] != "SCAN" or "INDEX" in words:
+                    continue
+                table_name = aliases.get(words[1], words[1])
+                if (
+                    table_name in table_names
+                    and table_name not in small_tables
+                    and table_name not in _EXPECTED_SCANS.get(function_name, ())
+                ):
+                    scans.setdefault(function_name, []).append(detail)
+    return scans
+
+
+def create_missing_indexes(conn: sqlite3.Connection) -> list[RecommendedIndex]:
+    """
+    Creates the recommended indexes that the database does not have.
+
+    The connection must be writable. ANALYZE is run afterwards so that the
+    query planner has statistics for the new indexes.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        A writable SQLite database connection.
+
+    Returns
+    -------
+    list[RecommendedIndex]
+        The indexes that were created.
+    """
+    created = missing_indexes(conn)
+    for recommended_index in created:
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {recommended_index.name} "
+            f"ON {recommended_index.table} ({', '.join(recommended_index.columns)})"
+        )
+    if created:
+        conn.execute("ANALYZE")
+    conn.commit()
+    return created
+
+
+def copy_with_indexes(
+    source_db_path: Path, destination_db_path: Path
+) -> list[RecommendedIndex]:
+    """
+    Copies a database file and creates the missing recommended indexes in the copy.
+
+    The source database is only read, so it can be a read-only file.
+
+    Parameters
+    ----------
+    source_db_path : Path
+        The path of the database to copy.
+    destination_db_path : Path
+        The path to write the copy to. Any existing file is overwritten.
+
+    Returns
+    -------
+    list[RecommendedIndex]
+        The indexes that were created in the copy.
+    """
+    # as_uri only accepts absolute paths
+    source_uri = f"{Path(source_db_path).resolve().as_uri()}?mode=ro"
+    with (
+        contextlib.closing(sqlite3.connect(source_uri, uri=True)) as source_conn,
+        contextlib.closing(sqlite3.connect(destination_db_path)) as destination_conn,
+    ):
+        source_conn.backup(destination_conn)
+        return create_missing_indexes(destination_conn)
@@ -0,0 +1,466 @@
+"""
+Optional instrumentation of the public query functions.
+
+When instrumentation is enabled, every call of a public function in sqlite_tools.query
+produces a CallEvent. The event records each SQL statement that the call executed, with
+its bind parameters, the time SQLite took to run it and return its rows, and the time
+pandas took to build the DataFrame from the rows. The query plan of each statement can
+also be captured with EXPLAIN QUERY PLAN.
+
+Events are passed to hooks registered with add_hook, or collected by a QueryRecorder,
+which can also aggregate them per function:
+
+>>> with record_queries(explain_query_plans=True) as recorder:
+...     query.cpt_vs30s_for_one_nzgd_id(1, conn)
+>>> recorder.events[0].statements[0].query_plan
+['SEARCH cptvs30estimates USING INDEX ...', ...]
+>>> recorder.stats()
+
+When no hooks are registered, the query functions only check whether the list of
+hooks is empty, so the overhead is negligible.
+
+Calls made by another public function, such as the calls made by
+query.record_details, are part of the event of the outermost call. The streaming
+function query.iter_cpt_measurements does not produce events itself, but its statement
+is recorded when it is read during an instrumented call.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import functools
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from sqlite_tools.core import LazyModule
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    # Only imported when a DataFrame is first built
+    pd = LazyModule("pandas")
+
+
+class StatementEvent(NamedTuple):
+    """A SQL statement executed by a public query function."""
+
+    sql: str
+    """The SQL of the statement."""
+    params: tuple[Any, ...]
+    """The bind parameters of the statement."""
+    sqlite_time_s: float
+    """The time taken by SQLite to run the statement and return its rows, in seconds."""
+    dataframe_time_s: float
+    """The time taken by pandas to build the DataFrame from the rows, in seconds."""
+    n_rows: int
+    """The number of rows returned by the statement."""
+    query_plan: list[str] | None
+    """The details of each step of the EXPLAIN QUERY PLAN output, if requested."""
+
+
+class CallEvent(NamedTuple):
+    """A call of a public query function."""
+
+    function: str
+    """The name of the function."""
+    total_time_s: float
+    """The total time taken by the call, in seconds."""
+    sqlite_time_s: float
+    """The time spent in SQLite, summed over the statements, in seconds."""
+    pandas_time_s: float
+    """The rest of the time of the call, which is spent in pandas and Python."""
+    n_rows: int
+    """The number of rows of the returned DataFrame, or -1 if it is not a DataFrame."""
+    statements: tuple[StatementEvent, ...]
+    """The executed statements, in order."""
+
+
+# The registered hooks, and whether each one requested query plans
+_hooks: list[tuple[Callable[[CallEvent], None], bool]] = []
+_hooks_lock = threading.Lock()
+
+# The statements executed by the outermost instrumented call in the current context,
+# or None if no instrumented call is running
+_current_statements: contextvars.ContextVar[list[StatementEvent] | None] = (
+    contextvars.ContextVar("_current_statements", default=None)
+)
+
+
+def add_hook(
+    hook: Callable[[CallEvent], None], explain_query_plans: bool = False
+) -> None:
+    """
+    Registers a function to be called with the event of every public function call.
+
+    Hooks are called on the thread that made the call, after it returns, so they
+    should be quick. Exceptions raised by a hook propagate to the caller.
+
+    Parameters
+    ----------
+    hook : Callable[[CallEvent], None]
+        The function to call with each event.
+    explain_query_plans : bool, optional
+        If True, the query plan of each statement is captured. This runs an extra
+        EXPLAIN QUERY PLAN statement per statement, which is not included in the
+        timings. Default is False.
+    """
+    with _hooks_lock:
+        _hooks.append((hook, explain_query_plans))
+
+
+def remove_hook(hook: Callable[[CallEvent], None]) -> None:
+    """
+    Unregisters a hook registered with add_hook.
+
+    Parameters
+    ----------
+    hook : Callable[[CallEvent], None]
+        The hook to unregister.
+
+    Raises
+    ------
+    ValueError
+        If the hook is not registered.
+    """
+    with _hooks_lock:
+        for index, (registered_hook, _) in enumerate(_hooks):
+            if registered_hook is hook:
+                del _hooks[index]
+                return
+    raise ValueError(f"Hook {hook!r} is not registered")
+
+
+def instrumented(function: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Decorates a public query function so that its calls produce CallEvents.
+
+    Parameters
+    ----------
+    function : Callable[..., Any]
+        The function to instrument.
+
+    Returns
+    -------
+    Callable[..., Any]
+        The instrumented function.
+    """
+
+    @functools.wraps(function)
+    def instrumented_function(*args: Any, **kwargs: Any) -> Any:
+        """Calls the function, and passes its event to the hooks if there are any."""
+        if not _hooks or _current_statements.get() is not None:
+            # Not instrumenting, or a nested call whose statements are recorded
+            # by the outermost call
+            return function(*args, **kwargs)
+
+        statements: list[StatementEvent] = []
+        token = _current_statements.set(statements)
+        start_time = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            total_time_s = time.perf_counter() - start_time
+            _current_statements.reset(token)
+
+        sqlite_time_s = sum(statement.sqlite_time_s for statement in statements)
+        event = CallEvent(
+            function=function.__name__,
+            total_time_s=total_time_s,
+            sqlite_time_s=sqlite_time_s,
+            pandas_time_s=total_time_s - sqlite_time_s,
+            n_rows=len(result) if isinstance(result, pd.DataFrame) else -1,
+            statements=tuple(statements),
+        )
+        # Copied, as hooks can be removed by other threads while iterating
+        hooks = tuple(_hooks)
+        for hook, _ in hooks:
+            hook(event)
+        return result
+
+    return instrumented_function
+
+
+def read_sql(
+    sql: str, conn: sqlite3.Connection, params: Sequence[Any] | None = None
+) -> pd.DataFrame:
+    """
+    Reads the result of a SQL query into a DataFrame, like pd.read_sql.
+
+    If an instrumented call is running, the statement is timed and recorded.
+
+    Parameters
+    ----------
+    sql : str
+        The SQL query.
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    params : Sequence[Any] or None, optional
+        The bind parameters of the query. Default is None.
+
+    Returns
+    -------
+    pd.DataFrame
+        The result of the query.
+    """
+    statements = _current_statements.get()
+    if statements is None:
+        return pd.read_sql(sql, conn, params=params)
+
+    params = tuple(params or ())
+    start_time = time.perf_counter()
+    cursor = conn.execute(sql, params)
+    rows = cursor.fetchall()
+    sqlite_time_s = time.perf_counter() - start_time
+
+    # This builds the DataFrame in the same way as pd.read_sql does for sqlite3
+    # connections, but separately from running the query so the two can be timed
+    start_time = time.perf_counter()
+    df = pd.DataFrame.from_records(
+        rows,
+        columns=[description[0] for description in cursor.description],
+        coerce_float=True,
+    )
+    dataframe_time_s = time.perf_counter() - start_time
+
+    _record_statement(
+        statements, conn, sql, params, sqlite_time_s, dataframe_time_s, len(rows)
+    )
+    return df
+
+
+def read_sql_chunks(
+    sql: str,
+    conn: sqlite3.Connection,
+    chunk_size: int,
+    params: Sequence[Any] | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Reads the result of a SQL query into DataFrames of chunk_size rows, like
+    pd.read_sql with chunksize.
+
+    If an instrumented call is running when the first chunk is read, the statement is
+    recorded once the chunks have been read, with the times summed over the chunks.
+
+    Parameters
+    ----------
+    sql : str
+        The SQL query.
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    chunk_size : int
+        The number of rows of each DataFrame, except for the last one.
+    params : Sequence[Any] or None, optional
+        The bind parameters of the query. Default is None.
+
+    Yields
+    ------
+    pd.DataFrame
+        The rows of the next chunk of the result. A query without any rows yields
+        a single empty DataFrame.
+    """
+    statements = _current_statements.get()
+    if statements is None:
+        yield from pd.read_sql(sql, conn, params=params, chunksize=chunk_size)
+        return
+
+    params = tuple(params or ())
+    sqlite_time_s = 0.0
+    dataframe_time_s = 0.0
+    n_rows = 0
+    try:
+        start_time = time.perf_counter()
+        cursor = conn.execute(sql, params)
+        columns = [description[0] for description in cursor.description]
+        rows = cursor.fetchmany(chunk_size)
+        sqlite_time_s += time.perf_counter() - start_time
+        # Like pd.read_sql, a result without any rows is read as one empty chunk
+        is_first_chunk = True
+        while rows or is_first_chunk:
+            is_first_chunk = False
+            start_time = time.perf_counter()
+            df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+            dataframe_time_s += time.perf_counter() - start_time
+            n_rows += len(rows)
+            yield df
+
+            # The time the caller spends between chunks is not included
+            start_time = time.perf_counter()
+            rows = cursor.fetchmany(chunk_size)
+            sqlite_time_s += time.perf_counter() - start_time
+    finally:
+        _record_statement(
+            statements, conn, sql, params, sqlite_time_s, dataframe_time_s, n_rows
+        )
+
+
+def _record_statement(
+    statements: list[StatementEvent],
+    conn: sqlite3.Connection,
+    sql: str,
+    params: tuple[Any, ...],
+    sqlite_time_s: float,
+    dataframe_time_s: float,
+    n_rows: int,
+) -> None:
+    """
+    Records a statement of the running instrumented call.
+
+    Parameters
+    ----------
+    statements : list[StatementEvent]
+        The statements of the running instrumented call.
+    conn : sqlite3.Connection
+        The SQLite database connection that ran the statement.
+    sql : str
+        The SQL of the statement.
+    params : tuple[Any, ...]
+        The bind parameters of the statement.
+    sqlite_time_s : float
+        The time taken by SQLite, in seconds.
+    dataframe_time_s : float
+        The time taken by pandas, in seconds.
+    n_rows : int
+        The number of rows returned by the statement.
+    """
+    query_plan = None
+    if any(explain_query_plans for _, explain_query_plans in _hooks):
+        query_plan = [
+            row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        ]
+
+    statements.append(
+        StatementEvent(
+            sql=sql,
+            params=params,
+            sqlite_time_s=sqlite_time_s,
+            dataframe_time_s=dataframe_time_s,
+            n_rows=n_rows,
+            query_plan=query_plan,
+        )
+    )
+
+
+class QueryRecorder:
+    """
+    A hook that collects the events of the public function calls.
+
+    Examples
+    --------
+    >>> recorder = QueryRecorder()
+    >>> add_hook(recorder)
+    >>> query.cpt_vs30s_for_one_nzgd_id(1, conn)
+    >>> remove_hook(recorder)
+    >>> recorder.stats()
+    """
+
+    def __init__(self) -> None:
+        """Creates a recorder without any events."""
+        self.events: list[CallEvent] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event: CallEvent) -> None:
+        """
+        Records an event.
+
+        Parameters
+        ----------
+        event : CallEvent
+            The event to record.
+        """
+        with self._lock:
+            self.events.append(event)
+
+    def statements(self) -> pd.DataFrame:
+        """
+        Gets every recorded statement as a DataFrame.
+
+        Returns
+        -------
+        pd.DataFrame
+            A DataFrame with the function name and the fields of StatementEvent
+            as columns, with one row per statement.
+        """
+        with self._lock:
+            events = list(self.events)
+        return pd.DataFrame(
+            [
+                {"function": event.function, **statement._asdict()}
+                for event in events
+                for statement in event.statements
+            ],
+            columns=["function", *StatementEvent._fields],
+        )
+
+    def stats(self) -> pd.DataFrame:
+        """
+        Aggregates the recorded events per function.
+
+        Returns
+        -------
+        pd.DataFrame
+            A DataFrame indexed by function name, with the number of calls, the total,
+            mean and maximum call times, the total SQLite and pandas times, and the
+            total number of statements and returned rows.
+        """
+        with self._lock:
+            events = list(self.events)
+        events_df = pd.DataFrame(
+            [
+                {
+                    "function": event.function,
+                    "total_time_s": event.total_time_s,
+                    "sqlite_time_s": event.sqlite_time_s,
+                    "pandas_time_s": event.pandas_time_s,
+                    "n_statements": len(event.statements),
+                    "n_rows": event.n_rows,
+                }
+                for event in events
+            ],
+            columns=[
+                "function",
+                "total_time_s",
+                "sqlite_time_s",
+                "pandas_time_s",
+                "n_statements",
+                "n_rows",
+            ],
+        )
+        return events_df.groupby("function").agg(
+            n_calls=("total_time_s", "size"),
+            total_time_s=("total_time_s", "sum"),
+            mean_time_s=("total_time_s", "mean"),
+            max_time_s=("total_time_s", "max"),
+            sqlite_time_s=("sqlite_time_s", "sum"),
+            pandas_time_s=("pandas_time_s", "sum"),
+            n_statements=("n_statements", "sum"),
+            n_rows=("n_rows", "sum"),
+        )
+
+
+@contextlib.contextmanager
+def record_queries(explain_query_plans: bool = False) -> Iterator[QueryRecorder]:
+    """
+    Records the events of the public function calls made in the body.
+
+    Calls made on any thread are recorded while the body runs.
+
+    Parameters
+    ----------
+    explain_query_plans : bool, optional
+        If True, the query plan of each statement is captured. Default is False.
+
+    Yields
+    ------
+    QueryRecorder
+        The recorder that collects the events.
+    """
+    recorder = QueryRecorder()
+    add_hook(recorder, explain_query_plans=explain_query_plans)
+    try:
+        yield recorder
+    finally:
+        remove_hook(recorder)
@@ -0,0 +1,558 @@
+"""
+A memory-mapped store of every CPT and SPT profile, resampled onto a common depth grid.
+
+build_profile_store resamples the measurements of every CPT sounding (qc, fs and u2)
+and every SPT borehole (N) onto a regular depth grid with linear interpolation, and
+writes them to a directory of .npy files:
+
+    profile_dir/
+        profile_manifest.json   the depth grid, the database it was built from and
+                                the names of the channels
+        cpt_values.npy          (n_samples, 3) array of the resampled qc, fs and u2
+        cpt_index.npy           one row per sounding: cpt_id, nzgd_id, offset of its
+                                first row in cpt_values.npy, number of rows, and the
+                                index of its first depth on the grid
+        spt_values.npy          (n_samples, 1) array of the resampled N values
+        spt_index.npy           one row per borehole, with the same fields as the
+                                CPT index (cpt_id is the borehole_id)
+
+Each profile only covers the grid depths between its shallowest and deepest
+measurements. ProfileStore opens the files with numpy memory mapping, so the profiles
+are only read from disk when they are used, and processes that open the same store
+share them through the OS page cache. A profile is a slice of the values array found
+through the index, so it is read in constant time without copying:
+
+>>> profile_store = ProfileStore("profiles")
+>>> profile = profile_store.cpt_profile(cpt_id=1)
+>>> profile.depth, profile.values[:, profile_store.cpt_channels.index("qc")]
+
+Build a store from the command line with
+
+    python -m sqlite_tools.profiles /path/to/nzgd.db /path/to/profile_dir --step 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import math
+import os
+from collections.abc import Iterable
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from sqlite_tools import query, snapshot
+from sqlite_tools.connection import connect_read_only
+from sqlite_tools.instrumentation import read_sql
+
+MANIFEST_FILE_NAME = "profile_manifest.json"
+
+# The resampled channels of each kind of profile, in the order of the value columns
+CPT_CHANNELS = ("qc", "fs", "u2")
+SPT_CHANNELS = ("n",)
+
+# The fields of the rows of the index files
+INDEX_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("nzgd_id", np.int64),
+        ("offset", np.int64),
+        ("length", np.int64),
+        ("first_depth_index", np.int64),
+    ]
+)
+
+# Depths within this distance of a grid depth are treated as being on the grid, so that
+# rounding errors do not drop the first or last grid depth of a profile
+_GRID_TOLERANCE = 1e-9
+
+
+class DepthGrid(NamedTuple):
+    """A regular grid of depths that the profiles are resampled onto."""
+
+    start: float = 0.0
+    """The first depth of the grid, in metres."""
+    step: float = 0.02
+    """The spacing of the grid, in metres."""
+
+    def index_range(self, shallowest_depth: float, deepest_depth: float) -> range:
+        """
+        Gets the indices of the grid depths between two depths.
+
+        Parameters
+        ----------
+        shallowest_depth : float
+            The shallowest depth, in metres.
+        deepest_depth : float
+            The deepest depth, in metres.
+
+        Returns
+        -------
+        range
+            The indices of the grid depths from shallowest_depth to deepest_depth,
+            inclusive. Indices of depths above the start of the grid are not included.
+        """
+        first_index = max(
+            0, math.ceil((shallowest_depth - self.start) / self.step - _GRID_TOLERANCE)
+        )
+        last_index = math.floor(
+            (deepest_depth - self.start) / self.step + _GRID_TOLERANCE
+        )
+        return range(first_index, max(first_index, last_index + 1))
+
+    def depths(self, first_depth_index: int, length: int) -> np.ndarray:
+        """
+        Gets consecutive depths of the grid.
+
+        Parameters
+        ----------
+        first_depth_index : int
+            The index of the first depth.
+        length : int
+            The number of depths.
+
+        Returns
+        -------
+        np.ndarray
+            The depths in metres.
+        """
+        return self.start + self.step * np.arange(
+            first_depth_index, first_depth_index + length
+        )
+
+
+class Profile(NamedTuple):
+    """A CPT sounding or SPT borehole resampled onto the depth grid."""
+
+    nzgd_id: int
+    """The NZGD ID of the record."""
+    depth: np.ndarray
+    """The grid depths of the profile, in metres."""
+    values: np.ndarray
+    """The resampled values, with a row per depth and a column per channel. For a
+    memory-mapped store, this is a read-only view of the values file."""
+
+
+def _resample(
+    depths: np.ndarray, values: np.ndarray, grid_depths: np.ndarray
+) -> np.ndarray:
+    """
+    Linearly interpolates each channel of a profile onto grid depths.
+
+    Parameters
+    ----------
+    depths : np.ndarray
+        The depths of the measurements, in ascending order.
+    values : np.ndarray
+        The measurements, with a row per depth and a column per channel.
+    grid_depths : np.ndarray
+        The depths to interpolate at, within the range of depths.
+
+    Returns
+    -------
+    np.ndarray
+        The interpolated values, with a row per grid depth and a column per channel.
+        Channels without any measurements are NaN.
+    """
+    resampled = np.full((grid_depths.size, values.shape[1]), np.nan)
+    for channel in range(values.shape[1]):
+        # Missing measurements are skipped, so they are interpolated over
+        is_measured = ~np.isnan(values[:, channel])
+        if is_measured.any():
+            resampled[:, channel] = np.interp(
+                grid_depths, depths[is_measured], values[is_measured, channel]
+            )
+    return resampled
+
+
+def _write_profiles(
+    output_dir: Path,
+    kind: str,
+    extents_df: pd.DataFrame,
+    profile_dfs: Iterable[pd.DataFrame],
+    channels: tuple[str, ...],
+    id_column: str,
+    grid: DepthGrid,
+    dtype: np.dtype,
+) -> int:
+    """
+    Resamples the profiles of one kind and writes their values and index files.
+
+    Parameters
+    ----------
+    output_dir : Path
+        The directory of the store.
+    kind : str
+        The kind of profile, "cpt" or "spt".
+    extents_df : pd.DataFrame
+        The id, nzgd_id, shallowest_depth and deepest_depth of each profile, in the
+        order they are yielded by profile_dfs.
+    profile_dfs : Iterable[pd.DataFrame]
+        The measurements of each profile, ordered by depth, with the id_column, depth
+        and channel columns.
+    channels : tuple[str, ...]
+        The names of the resampled columns.
+    id_column : str
+        The name of the column that identifies each profile.
+    grid : DepthGrid
+        The depth grid.
+    dtype : np.dtype
+        The dtype of the stored values.
+
+    Returns
+    -------
+    int
+        The number of profiles written.
+    """
+    index = np.zeros(len(extents_df), dtype=INDEX_DTYPE)
+    index["id"] = extents_df["id"].to_numpy()
+    index["nzgd_id"] = extents_df["nzgd_id"].to_numpy()
+    index_ranges = [
+        grid.index_range(shallowest_depth, deepest_depth)
+        for shallowest_depth, deepest_depth in zip(
+            extents_df["shallowest_depth"], extents_df["deepest_depth"]
+        )
+    ]
+    index["first_depth_index"] = [index_range.start for index_range in index_ranges]
+    index["length"] = [len(index_range) for index_range in index_ranges]
+    index["offset"] = np.cumsum(index["length"]) - index["length"]
+
+    # The sizes of the profiles are known from their depth extents, so the values are
+    # written straight into a memory-mapped file of the final size
+    values_path = output_dir / f"{kind}_values.npy"
+    temp_values_path = values_path.with_name(f".{values_path.name}.{os.getpid()}.tmp")
+    values = np.lib.format.open_memmap(
+        temp_values_path,
+        mode="w+",
+        dtype=dtype,
+        shape=(int(index["length"].sum()), len(channels)),
+    )
+    for position, profile_df in enumerate(profile_dfs):
+        row = index[position]
+        if profile_df[id_column].iloc[0] != row["id"]:
+            raise RuntimeError(
+                f"The measurements of {kind} {profile_df[id_column].iloc[0]} do not "
+                f"match the depth extents of {kind} {row['id']}"
+            )
+        grid_depths = grid.depths(row["first_depth_index"], row["length"])
+        values[row["offset"] : row["offset"] + row["length"]] = _resample(
+            profile_df["depth"].to_numpy(dtype=float),
+            profile_df[list(channels)].to_numpy(dtype=float),
+            grid_depths,
+        )
+    values.flush()
+    del values
+
+    index_path = output_dir / f"{kind}_index.npy"
+    temp_index_path = index_path.with_name(f".{index_path.name}.{os.getpid()}.tmp")
+    with open(temp_index_path, "wb") as index_file:
+        np.save(index_file, index)
+
+    os.replace(temp_values_path, values_path)
+    os.replace(temp_index_path, index_path)
+    return len(index)
+
+
+def build_profile_store(
+    db_path: Path,
+    output_dir: Path,
+    grid: DepthGrid | None = None,
+    dtype: str = "float32",
+) -> Path:
+    """
+    Resamples every CPT and SPT profile in the database and writes them to a store.
+
+    The CPT measurements are streamed with query.iter_cpt_measurements, so the whole
+    cptmeasurements table is never held in memory.
+
+    Parameters
+    ----------
+    db_path : Path
+        The path of the NZGD database file.
+    output_dir : Path
+        The directory to write the store to. Any existing store is overwritten.
+    grid : DepthGrid or None, optional
+        The depth grid. If None (default), a 0.02 m grid starting at the surface.
+    dtype : str, optional
+        The dtype of the stored values. Default is "float32", which halves the size of
+        the store compared to "float64".
+
+    Returns
+    -------
+    Path
+        The directory of the store.
+
+    Raises
+    ------
+    ValueError
+        If the step of the grid is not positive.
+    """
+    grid = grid or DepthGrid()
+    if grid.step <= 0:
+        raise ValueError(f"The grid step must be positive, but got {grid.step}")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with contextlib.closing(connect_read_only(db_path)) as conn:
+        db_token = snapshot.database_token(conn)
+
+        # The same soundings, in the same order, as iter_cpt_measurements
+        cpt_extents_df = read_sql(
+            """SELECT
+            cptmeasurements.cpt_id AS id,
+            cptreport.nzgd_id,
+            MIN(cptmeasurements.depth) AS shallowest_depth,
+            MAX(cptmeasurements.depth) AS deepest_depth
+            FROM cptmeasurements
+            JOIN cptreport ON cptmeasurements.cpt_id = cptreport.cpt_id
+            GROUP BY cptmeasurements.cpt_id
+            ORDER BY cptmeasurements.cpt_id ASC""",
+            conn,
+        )
+        n_cpts = _write_profiles(
+            output_dir,
+            "cpt",
+            cpt_extents_df,
+            query.iter_cpt_measurements(conn, per_sounding=True),
+            CPT_CHANNELS,
+            "cpt_id",
+            grid,
+            np.dtype(dtype),
+        )
+
+        # There are far fewer SPT measurements, so they are read at once
+        spt_measurements_df = read_sql(
+            """SELECT borehole_id, depth, n
+            FROM sptmeasurements
+            ORDER BY borehole_id ASC, depth ASC""",
+            conn,
+        )
+        spt_extents_df = (
+            spt_measurements_df.groupby("borehole_id", sort=False)["depth"]
+            .agg(shallowest_depth="min", deepest_depth="max")
+            .reset_index()
+            .rename(columns={"borehole_id": "id"})
+        )
+        # The borehole_id of an SPT is its NZGD ID
+        spt_extents_df["nzgd_id"] = spt_extents_df["id"]
+        n_spts = _write_profiles(
+            output_dir,
+            "spt",
+            spt_extents_df,
+            (
+                borehole_df
+                for _, borehole_df in spt_measurements_df.groupby(
+                    "borehole_id", sort=False
+                )
+            ),
+            SPT_CHANNELS,
+            "borehole_id",
+            grid,
+            np.dtype(dtype),
+        )
+
+    # The manifest is written last, so a store is only opened once it is complete
+    manifest_path = output_dir / MANIFEST_FILE_NAME
+    temp_manifest_path = manifest_path.with_name(
+        f".{manifest_path.name}.{os.getpid()}.tmp"
+    )
+    temp_manifest_path.write_text(
+        json.dumps(
+            {
+                "database_token": db_token,
+                "grid_start": grid.start,
+                "grid_step": grid.step,
+                "dtype": np.dtype(dtype).name,
+                "cpt_channels": list(CPT_CHANNELS),
+                "spt_channels": list(SPT_CHANNELS),
+                "n_cpts": n_cpts,
+                "n_spts": n_spts,
+            },
+            indent=2,
+        )
+    )
+    os.replace(temp_manifest_path, manifest_path)
+    return output_dir
+
+
+class ProfileStore:
+    """
+    A read-only, memory-mapped store of resampled profiles, from build_profile_store.
+
+    Parameters
+    ----------
+    store_dir : Path
+        The directory of the store.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the directory does not contain a complete store.
+    """
+
+    def __init__(self, store_dir: Path) -> None:
+        """Opens the files of the store with memory mapping."""
+        self.store_dir = Path(store_dir)
+        manifest_path = self.store_dir / MANIFEST_FILE_NAME
+        if not manifest_path.is_file():
+            raise FileNotFoundError(f"No profile store found in {self.store_dir}")
+        self.manifest = json.loads(manifest_path.read_text())
+        self.grid = DepthGrid(self.manifest["grid_start"], self.manifest["grid_step"])
+        self.cpt_channels = tuple(self.manifest["cpt_channels"])
+        self.spt_channels = tuple(self.manifest["spt_channels"])
+
+        self.cpt_values = np.load(self.store_dir / "cpt_values.npy", mmap_mode="r")
+        self.cpt_index = np.load(self.store_dir / "cpt_index.npy")
+        self.spt_values = np.load(self.store_dir / "spt_values.npy", mmap_mode="r")
+        self.spt_index = np.load(self.store_dir / "spt_index.npy")
+
+        # The row of the index of each profile, so that a profile is found in
+        # constant time
+        self._cpt_rows = {
+            cpt_id: row for row, cpt_id in enumerate(self.cpt_index["id"].tolist())
+        }
+        self._spt_rows = {
+            nzgd_id: row for row, nzgd_id in enumerate(self.spt_index["id"].tolist())
+        }
+        self._cpt_rows_of_nzgd_id: dict[int, list[int]] = {}
+        for row, nzgd_id in enumerate(self.cpt_index["nzgd_id"].tolist()):
+            self._cpt_rows_of_nzgd_id.setdefault(nzgd_id, []).append(row)
+
+    def is_stale(self, db_path: Path) -> bool:
+        """
+        Checks whether the store was built from a different version of a database file.
+
+        Parameters
+        ----------
+        db_path : Path
+            The path of the NZGD database file.
+
+        Returns
+        -------
+        bool
+            True if the database file has been modified since the store was built,
+            or if the store was built from a different file.
+        """
+        with contextlib.closing(connect_read_only(db_path)) as conn:
+            return snapshot.database_token(conn) != self.manifest["database_token"]
+
+    def _profile(self, index: np.ndarray, values: np.ndarray, row: int) -> Profile:
+        """
+        Gets the profile of a row of an index.
+
+        Parameters
+        ----------
+        index : np.ndarray
+            The CPT or SPT index.
+        values : np.ndarray
+            The CPT or SPT values.
+        row : int
+            The row of the index.
+
+        Returns
+        -------
+        Profile
+            The profile.
+        """
+        offset, length, first_depth_index = (
+            int(index["offset"][row]),
+            int(index["length"][row]),
+            int(index["first_depth_index"][row]),
+        )
+        return Profile(
+            nzgd_id=int(index["nzgd_id"][row]),
+            depth=self.grid.depths(first_depth_index, length),
+            values=values[offset : offset + length],
+        )
+
+    def cpt_profile(self, cpt_id: int) -> Profile:
+        """
+        Gets the resampled profile of a CPT sounding.
+
+        Parameters
+        ----------
+        cpt_id : int
+            The CPT ID of the sounding.
+
+        Returns
+        -------
+        Profile
+            The profile, with a column per channel in cpt_channels.
+
+        Raises
+        ------
+        KeyError
+            If the sounding is not in the store.
+        """
+        return self._profile(self.cpt_index, self.cpt_values, self._cpt_rows[cpt_id])
+
+    def cpt_profiles_for_nzgd_id(self, nzgd_id: int) -> list[Profile]:
+        """
+        Gets the resampled profiles of every CPT sounding of an NZGD record.
+
+        Parameters
+        ----------
+        nzgd_id : int
+            The NZGD ID.
+
+        Returns
+        -------
+        list[Profile]
+            The profiles, ordered by CPT ID. Empty if the record has no soundings.
+        """
+        return [
+            self._profile(self.cpt_index, self.cpt_values, row)
+            for row in self._cpt_rows_of_nzgd_id.get(nzgd_id, [])
+        ]
+
+    def spt_profile(self, nzgd_id: int) -> Profile:
+        """
+        Gets the resampled profile of an SPT borehole.
+
+        Parameters
+        ----------
+        nzgd_id : int
+            The NZGD ID of the borehole.
+
+        Returns
+        -------
+        Profile
+            The profile, with a column per channel in spt_channels.
+
+        Raises
+        ------
+        KeyError
+            If the borehole is not in the store.
+        """
+        return self._profile(self.spt_index, self.spt_values, self._spt_rows[nzgd_id])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Resample every CPT and SPT profile of the NZGD database onto a "
+        "regular depth grid, and write them to a memory-mappable store."
+    )
+    parser.add_argument("db_path", type=Path, help="Path to the NZGD SQLite database.")
+    parser.add_argument(
+        "output_dir", type=Path, help="Directory to write the store to."
+    )
+    parser.add_argument(
+        "--start", type=float, default=0.0, help="First depth of the grid in metres."
+    )
+    parser.add_argument(
+        "--step", type=float, default=0.02, help="Spacing of the grid in metres."
+    )
+    parser.add_argument("--dtype", choices=("float32", "float64"), default="float32")
+    args = parser.parse_args()
+
+    build_profile_store(
+        args.db_path,
+        args.output_dir,
+        grid=DepthGrid(args.start, args.step),
+        dtype=args.dtype,
+    )
+    print(f"Wrote the profile store to {args.output_dir}")
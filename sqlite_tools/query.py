@@ -3,14 +3,103 @@ Functions to query the NZGD SQLite database maintained by Prof. Brendon Bradley'
 research group at the University of Canterbury.
 """
 
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import math
+import re
 import sqlite3
+from collections.abc import Iterable, Iterator
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from sqlite_tools import core, read_optimised
+from sqlite_tools.connection import ConnectionPool, as_connection
+
+# The lookups are part of the core layer, and are re-exported so they can still be
+# used from this module
+from sqlite_tools.core import (  # noqa: F401
+    LOOKUP_TABLES,
+    MAX_SQL_VARIABLES,
+    clear_lookup_cache,
+    database_path,
+    lookup_id,
+    lookup_tables,
+)
+from sqlite_tools.instrumentation import instrumented, read_sql, read_sql_chunks
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    # Only imported when a function that builds a DataFrame is first called
+    np = core.LazyModule("numpy")
+    pd = core.LazyModule("pandas")
+
+
+def _read_sql_for_nzgd_ids(
+    query_template: str,
+    nzgd_ids: Iterable[int],
+    conn: sqlite3.Connection,
+    id_column: str = "nzgd_id",
+    chunk_size: int = MAX_SQL_VARIABLES,
+) -> pd.DataFrame:
+    """
+    Runs a query for many NZGD IDs using chunked IN (...) lists.
+
+    The query is run once per chunk of at most chunk_size IDs, so the number of bound
+    parameters always stays below SQLite's variable limit. The rows of the returned
+    DataFrame are ordered to follow the order of nzgd_ids, with the row order that the
+    query gives within each ID preserved. This means the result matches concatenating
+    the results of running the query for each ID in turn.
+
+    Parameters
+    ----------
+    query_template : str
+        The SQL query, containing a "{placeholders}" field where the comma-separated
+        "?" placeholders of the IN (...) list will be inserted.
+    nzgd_ids : Iterable[int]
+        The NZGD IDs to query. Duplicate IDs are only queried once.
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    id_column : str, optional
+        The name of the column in the query result that contains the NZGD ID.
+        Default is "nzgd_id".
+    chunk_size : int, optional
+        The maximum number of IDs per query. Default is MAX_SQL_VARIABLES.
+
+    Returns
+    -------
+    pd.DataFrame
+        The concatenated query results.
+    """
+    unique_ids = core.normalise_nzgd_ids(nzgd_ids)
+    if not unique_ids:
+        # Run the query with an empty IN list to get an empty DataFrame with the correct columns
+        return read_sql(query_template.format(placeholders=""), conn)
+
+    chunk_dfs = []
+    for chunk in core.chunks(unique_ids, chunk_size):
+        placeholders = ",".join("?" * len(chunk))
+        chunk_df = read_sql(
+            query_template.format(placeholders=placeholders), conn, params=chunk
+        )
+        # Reorder the rows to follow the order of the requested IDs. A stable sort keeps
+        # the query's own row order (e.g., by depth) within each ID.
+        id_position = {nzgd_id: position for position, nzgd_id in enumerate(chunk)}
+        sort_key = chunk_df[id_column].map(id_position).to_numpy()
+        chunk_dfs.append(chunk_df.iloc[np.argsort(sort_key, kind="stable")])
 
-import numpy as np
-import pandas as pd
+    # Chunks without any matching rows are dropped before concatenating, as their
+    # columns have the object dtype and would otherwise upcast the other chunks
+    non_empty_chunk_dfs = [chunk_df for chunk_df in chunk_dfs if not chunk_df.empty]
+    return pd.concat(non_empty_chunk_dfs or chunk_dfs[:1], ignore_index=True)
 
 
+@instrumented
 def cpt_measurements_for_one_nzgd(
-    selected_nzgd_id: int, conn: sqlite3.Connection
+    selected_nzgd_id: int, conn: sqlite3.Connection | ConnectionPool
 ) -> pd.DataFrame:
     """
     Extracts CPT measurements from the SQLite database for a given NZGD ID.
@@ -21,34 +110,120 @@ def cpt_measurements_for_one_nzgd(
     ----------
     selected_nzgd_id : int
         The selected CPT ID.
-    conn : sqlite3.Connection
-        The SQLite database connection.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
 
     Returns
     -------
     pd.DataFrame
         A DataFrame containing the CPT measurements and metadata as columns.
     """
+    conn = as_connection(conn)
 
-    query = """SELECT 
-    cptmeasurements.depth,
-    cptmeasurements.qc,
-    cptmeasurements.fs,
-    cptmeasurements.u2,
-    cptmeasurements.cpt_id,
-    cptreport.nzgd_id
-    FROM cptmeasurements
-    JOIN cptreport ON cptmeasurements.cpt_id = cptreport.cpt_id
-    WHERE cptreport.nzgd_id = ?
-    ORDER BY cptmeasurements.depth ASC;"""
-
-    cpt_measurements_df = pd.read_sql(query, conn, params=(selected_nzgd_id,))
+    cpt_measurements_df = read_sql(
+        core.CPT_MEASUREMENTS_QUERY, conn, params=(selected_nzgd_id,)
+    )
 
     return cpt_measurements_df
 
 
+@instrumented
+def cpt_measurements_for_nzgd_ids(
+    nzgd_ids: Iterable[int], conn: sqlite3.Connection | ConnectionPool
+) -> pd.DataFrame:
+    """
+    Extracts CPT measurements from the SQLite database for many NZGD IDs.
+    This is the batched equivalent of cpt_measurements_for_one_nzgd, and gives the same
+    result as concatenating the output of cpt_measurements_for_one_nzgd for each NZGD ID.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame containing the CPT measurements and metadata as columns,
+        ordered by the given NZGD IDs and then by depth.
+    """
+    conn = as_connection(conn)
+
+    return _read_sql_for_nzgd_ids(
+        core.CPT_MEASUREMENTS_FOR_NZGD_IDS_QUERY, nzgd_ids, conn
+    )
+
+
+def iter_cpt_measurements(
+    conn: sqlite3.Connection | ConnectionPool,
+    chunk_size: int = 100_000,
+    per_sounding: bool = True,
+) -> Iterator[pd.DataFrame]:
+    """
+    Streams the CPT measurements of the whole database, ordered by cpt_id and depth.
+
+    The measurements are read from the database in chunks of chunk_size rows, so
+    the whole cptmeasurements table is never held in memory at once. This makes it
+    suitable for processing every CPT in the database.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    chunk_size : int, optional
+        The number of rows to read from the database at a time. Default is 100,000.
+    per_sounding : bool, optional
+        If True (default), each yielded DataFrame contains all of the measurements of
+        exactly one CPT sounding (cpt_id). If False, each yielded DataFrame contains
+        chunk_size rows (except for the last one), which may span several soundings.
+
+    Yields
+    ------
+    pd.DataFrame
+        A DataFrame with the same columns as cpt_measurements_for_one_nzgd.
+
+    Notes
+    -----
+    When per_sounding is True, the rows of a sounding that spans a chunk boundary are
+    held until the sounding is complete, so peak memory is bounded by the larger of
+    chunk_size and the number of measurements in the longest sounding.
+    """
+    conn = as_connection(conn)
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, but got {chunk_size}")
+
+    chunks = read_sql_chunks(core.ALL_CPT_MEASUREMENTS_QUERY, conn, chunk_size)
+
+    if not per_sounding:
+        yield from chunks
+        return
+
+    # The rows of the last sounding in a chunk may continue in the next chunk,
+    # so they are carried over until the next chunk starts with a different cpt_id
+    incomplete_sounding_df = None
+    for chunk_df in chunks:
+        if chunk_df.empty:
+            # A database without any measurements is read as one empty chunk
+            continue
+        if incomplete_sounding_df is not None:
+            chunk_df = pd.concat([incomplete_sounding_df, chunk_df], ignore_index=True)
+
+        cpt_ids = chunk_df["cpt_id"].to_numpy()
+        in_last_sounding = cpt_ids == cpt_ids[-1]
+        incomplete_sounding_df = chunk_df[in_last_sounding]
+
+        for _, sounding_df in chunk_df[~in_last_sounding].groupby("cpt_id", sort=False):
+            yield sounding_df.reset_index(drop=True)
+
+    if incomplete_sounding_df is not None and not incomplete_sounding_df.empty:
+        yield incomplete_sounding_df.reset_index(drop=True)
+
+
+@instrumented
 def spt_measurements_for_one_nzgd(
-    selected_nzgd_id: int, conn: sqlite3.Connection
+    selected_nzgd_id: int, conn: sqlite3.Connection | ConnectionPool
 ) -> pd.DataFrame:
     """
     Extracts SPT measurements from the SQLite database for a given NZGD ID.
@@ -57,30 +232,57 @@ def spt_measurements_for_one_nzgd(
     ----------
     selected_nzgd_id : int
         The selected NZGD ID.
-    conn : sqlite3.Connection
-        The SQLite database connection.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
 
     Returns
     -------
     pd.DataFrame
         A DataFrame containing the SPT.
     """
+    conn = as_connection(conn)
 
-    query = """SELECT 
-    sptmeasurements.depth,
-    sptmeasurements.n,
-    sptmeasurements.borehole_id AS nzgd_id
-    FROM sptmeasurements
-    WHERE sptmeasurements.borehole_id = ?
-    ORDER BY sptmeasurements.depth ASC;"""
-
-    spt_measurements_df = pd.read_sql(query, conn, params=(selected_nzgd_id,))
+    spt_measurements_df = read_sql(
+        core.SPT_MEASUREMENTS_QUERY, conn, params=(selected_nzgd_id,)
+    )
 
     return spt_measurements_df
 
 
+@instrumented
+def spt_measurements_for_nzgd_ids(
+    nzgd_ids: Iterable[int], conn: sqlite3.Connection | ConnectionPool
+) -> pd.DataFrame:
+    """
+    Extracts SPT measurements from the SQLite database for many NZGD IDs.
+    This is the batched equivalent of spt_measurements_for_one_nzgd, and gives the same
+    result as concatenating the output of spt_measurements_for_one_nzgd for each NZGD ID.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame containing the SPT measurements, ordered by the given NZGD IDs
+        and then by depth.
+    """
+    conn = as_connection(conn)
+
+    return _read_sql_for_nzgd_ids(
+        core.SPT_MEASUREMENTS_FOR_NZGD_IDS_QUERY, nzgd_ids, conn
+    )
+
+
+@instrumented
 def spt_soil_types_for_one_nzgd(
-    selected_nzgd_id: int, conn: sqlite3.Connection
+    selected_nzgd_id: int,
+    conn: sqlite3.Connection | ConnectionPool,
+    format_layer_thickness: bool = True,
 ) -> pd.DataFrame:
     """
     Extracts soil types for a given NZGD ID from the SQLite database.
@@ -89,54 +291,157 @@ def spt_soil_types_for_one_nzgd(
     ----------
     selected_nzgd_id : int
         The selected NZGD ID.
-    conn : sqlite3.Connection
-        The SQLite database connection.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    format_layer_thickness : bool, optional
+        If True (default), the layer thicknesses are formatted for display with
+        format_layer_thickness_strings. If False, they are left as floats, with NaN for the
+        last layer.
 
     Returns
     -------
     pd.DataFrame
         A DataFrame containing the soil types and related metadata.
     """
+    return spt_soil_types_for_nzgd_ids(
+        [selected_nzgd_id], conn, format_layer_thickness=format_layer_thickness
+    )
 
-    # SQL query to join multiple tables and extract soil types for the given NZGD ID
-    query = """SELECT *
-    FROM sptreport
-    JOIN soilmeasurements ON soilmeasurements.report_id = sptreport.borehole_id
-    JOIN soilmeasurementsoiltype ON soilmeasurementsoiltype.soil_measurement_id = soilmeasurements.measurement_id
-    JOIN soiltypes ON soilmeasurementsoiltype.soil_type_id = soiltypes.id
-    WHERE sptreport.borehole_id = ?
-    ORDER BY soilmeasurements.top_depth ASC;"""
-
-    spt_soil_types_df = pd.read_sql(query, conn, params=(selected_nzgd_id,))
-
-    spt_soil_types_df.rename(columns={"name": "soil_type"}, inplace=True)
 
-    spt_soil_types_df = spt_soil_types_df[["nzgd_id", "top_depth", "soil_type"]]
+@instrumented
+def spt_soil_types_for_nzgd_ids(
+    nzgd_ids: Iterable[int],
+    conn: sqlite3.Connection | ConnectionPool,
+    format_layer_thickness: bool = True,
+) -> pd.DataFrame:
+    """
+    Extracts soil types for many NZGD IDs from the SQLite database.
+    This is the batched equivalent of spt_soil_types_for_one_nzgd, and gives the same
+    result as concatenating the output of spt_soil_types_for_one_nzgd for each NZGD ID.
 
-    # round top_depth to 3 decimals to avoid floating point precision issues
-    spt_soil_types_df["top_depth"] = spt_soil_types_df["top_depth"].round(4)
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    format_layer_thickness : bool, optional
+        If True (default), the layer thicknesses are formatted for display with
+        format_layer_thickness_strings. If False, they are left as floats, with NaN for the
+        last layer of each borehole.
 
-    # If a single soil layer has multiple soil types, concatenate them into a single string
-    spt_soil_types_df = spt_soil_types_df.groupby(
-        "top_depth", sort=False, as_index=False
-    ).agg({"nzgd_id": "first", "soil_type": lambda x: " + ".join(x)})
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame containing the soil types and related metadata, ordered by the
+        given NZGD IDs and then by depth.
+    """
+    conn = as_connection(conn)
 
-    # Shift the diffs back by one row so that the first row has the correct layer thickness
-    spt_soil_types_df["layer_thickness"] = (
-        spt_soil_types_df["top_depth"].diff().shift(-1)
+    spt_soil_types_df = _read_sql_for_nzgd_ids(
+        core.SPT_SOIL_TYPES_QUERY, nzgd_ids, conn
     )
 
-    # set the last_layer's thickness from nan to be "not available"
-    # and convert the layer thickness to strings of 4 decimal places
-    spt_soil_types_df["layer_thickness"] = spt_soil_types_df["layer_thickness"].apply(
-        lambda x: "not available" if pd.isna(x) else f"{float(x):.4f}"
-    )
+    if format_layer_thickness:
+        spt_soil_types_df["layer_thickness"] = format_layer_thickness_strings(
+            spt_soil_types_df["layer_thickness"]
+        )
 
     return spt_soil_types_df
 
 
+def format_layer_thickness_strings(layer_thickness: pd.Series) -> pd.Series:
+    """
+    Formats soil layer thicknesses for display.
+
+    Parameters
+    ----------
+    layer_thickness : pd.Series
+        The layer thicknesses as floats, with NaN where the thickness is not known.
+
+    Returns
+    -------
+    pd.Series
+        The thicknesses as strings with 4 decimal places, and "not available"
+        where the thickness is not known.
+    """
+    thickness_values = layer_thickness.to_numpy(dtype=float)
+    formatted = np.char.mod("%.4f", thickness_values).astype(object)
+    formatted[np.isnan(thickness_values)] = "not available"
+    return pd.Series(formatted, index=layer_thickness.index, name=layer_thickness.name)
+
+
+# The string columns of the Vs30 DataFrames that have few unique values compared to their
+# number of rows, so they are stored much more compactly as categoricals. record_name has
+# one value per record, but a record can have several rows (one per CPT), and its categories
+# are shared by the copies that pandas makes of the DataFrame when filtering it.
+COMPACT_CATEGORICAL_COLUMNS = (
+    "type_prefix",
+    "original_reference",
+    "investigation_date",
+    "published_date",
+    "region",
+    "district",
+    "city",
+    "suburb",
+    "record_name",
+    "cpt_file",
+    "borehole_file",
+    "cpt_to_vs_correlation",
+    "spt_to_vs_correlation",
+    "vs_to_vs30_correlation",
+    "hammer_type",
+)
+
+
+def compact_dtypes(
+    df: pd.DataFrame, categorical_columns: Iterable[str] = COMPACT_CATEGORICAL_COLUMNS
+) -> pd.DataFrame:
+    """
+    Converts the columns of a DataFrame to more memory-efficient dtypes.
+
+    String columns are converted to categoricals, integer columns are downcast to the
+    smallest integer dtype that holds their values, and float64 columns are downcast to
+    float32 only if no value changes in doing so. The values of the DataFrame are
+    therefore unchanged, apart from the string columns being categoricals.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame, such as one returned by all_vs30s_given_correlations.
+    categorical_columns : Iterable[str], optional
+        The names of the columns to convert to categoricals. Columns that are not in
+        the DataFrame are ignored. Default is COMPACT_CATEGORICAL_COLUMNS.
+
+    Returns
+    -------
+    pd.DataFrame
+        A new DataFrame with the compact dtypes.
+    """
+    compact_columns = {}
+    for column in categorical_columns:
+        if column in df.columns:
+            compact_columns[column] = df[column].astype("category")
+
+    for column in df.select_dtypes(include="integer").columns:
+        compact_columns[column] = pd.to_numeric(df[column], downcast="integer")
+
+    for column in df.select_dtypes(include="float64").columns:
+        values = df[column].to_numpy()
+        float32_values = values.astype(np.float32)
+        # Values with more precision than float32 would be rounded, so those
+        # columns are kept as float64
+        if np.array_equal(float32_values, values, equal_nan=True):
+            compact_columns[column] = pd.Series(
+                float32_values, index=df.index, name=column
+            )
+
+    return df.assign(**compact_columns)
+
+
+@instrumented
 def cpt_vs30s_for_one_nzgd_id(
-    selected_nzgd_id: int, conn: sqlite3.Connection
+    selected_nzgd_id: int, conn: sqlite3.Connection | ConnectionPool
 ) -> pd.DataFrame:
     """
     Extracts Vs30 values for a given CPT ID from the SQLite database.
@@ -147,60 +452,78 @@ def cpt_vs30s_for_one_nzgd_id(
     ----------
     selected_nzgd_id : int
         The selected NZGD ID.
-    conn : sqlite3.Connection
-        The SQLite database connection.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
 
     Returns
     -------
     pd.DataFrame
         A DataFrame containing the Vs30 values and related metadata.
     """
+    conn = as_connection(conn)
 
-    query = """SELECT 
-    cptvs30estimates.cpt_id,
-    cptvs30estimates.nzgd_id,
-    cptvs30estimates.vs30,
-    cptvs30estimates.vs30_stddev, 
-    cptreport.cpt_file,
-    cptreport.tip_net_area_ratio,
-    cptreport.measured_gwl,
-    cptreport.deepest_depth,
-    cptreport.shallowest_depth,   
-    cpttovscorrelation.name AS cpt_to_vs_correlation,
-    vstovs30correlation.name AS vs_to_vs30_correlation,
-    nzgdrecord.type_prefix,    
-    nzgdrecord.original_reference,
-    nzgdrecord.investigation_date,
-    nzgdrecord.published_date,
-    nzgdrecord.latitude,
-    nzgdrecord.longitude,
-    nzgdrecord.model_vs30_foster_2019,
-    nzgdrecord.model_vs30_stddev_foster_2019,
-    nzgdrecord.model_gwl_westerhoff_2019,
-    region.name AS region,
-    district.name AS district,
-    city.name AS city,
-    suburb.name AS suburb
-    FROM cptvs30estimates
-    JOIN cpttovscorrelation 
-      ON cptvs30estimates.cpt_to_vs_correlation_id = cpttovscorrelation.cpt_to_vs_correlation_id
-    JOIN vstovs30correlation 
-      ON cptvs30estimates.vs_to_vs30_correlation_id = vstovs30correlation.vs_to_vs30_correlation_id
-    JOIN cptreport
-      ON cptvs30estimates.cpt_id = cptreport.cpt_id
-    JOIN nzgdrecord
-      ON cptvs30estimates.nzgd_id = nzgdrecord.nzgd_id
-    JOIN region
-        ON nzgdrecord.region_id = region.region_id
-    JOIN district
-        ON nzgdrecord.district_id = district.district_id
-    JOIN suburb
-        ON nzgdrecord.suburb_id = suburb.suburb_id
-    JOIN city
-        ON nzgdrecord.city_id = city.city_id
-    WHERE cptvs30estimates.nzgd_id = ?;"""
-
-    cpt_vs30_df = pd.read_sql(query, conn, params=(selected_nzgd_id,))
+    query = (
+        core.CPT_VS30_QUERY
+        + """
+    WHERE cptvs30estimates.nzgd_id = ?"""
+        + core.CPT_VS30_ORDER_BY
+    )
+
+    cpt_vs30_df = read_sql(query, conn, params=(selected_nzgd_id,))
+
+    return _add_cpt_vs30_columns(cpt_vs30_df)
+
+
+@instrumented
+def cpt_vs30s_for_nzgd_ids(
+    nzgd_ids: Iterable[int], conn: sqlite3.Connection | ConnectionPool
+) -> pd.DataFrame:
+    """
+    Extracts Vs30 values for many NZGD IDs from the SQLite database.
+    This is the batched equivalent of cpt_vs30s_for_one_nzgd_id, and gives the same
+    result as concatenating the output of cpt_vs30s_for_one_nzgd_id for each NZGD ID.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame containing the Vs30 values and related metadata, ordered by the
+        given NZGD IDs.
+    """
+    conn = as_connection(conn)
+
+    query = (
+        core.CPT_VS30_QUERY
+        + """
+    WHERE cptvs30estimates.nzgd_id IN ({placeholders})"""
+        + core.CPT_VS30_ORDER_BY
+    )
+
+    cpt_vs30_df = _read_sql_for_nzgd_ids(query, nzgd_ids, conn)
+
+    return _add_cpt_vs30_columns(cpt_vs30_df)
+
+
+def _add_cpt_vs30_columns(cpt_vs30_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the derived columns needed for the web app to a DataFrame of CPT Vs30 values.
+
+    Parameters
+    ----------
+    cpt_vs30_df : pd.DataFrame
+        A DataFrame of CPT Vs30 values from a query using core.CPT_VS30_QUERY.
+
+    Returns
+    -------
+    pd.DataFrame
+        The DataFrame with the added and renamed columns.
+    """
 
     # Add columns needed for the web app
     cpt_vs30_df["record_name"] = (
@@ -236,8 +559,9 @@ def cpt_vs30s_for_one_nzgd_id(
     return cpt_vs30_df
 
 
+@instrumented
 def spt_vs30s_for_one_nzgd_id(
-    selected_nzgd_id: int, conn: sqlite3.Connection
+    selected_nzgd_id: int, conn: sqlite3.Connection | ConnectionPool
 ) -> pd.DataFrame:
     """
     Extracts Vs30 values for a given SPT ID from the SQLite database.
@@ -246,69 +570,86 @@ def spt_vs30s_for_one_nzgd_id(
     ----------
     selected_nzgd_id : int
         The selected NZGD ID.
-    conn : sqlite3.Connection
-        The SQLite database connection.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
 
     Returns
     -------
     pd.DataFrame
         A DataFrame containing the Vs30 values and related metadata.
     """
-    query = """SELECT
-    sptvs30estimates.spt_id,
-    sptvs30estimates.borehole_diameter AS spt_borehole_diameter_for_vs30_calculation,
-    sptvs30estimates.vs30,    
-    sptvs30estimates.vs30_stddev,
-    sptvs30estimates.vs30_used_efficiency AS spt_vs30_calculation_used_efficiency,
-    sptvs30estimates.vs30_used_soil_info AS spt_vs30_calculation_used_soil_info,
-    sptreport.borehole_file,
-    sptreport.efficiency as spt_efficiency,
-    sptreport.borehole_diameter as spt_borehole_diameter,
-    sptreport.measured_gwl,
-    spttovscorrelation.name AS spt_to_vs_correlation,
-    vstovs30correlation.name AS vs_to_vs30_correlation,
-    nzgdrecord.type_prefix,
-    nzgdrecord.original_reference,
-    nzgdrecord.investigation_date,
-    nzgdrecord.published_date,
-    nzgdrecord.latitude,
-    nzgdrecord.longitude,
-    nzgdrecord.model_vs30_foster_2019,
-    nzgdrecord.model_vs30_stddev_foster_2019,
-    nzgdrecord.model_gwl_westerhoff_2019,
-    spttovs30hammertype.name AS hammer_type,
-    region.name AS region,
-    district.name AS district,
-    city.name AS city,
-    suburb.name AS suburb
-    FROM sptvs30estimates
-    JOIN spttovscorrelation
-      ON sptvs30estimates.spt_to_vs_correlation_id = spttovscorrelation.correlation_id
-    JOIN vstovs30correlation
-      ON sptvs30estimates.vs_to_vs30_correlation_id = vstovs30correlation.vs_to_vs30_correlation_id
-    JOIN sptreport
-      ON sptvs30estimates.spt_id = sptreport.borehole_id
-    JOIN spttovs30hammertype
-      ON sptvs30estimates.hammer_type_id = spttovs30hammertype.hammer_id
-    JOIN nzgdrecord
-      ON sptvs30estimates.spt_id = nzgdrecord.nzgd_id
-    JOIN region
-        ON nzgdrecord.region_id = region.region_id
-    JOIN district
-        ON nzgdrecord.district_id = district.district_id
-    JOIN suburb
-        ON nzgdrecord.suburb_id = suburb.suburb_id
-    JOIN city
-        ON nzgdrecord.city_id = city.city_id
-    WHERE sptvs30estimates.spt_id = ?;"""
-
-    spt_vs30_df = pd.read_sql(query, conn, params=(selected_nzgd_id,))
+    conn = as_connection(conn)
+    query = (
+        core.SPT_VS30_QUERY
+        + """
+    WHERE sptvs30estimates.spt_id = ?"""
+        + core.SPT_VS30_ORDER_BY
+    )
+
+    spt_vs30_df = read_sql(query, conn, params=(selected_nzgd_id,))
+    spt_vs30_df.rename(columns={"spt_id": "nzgd_id"}, inplace=True)
+
+    return _add_spt_vs30_columns(spt_vs30_df)
+
+
+@instrumented
+def spt_vs30s_for_nzgd_ids(
+    nzgd_ids: Iterable[int], conn: sqlite3.Connection | ConnectionPool
+) -> pd.DataFrame:
+    """
+    Extracts Vs30 values for many NZGD IDs from the SQLite database.
+    This is the batched equivalent of spt_vs30s_for_one_nzgd_id, and gives the same
+    result as concatenating the output of spt_vs30s_for_one_nzgd_id for each NZGD ID.
+
+    Parameters
+    ----------
+    nzgd_ids : Iterable[int]
+        The selected NZGD IDs.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame containing the Vs30 values and related metadata, ordered by the
+        given NZGD IDs.
+    """
+    conn = as_connection(conn)
+
+    query = (
+        core.SPT_VS30_QUERY
+        + """
+    WHERE sptvs30estimates.spt_id IN ({placeholders})"""
+        + core.SPT_VS30_ORDER_BY
+    )
+
+    spt_vs30_df = _read_sql_for_nzgd_ids(query, nzgd_ids, conn, id_column="spt_id")
     spt_vs30_df.rename(columns={"spt_id": "nzgd_id"}, inplace=True)
 
-    spt_measurements_df = spt_measurements_for_one_nzgd(selected_nzgd_id, conn)
+    return _add_spt_vs30_columns(spt_vs30_df)
+
+
+def _add_spt_vs30_columns(spt_vs30_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the derived columns needed for the web app to a DataFrame of SPT Vs30 values.
+
+    Parameters
+    ----------
+    spt_vs30_df : pd.DataFrame
+        A DataFrame of SPT Vs30 values from a query using core.SPT_VS30_QUERY,
+        with spt_id renamed to nzgd_id.
+
+    Returns
+    -------
+    pd.DataFrame
+        The DataFrame with the added columns.
+    """
 
-    spt_vs30_df["deepest_depth"] = spt_measurements_df["depth"].max()
-    spt_vs30_df["shallowest_depth"] = spt_measurements_df["depth"].min()
+    # Boreholes without measurements have NULL depth extents, which give an
+    # object column if every row is NULL
+    for column in ["deepest_depth", "shallowest_depth"]:
+        if spt_vs30_df[column].dtype == object:
+            spt_vs30_df[column] = spt_vs30_df[column].astype(float)
 
     # Add columns needed for the web app
     spt_vs30_df["record_name"] = (
@@ -326,241 +667,1176 @@ def spt_vs30s_for_one_nzgd_id(
     return spt_vs30_df
 
 
-def all_vs30s_given_correlations(
+# The columns returned by all_vs30s_given_correlations and filtered_vs30s, in order. Each
+# column maps to the SQL expressions that select it in the CPT and SPT queries, which are
+# None for columns that only apply to the other type of record, and for the columns that
+# are derived in pandas after the query. The table aliases are those of _VS30_JOINS.
+VS30_COLUMNS = {
+    "cpt_id": ("sf.cpt_id", None),
+    "nzgd_id": ("sf.nzgd_id", "tf.spt_id"),
+    "vs30": ("sf.vs30", "tf.vs30"),
+    "vs30_stddev": ("sf.vs30_stddev", "tf.vs30_stddev"),
+    "type_prefix": ("n.type_prefix", "n.type_prefix"),
+    "original_reference": ("n.original_reference", "n.original_reference"),
+    "investigation_date": ("n.investigation_date", "n.investigation_date"),
+    "published_date": ("n.published_date", "n.published_date"),
+    "latitude": ("n.latitude", "n.latitude"),
+    "longitude": ("n.longitude", "n.longitude"),
+    "model_vs30_foster_2019": ("n.model_vs30_foster_2019", "n.model_vs30_foster_2019"),
+    "model_vs30_stddev_foster_2019": (
+        "n.model_vs30_stddev_foster_2019",
+        "n.model_vs30_stddev_foster_2019",
+    ),
+    "model_gwl_westerhoff_2019": (
+        "n.model_gwl_westerhoff_2019",
+        "n.model_gwl_westerhoff_2019",
+    ),
+    "cpt_tip_net_area_ratio": ("cr.tip_net_area_ratio", None),
+    "measured_gwl": ("cr.measured_gwl", "sr.measured_gwl"),
+    "deepest_depth": ("cr.deepest_depth", "de.deepest_depth"),
+    "shallowest_depth": ("cr.shallowest_depth", "de.shallowest_depth"),
+    "region": ("r.name", "r.name"),
+    "district": ("d.name", "d.name"),
+    "suburb": ("sub.name", "sub.name"),
+    "city": ("cty.name", "cty.name"),
+    "record_name": (None, None),
+    "vs30_log_residual": (None, None),
+    "gwl_residual": (None, None),
+    "spt_efficiency": (None, "sr.efficiency"),
+    "spt_borehole_diameter": (None, "sr.borehole_diameter"),
+    "type_number_code": (None, None),
+}
+
+# The columns that each derived column is calculated from
+_DERIVED_VS30_COLUMNS = {
+    "record_name": ("type_prefix", "nzgd_id"),
+    "vs30_log_residual": ("vs30", "model_vs30_foster_2019"),
+    "gwl_residual": ("measured_gwl", "model_gwl_westerhoff_2019"),
+    "type_number_code": ("type_prefix",),
+}
+
+# The joins of the CPT and SPT queries, keyed by the alias of the joined table, in the
+# order they are joined. Only the joins whose aliases are used by the selected columns
+# and filters are included in a query.
+_VS30_JOINS = {
+    "cpt": {
+        "n": "JOIN nzgdrecord AS n ON sf.nzgd_id = n.nzgd_id",
+        "r": "JOIN region AS r ON n.region_id = r.region_id",
+        "d": "JOIN district AS d ON n.district_id = d.district_id",
+        "sub": "JOIN suburb AS sub ON n.suburb_id = sub.suburb_id",
+        "cty": "JOIN city AS cty ON n.city_id = cty.city_id",
+        "cr": "JOIN cptreport AS cr ON sf.cpt_id = cr.cpt_id",
+    },
+    "spt": {
+        "n": "JOIN nzgdrecord AS n ON tf.spt_id = n.nzgd_id",
+        "sr": "JOIN sptreport AS sr ON tf.spt_id = sr.borehole_id",
+        "r": "JOIN region AS r ON n.region_id = r.region_id",
+        "d": "JOIN district AS d ON n.district_id = d.district_id",
+        "sub": "JOIN suburb AS sub ON n.suburb_id = sub.suburb_id",
+        "cty": "JOIN city AS cty ON n.city_id = cty.city_id",
+        "de": "LEFT JOIN depth_extents AS de ON tf.spt_id = de.borehole_id",
+    },
+}
+
+# The CTEs of the CPT and SPT queries, which filter the Vs30 estimates to the selected
+# correlations and hammer type before anything is joined to them.
+# It takes too long to extract all pre-computed CPT Vs30s values from the SQLite database,
+# so we only extract the Vs30 values that were calculated with the selected Vs to Vs30 correlation
+# and the selected CPT to Vs correlation.
+# We first filter on the Vs to Vs30 correlation, as there are only two, so this halves the number of rows
+# to search through. We also only select certain columns as some like the vs30_id column are not needed, so only
+# waste time if they are selected. We also filter using the integer id values, rather than the names as strings,
+# to save time by avoiding SQLite JOIN operations with the tables that contain the string names of the correlations.
+# In testing, this query takes about 0.4 seconds to run. If this is too slow, use the Parquet snapshots
+# in sqlite_tools.snapshot instead, as reading from a parquet file was found to be 10x faster in testing.
+# There far fewer SPT Vs30 values than CPT Vs30 values, so the SPT query should be fast,
+# regardless of the query structure. The shallowest and deepest depths of each borehole are calculated
+# in SQLite, and only for the boreholes that pass the filters, rather than loading the whole
+# sptmeasurements table into Pandas.
+_VS30_CTES = {
+    "cpt": """
+    WITH filtered_data AS (
+        SELECT cpt_id, nzgd_id, cpt_to_vs_correlation_id, vs_to_vs30_correlation_id, vs30, vs30_stddev
+        FROM cptvs30estimates
+        WHERE vs_to_vs30_correlation_id = ?  -- First filter
+    ), second_filter AS (
+        SELECT cpt_id, nzgd_id, cpt_to_vs_correlation_id, vs_to_vs30_correlation_id, vs30, vs30_stddev
+        FROM filtered_data
+        WHERE cpt_to_vs_correlation_id = ?   -- Second filter{id_filter}
+    )""",
+    "spt": """
+    WITH filtered_data AS (
+        SELECT *
+        FROM sptvs30estimates
+        WHERE vs_to_vs30_correlation_id = ?  -- First filter
+    ), second_filter AS (
+        SELECT *
+        FROM filtered_data
+        WHERE spt_to_vs_correlation_id = ?   -- Second filter
+    ), third_filter AS (
+        SELECT *
+        FROM second_filter
+        WHERE hammer_type_id = ?   -- Third filter{id_filter}
+    ), depth_extents AS (
+        SELECT borehole_id, MIN(depth) AS shallowest_depth, MAX(depth) AS deepest_depth
+        FROM sptmeasurements
+        WHERE borehole_id IN (SELECT spt_id FROM third_filter)   -- Only the selected boreholes
+        GROUP BY borehole_id
+    )""",
+}
+
+_VS30_ID_COLUMNS = {"cpt": "nzgd_id", "spt": "spt_id"}
+_VS30_FROM = {"cpt": "second_filter AS sf", "spt": "third_filter AS tf"}
+
+_TABLE_ALIAS_PATTERN = re.compile(r"\b(n|r|d|sub|cty|cr|sr|de)\.")
+
+
+class Vs30Filters(NamedTuple):
+    """
+    Filters on the records returned by filtered_vs30s.
+
+    Every filter is optional, and a record is only returned if it passes all of the
+    given filters. The lower and upper bounds of the ranges are inclusive, and either
+    bound can be None to leave that side of the range open.
+    """
+
+    nzgd_ids: Iterable[int] | None = None
+    """Only the records with these NZGD IDs."""
+    type_prefixes: Iterable[str] | None = None
+    """Only the records with these type prefixes, such as "CPT", "SCPT" and "BH"."""
+    regions: Iterable[str] | None = None
+    """Only the records in these regions."""
+    districts: Iterable[str] | None = None
+    """Only the records in these districts."""
+    cities: Iterable[str] | None = None
+    """Only the records in these cities."""
+    suburbs: Iterable[str] | None = None
+    """Only the records in these suburbs."""
+    investigation_date_range: tuple[str | None, str | None] | None = None
+    """The range of investigation dates, as ISO dates such as "2011-02-22"."""
+    published_date_range: tuple[str | None, str | None] | None = None
+    """The range of published dates, as ISO dates such as "2011-02-22"."""
+    deepest_depth_range: tuple[float | None, float | None] | None = None
+    """The range of the deepest depths of the investigations, in metres."""
+    vs30_range: tuple[float | None, float | None] | None = None
+    """The range of the Vs30 estimates, in m/s."""
+    bounding_box: tuple[float, float, float, float] | None = None
+    """The min_lat, max_lat, min_lon and max_lon of the records' locations."""
+
+
+def _vs30_filter_clauses(
+    filters: Vs30Filters, column_exprs: dict[str, str | None]
+) -> tuple[list[str], list[Any]]:
+    """
+    Converts the filters (other than the NZGD IDs) into the WHERE clauses of a query.
+
+    Parameters
+    ----------
+    filters : Vs30Filters
+        The filters.
+    column_exprs : dict[str, str or None]
+        The SQL expression that selects each column in the query.
+
+    Returns
+    -------
+    clauses : list[str]
+        The SQL clauses, which are combined with AND.
+    params : list[Any]
+        The bind parameters of the clauses, in order.
+    """
+    clauses = []
+    params: list[Any] = []
+
+    for column, values in [
+        ("type_prefix", filters.type_prefixes),
+        ("region", filters.regions),
+        ("district", filters.districts),
+        ("city", filters.cities),
+        ("suburb", filters.suburbs),
+    ]:
+        if values is not None:
+            values = list(values)
+            clauses.append(f"{column_exprs[column]} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+
+    for column, value_range in [
+        ("investigation_date", filters.investigation_date_range),
+        ("published_date", filters.published_date_range),
+        ("deepest_depth", filters.deepest_depth_range),
+        ("vs30", filters.vs30_range),
+    ]:
+        if value_range is not None:
+            lower, upper = value_range
+            if lower is not None:
+                clauses.append(f"{column_exprs[column]} >= ?")
+                params.append(lower)
+            if upper is not None:
+                clauses.append(f"{column_exprs[column]} <= ?")
+                params.append(upper)
+
+    if filters.bounding_box is not None:
+        clauses.append(
+            f"{column_exprs['latitude']} BETWEEN ? AND ? "
+            f"AND {column_exprs['longitude']} BETWEEN ? AND ?"
+        )
+        params.extend(filters.bounding_box)
+
+    return clauses, params
+
+
+def _filtered_vs30s_query(
+    kind: str, filters: Vs30Filters, columns: list[str], use_sidecar: bool
+) -> tuple[str, str, list[Any]]:
+    """
+    Builds the filtered Vs30 query for the CPT or the SPT records.
+
+    Parameters
+    ----------
+    kind : str
+        The kind of query, "cpt" or "spt".
+    filters : Vs30Filters
+        The filters. The NZGD IDs are not included in the query, which has an
+        "{id_filter}" field for them instead.
+    columns : list[str]
+        The names of the columns to select. Columns that do not apply to this kind of
+        record, or that are derived in pandas, are not selected. If none of them
+        apply, the NZGD ID is selected instead.
+    use_sidecar : bool
+        If True, the query is for the read-optimised sidecar of the database.
+
+    Returns
+    -------
+    query_template : str
+        The SQL query, with an "{id_filter}" field for an extra condition on the
+        NZGD IDs. Its bind parameters are the ids of the selected correlations (and
+        hammer type for SPTs), then those of the id filter, then clause_params.
+    id_column : str
+        The SQL expression of the NZGD ID, for the id filter.
+    clause_params : list[Any]
+        The bind parameters of the other filters.
+    """
+    cpt_or_spt = 0 if kind == "cpt" else 1
+    if not use_sidecar:
+        column_exprs = {
+            column: exprs[cpt_or_spt] for column, exprs in VS30_COLUMNS.items()
+        }
+        id_column = _VS30_ID_COLUMNS[kind]
+    else:
+        # The sidecar stores every column under its output name, including the
+        # residuals, which are calculated when it is built
+        column_exprs = {
+            column: f"f.{column}"
+            if exprs[cpt_or_spt] is not None
+            or column in read_optimised.PRECOMPUTED_COLUMNS
+            else None
+            for column, exprs in VS30_COLUMNS.items()
+        }
+        id_column = "f.nzgd_id"
+    select_exprs = [
+        f"{column_exprs[column]} AS {column}"
+        for column in columns
+        if column_exprs[column] is not None
+    ]
+    if not select_exprs:
+        # None of the columns apply to this kind of record, but its rows are still
+        # returned, so the NZGD ID is selected and dropped by filtered_vs30s
+        select_exprs = [f"{column_exprs['nzgd_id']} AS nzgd_id"]
+    clauses, clause_params = _vs30_filter_clauses(filters, column_exprs)
+
+    if not use_sidecar:
+        # Only join the tables that are used by the selected columns and the filters.
+        # The region, district, suburb and city tables are joined through nzgdrecord.
+        used_aliases = set(
+            _TABLE_ALIAS_PATTERN.findall(" ".join(select_exprs + clauses))
+        )
+        if used_aliases & {"r", "d", "sub", "cty"}:
+            used_aliases.add("n")
+        joins = [
+            join for alias, join in _VS30_JOINS[kind].items() if alias in used_aliases
+        ]
+
+        query_template = (
+            _VS30_CTES[kind]
+            + f"""
+    SELECT {", ".join(select_exprs)}
+    FROM {_VS30_FROM[kind]}
+    """
+            + "\n    ".join(joins)
+        )
+        if clauses:
+            query_template += "\n    WHERE " + " AND ".join(clauses)
+    else:
+        # The estimates of the selected combination are a single range of the
+        # sidecar table's primary key, so nothing needs to be joined
+        combination_filter = " AND ".join(
+            f"f.{id_column_} = ?"
+            for id_column_ in read_optimised.COMBINATION_ID_COLUMNS[kind]
+        )
+        query_template = f"""
+    SELECT {", ".join(select_exprs)}
+    FROM {read_optimised.VS30_TABLES[kind]} AS f
+    WHERE {combination_filter}"""
+        query_template += "{id_filter}" + "".join(
+            f"\n    AND {clause}" for clause in clauses
+        )
+
+    return query_template, id_column, clause_params
+
+
+def _filtered_vs30s_for_kind(
+    kind: str,
+    correlation_ids: list[int],
+    filters: Vs30Filters,
+    columns: list[str],
+    conn: sqlite3.Connection,
+    sidecar_conn: sqlite3.Connection | None = None,
+) -> pd.DataFrame:
+    """
+    Runs the filtered Vs30 query for the CPT or the SPT records.
+
+    Parameters
+    ----------
+    kind : str
+        The kind of query, "cpt" or "spt".
+    correlation_ids : list[int]
+        The ids of the selected correlations (and hammer type for SPTs), in the order
+        of the filters in _VS30_CTES.
+    filters : Vs30Filters
+        The filters.
+    columns : list[str]
+        The names of the columns to select, which must all be selected by SQL.
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    sidecar_conn : sqlite3.Connection or None, optional
+        A connection to the read-optimised sidecar of the database, which is queried
+        instead of the database if given. Default is None.
+
+    Returns
+    -------
+    pd.DataFrame
+        The selected columns of the records that pass the filters.
+    """
+    query_template, id_column, clause_params = _filtered_vs30s_query(
+        kind, filters, columns, sidecar_conn is not None
+    )
+    if sidecar_conn is not None:
+        conn = sidecar_conn
+
+    if filters.nzgd_ids is None:
+        return read_sql(
+            query_template.format(id_filter=""),
+            conn,
+            params=correlation_ids + clause_params,
+        )
+
+    # The NZGD IDs are filtered in the CTE, before anything is joined, in chunks so that
+    # the number of bound parameters stays below SQLite's variable limit
+    nzgd_ids = core.normalise_nzgd_ids(filters.nzgd_ids)
+    chunk_size = max(1, MAX_SQL_VARIABLES - len(correlation_ids) - len(clause_params))
+    chunk_dfs = []
+    for chunk in core.chunks(nzgd_ids, chunk_size) if nzgd_ids else [[]]:
+        id_filter = f"\n        AND {id_column} IN ({','.join('?' * len(chunk))})"
+        chunk_dfs.append(
+            read_sql(
+                query_template.format(id_filter=id_filter),
+                conn,
+                params=correlation_ids + chunk + clause_params,
+            )
+        )
+    non_empty_chunk_dfs = [chunk_df for chunk_df in chunk_dfs if not chunk_df.empty]
+    return pd.concat(non_empty_chunk_dfs or chunk_dfs[:1], ignore_index=True)
+
+
+@instrumented
+def filtered_vs30s(
     selected_vs_to_vs30_correlation: str,
     selected_cpt_to_vs_correlation: str,
     selected_spt_to_vs_correlation: str,
     selected_hammer_type: str,
-    conn: sqlite3.Connection,
+    conn: sqlite3.Connection | ConnectionPool,
+    filters: Vs30Filters | None = None,
+    columns: Iterable[str] | None = None,
+    compact: bool = False,
 ) -> pd.DataFrame:
     """
-    Extracts CPT and SPT data from the SQLite database based on the selected correlations and hammer type.
+    Extracts the CPT and SPT Vs30 values of the selected correlations and hammer type,
+    for the records that pass the filters.
+
+    The filters are applied in SQL, so only the rows and columns that are returned are
+    extracted from the database, and only the tables that are needed are joined. If the
+    read-optimised sidecar of the database has been built (see
+    sqlite_tools.read_optimised), it is queried instead, without any joins.
 
     Parameters
     ----------
     selected_vs_to_vs30_correlation : str
         The selected Vs to Vs30 correlation name.
-        Available options are "boore_2004", and "boore_2011".
     selected_cpt_to_vs_correlation : str
         The selected CPT to Vs correlation name.
-        Available options are "andrus_2007_pleistocene", "andrus_2007_holocene",
-        "andrus_2007_tertiary_age_cooper_marl", "robertson_2009", "hegazy_2006",
-        "mcgann_2015", "mcgann_2018".
     selected_spt_to_vs_correlation : str
         The selected SPT to Vs correlation name.
-        Available options are "brandenberg_2010" and "kwak_2015".
     selected_hammer_type : str
         The selected hammer type name.
-        Available options are "Auto", "Safety", and "Standard".
-    conn : sqlite3.Connection
-        The SQLite database connection.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    filters : Vs30Filters or None, optional
+        The filters on the records. If None (default), every record is returned.
+    columns : Iterable[str] or None, optional
+        The names of the columns to return, in order, from VS30_COLUMNS. If None
+        (default), every column is returned.
+    compact : bool, optional
+        If True, the columns are converted to memory-efficient dtypes with
+        compact_dtypes. Default is False.
 
     Returns
     -------
     pd.DataFrame
-        A DataFrame containing the extracted data.
+        A DataFrame with the selected columns, which are the same as those of
+        all_vs30s_given_correlations.
+
+    Raises
+    ------
+    ValueError
+        If any of the selected names are not in the database, or if any of the
+        columns are not in VS30_COLUMNS.
     """
+    conn = as_connection(conn)
+    if filters is None:
+        filters = Vs30Filters()
+
+    output_columns = list(VS30_COLUMNS) if columns is None else list(columns)
+    unknown_columns = [
+        column for column in output_columns if column not in VS30_COLUMNS
+    ]
+    if unknown_columns:
+        raise ValueError(
+            f"Unknown columns {unknown_columns}. "
+            f"Valid columns are: {', '.join(VS30_COLUMNS)}"
+        )
 
-    vs_to_vs30_correlation_df = pd.read_sql("SELECT * FROM vstovs30correlation", conn)
-    cpt_to_vs_correlation_df = pd.read_sql("SELECT * FROM cpttovscorrelation", conn)
-    spt_to_vs_correlation_df = pd.read_sql("SELECT * FROM spttovscorrelation", conn)
-    hammer_type_df = pd.read_sql("SELECT * FROM spttovs30hammertype", conn)
-
-    vs_to_vs30_correlation_id_value = int(
-        vs_to_vs30_correlation_df[
-            vs_to_vs30_correlation_df["name"] == selected_vs_to_vs30_correlation
-        ]["vs_to_vs30_correlation_id"].values[0]
-    )
-    cpt_to_vs_correlation_id_value = int(
-        cpt_to_vs_correlation_df[
-            cpt_to_vs_correlation_df["name"] == selected_cpt_to_vs_correlation
-        ]["cpt_to_vs_correlation_id"].values[0]
-    )
-    spt_to_vs_correlation_id_value = int(
-        spt_to_vs_correlation_df[
-            spt_to_vs_correlation_df["name"] == selected_spt_to_vs_correlation
-        ]["correlation_id"].values[0]
-    )
-    hammer_type_id_value = int(
-        hammer_type_df[hammer_type_df["name"] == selected_hammer_type][
-            "hammer_id"
-        ].values[0]
-    )
-
-    # The SQLite query to extract the pre-computed Vs30 values.
-    # It takes too long to extract all pre-computed CPT Vs30s values from the SQLite database,
-    # so we only extract the Vs30 values that were calculated with the selected Vs to Vs30 correlation
-    # (identified by vs_to_vs30_correlation_id_value) and the selected CPT to Vs correlation
-    # (identified by cpt_to_vs_correlation_id_value).
-    # We first filter on the Vs to Vs30 correlation, as there are only two, so this halves the number of rows
-    # to search through. We also only select certain columns as some like the vs30_id column are not needed, so only
-    # waste time if they are selected. We also filter using the integer id values, rather than the names as strings,
-    # to save time by avoiding SQLite JOIN operations with the tables that contain the string names of the correlations.
-    # In testing, this query takes about 0.4 seconds to run. If this is too slow, write the required
-    # data to a parquet file and read that instead, as reading from a parquet file was found to be 10x faster in testing.
-    cpt_sql_query = """
-    WITH filtered_data AS (
-        SELECT cpt_id, nzgd_id, cpt_to_vs_correlation_id, vs_to_vs30_correlation_id, vs30, vs30_stddev
-        FROM cptvs30estimates
-        WHERE vs_to_vs30_correlation_id = ?  -- First filter
-    ), second_filter AS (
-        SELECT cpt_id, nzgd_id, cpt_to_vs_correlation_id, vs_to_vs30_correlation_id, vs30, vs30_stddev
-        FROM filtered_data
-        WHERE cpt_to_vs_correlation_id = ?   -- Second filter
-    )
-    SELECT 
-        sf.cpt_id, sf.nzgd_id, sf.vs30, sf.vs30_stddev,
-        n.type_prefix, n.original_reference, n.investigation_date, n.published_date,
-        n.latitude, n.longitude, n.model_vs30_foster_2019, n.model_vs30_stddev_foster_2019,
-        n.model_gwl_westerhoff_2019, cr.tip_net_area_ratio, cr.measured_gwl,
-        cr.deepest_depth, cr.shallowest_depth,
-        r.name AS region_name,
-        d.name AS district_name,
-        sub.name AS suburb_name,
-        cty.name AS city_name
-    FROM second_filter AS sf
-    JOIN nzgdrecord AS n
-        ON sf.nzgd_id = n.nzgd_id
-    JOIN region AS r
-        ON n.region_id = r.region_id
-    JOIN district AS d
-        ON n.district_id = d.district_id
-    JOIN suburb AS sub
-        ON n.suburb_id = sub.suburb_id
-    JOIN city AS cty
-        ON n.city_id = cty.city_id
-    JOIN cptreport AS cr
-        ON sf.cpt_id = cr.cpt_id;
-    """
-
-    # Extract the CPT data from the SQLite database and store it in a Pandas DataFrame.
-    cpt_database_df = pd.read_sql(
-        cpt_sql_query,
-        conn,
-        params=(vs_to_vs30_correlation_id_value, cpt_to_vs_correlation_id_value),
+    # Use the read-optimised sidecar if it has been built for this version of the
+    # database, as it does not need any joins, and has the residuals precalculated
+    db_path = database_path(conn)
+    sidecar_conn = read_optimised.sidecar_connection(db_path) if db_path else None
+    precomputed_columns = (
+        read_optimised.PRECOMPUTED_COLUMNS if sidecar_conn is not None else ()
     )
 
-    # Add columns needed for the web app
-    cpt_database_df["record_name"] = (
-        cpt_database_df["type_prefix"].astype(str)
-        + "_"
-        + cpt_database_df["nzgd_id"].astype(str)
+    # Also extract the columns that the derived columns are calculated from
+    query_columns = set(output_columns)
+    for column in output_columns:
+        if column not in precomputed_columns:
+            query_columns.update(_DERIVED_VS30_COLUMNS.get(column, ()))
+    query_columns = [column for column in VS30_COLUMNS if column in query_columns]
+
+    # Resolve the names to their integer ids using the cached lookup tables
+    vs_to_vs30_correlation_id_value = lookup_id(
+        conn, "vs_to_vs30_correlation", selected_vs_to_vs30_correlation
     )
-    cpt_database_df["vs30_log_residual"] = np.log(cpt_database_df["vs30"]) - np.log(
-        cpt_database_df["model_vs30_foster_2019"]
+    cpt_to_vs_correlation_id_value = lookup_id(
+        conn, "cpt_to_vs_correlation", selected_cpt_to_vs_correlation
     )
-    cpt_database_df["gwl_residual"] = (
-        cpt_database_df["measured_gwl"] - cpt_database_df["model_gwl_westerhoff_2019"]
+    spt_to_vs_correlation_id_value = lookup_id(
+        conn, "spt_to_vs_correlation", selected_spt_to_vs_correlation
     )
+    hammer_type_id_value = lookup_id(conn, "hammer_type", selected_hammer_type)
 
-    # The SQLite query to extract the SPT data.
-    # There far fewer SPT Vs30 values than CPT Vs30 values, so this should be fast,
-    # regardless of the query structure.
-    spt_sql_query = """
-    WITH filtered_data AS (
-        SELECT *
-        FROM sptvs30estimates
-        WHERE vs_to_vs30_correlation_id = ?  -- First filter
-    ), second_filter AS (
-        SELECT *
-        FROM filtered_data
-        WHERE spt_to_vs_correlation_id = ?   -- Second filter
-    ), third_filter AS (
-        SELECT *
-        FROM second_filter
-        WHERE hammer_type_id = ?   -- Second filter
-    )
-    SELECT 
-        tf.spt_id, tf.vs30, tf.vs30_stddev,
-        n.type_prefix, n.original_reference, n.investigation_date, n.published_date,
-        n.latitude, n.longitude, n.model_vs30_foster_2019, n.model_vs30_stddev_foster_2019,
-        n.model_gwl_westerhoff_2019, sr.measured_gwl, sr.efficiency, sr.borehole_diameter,
-        r.name AS region_name,
-        d.name AS district_name,
-        sub.name AS suburb_name,
-        cty.name AS city_name
-    FROM third_filter AS tf
-    JOIN nzgdrecord AS n
-        ON tf.spt_id = n.nzgd_id
-    JOIN sptreport AS sr
-        ON tf.spt_id = sr.borehole_id
-    JOIN region AS r
-        ON n.region_id = r.region_id
-    JOIN district AS d
-        ON n.district_id = d.district_id
-    JOIN suburb AS sub
-        ON n.suburb_id = sub.suburb_id
-    JOIN city AS cty
-        ON n.city_id = cty.city_id;
-    """
-
-    # Extract the SPT data from the SQLite database and store it in a Pandas DataFrame.
-    spt_partial_database_df = pd.read_sql(
-        spt_sql_query,
+    cpt_database_df = _filtered_vs30s_for_kind(
+        "cpt",
+        [vs_to_vs30_correlation_id_value, cpt_to_vs_correlation_id_value],
+        filters,
+        query_columns,
         conn,
-        params=(
+        sidecar_conn,
+    )
+    spt_database_df = _filtered_vs30s_for_kind(
+        "spt",
+        [
             vs_to_vs30_correlation_id_value,
             spt_to_vs_correlation_id_value,
             hammer_type_id_value,
+        ],
+        filters,
+        query_columns,
+        conn,
+        sidecar_conn,
+    )
+
+    # Concatenate the CPT and SPT dataframes so they can both be queried with a single Pandas query.
+    # Columns that are only relevant for CPTs will be NaN for rows for SPTs (and vice versa).
+    # Empty DataFrames are dropped first, as their columns have the object dtype.
+    database_dfs = [
+        database_df
+        for database_df in (cpt_database_df, spt_database_df)
+        if not database_df.empty
+    ]
+    database_df = pd.concat(
+        database_dfs or [cpt_database_df, spt_database_df], ignore_index=True
+    ).reindex(columns=query_columns)
+
+    # Add columns needed for the web app
+    if "record_name" in query_columns:
+        database_df["record_name"] = (
+            database_df["type_prefix"].astype(str)
+            + "_"
+            + database_df["nzgd_id"].astype(str)
+        )
+    if "vs30_log_residual" in query_columns and (
+        "vs30_log_residual" not in precomputed_columns
+    ):
+        database_df["vs30_log_residual"] = np.log(database_df["vs30"]) - np.log(
+            database_df["model_vs30_foster_2019"]
+        )
+    if "gwl_residual" in query_columns and "gwl_residual" not in precomputed_columns:
+        database_df["gwl_residual"] = (
+            database_df["measured_gwl"] - database_df["model_gwl_westerhoff_2019"]
+        )
+    if "type_number_code" in query_columns:
+        database_df["type_number_code"] = database_df["type_prefix"].map(
+            {"CPT": 0, "SCPT": 1, "BH": 2}
+        )
+
+    database_df = database_df[output_columns]
+    if compact:
+        database_df = compact_dtypes(database_df)
+
+    return database_df
+
+
+# The residuals summarised by vs30_residual_statistics, and the SQL expressions that
+# calculate them from the columns of VS30_COLUMNS
+RESIDUAL_COLUMNS = {
+    "vs30_log_residual": "ln(vs30) - ln(model_vs30_foster_2019)",
+    "gwl_residual": "measured_gwl - model_gwl_westerhoff_2019",
+}
+
+# The columns that the residuals are calculated from
+_RESIDUAL_SOURCE_COLUMNS = (
+    "vs30",
+    "model_vs30_foster_2019",
+    "measured_gwl",
+    "model_gwl_westerhoff_2019",
+)
+
+
+def _ln(value: float | None) -> float | None:
+    """
+    Calculates the natural logarithm like SQLite's ln, for builds of SQLite without it.
+
+    Parameters
+    ----------
+    value : float or None
+        The value.
+
+    Returns
+    -------
+    float or None
+        The natural logarithm, or None if the value is NULL or not positive.
+    """
+    if value is None or value <= 0:
+        return None
+    return math.log(value)
+
+
+def _ensure_ln(conn: sqlite3.Connection) -> None:
+    """
+    Registers the ln SQL function on a connection, if SQLite was built without it.
+
+    SQLite only has its math functions if it was compiled with
+    SQLITE_ENABLE_MATH_FUNCTIONS, which not every Python distribution does.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    """
+    try:
+        conn.execute("SELECT ln(1)")
+    except sqlite3.OperationalError:
+        conn.create_function("ln", 1, _ln, deterministic=True)
+
+
+@instrumented
+def vs30_residual_statistics(
+    selected_vs_to_vs30_correlation: str,
+    selected_cpt_to_vs_correlation: str,
+    selected_spt_to_vs_correlation: str,
+    selected_hammer_type: str,
+    conn: sqlite3.Connection | ConnectionPool,
+    group_by: Iterable[str] = ("region",),
+    filters: Vs30Filters | None = None,
+    quantiles: Iterable[float] = (0.1, 0.5, 0.9),
+) -> pd.DataFrame:
+    """
+    Summarises the residuals of the Vs30 values of the selected correlations and hammer
+    type, grouped by metadata columns.
+
+    The residuals are calculated and aggregated in SQLite, so only the summary table
+    is returned, and the per-record values of all_vs30s_given_correlations are never
+    loaded into pandas. The statistics are the same as those of a pandas groupby of the
+    output of filtered_vs30s, except that records whose residual cannot be calculated
+    (such as those without a measured groundwater level) are not counted, and records
+    with a missing value in a group_by column form their own group.
+
+    Parameters
+    ----------
+    selected_vs_to_vs30_correlation : str
+        The selected Vs to Vs30 correlation name.
+    selected_cpt_to_vs_correlation : str
+        The selected CPT to Vs correlation name.
+    selected_spt_to_vs_correlation : str
+        The selected SPT to Vs correlation name.
+    selected_hammer_type : str
+        The selected hammer type name.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    group_by : Iterable[str], optional
+        The columns to group by, from VS30_COLUMNS, such as "region", "district" or
+        "type_prefix". Derived columns, such as record_name, cannot be used. If empty,
+        the statistics of every record are returned as a single row.
+        Default is ("region",).
+    filters : Vs30Filters or None, optional
+        The filters on the records. If None (default), every record is included.
+    quantiles : Iterable[float], optional
+        The quantiles to calculate, between 0 and 1, with linear interpolation as in
+        pd.Series.quantile. Default is (0.1, 0.5, 0.9).
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame indexed by the group_by columns, with the count, mean, standard
+        deviation (with one degree of freedom) and quantiles of each residual in
+        RESIDUAL_COLUMNS. The columns are named like "vs30_log_residual_mean", and
+        "vs30_log_residual_q50" for the 0.5 quantile.
+
+    Raises
+    ------
+    ValueError
+        If any of the selected names are not in the database, if any of the group_by
+        columns cannot be grouped by, or if any of the quantiles are not between 0
+        and 1.
+    """
+    conn = as_connection(conn)
+    if filters is None:
+        filters = Vs30Filters()
+
+    group_by = list(group_by)
+    groupable_columns = [
+        column for column, exprs in VS30_COLUMNS.items() if exprs != (None, None)
+    ]
+    invalid_columns = [column for column in group_by if column not in groupable_columns]
+    if invalid_columns:
+        raise ValueError(
+            f"Cannot group by {invalid_columns}. "
+            f"Valid columns are: {', '.join(groupable_columns)}"
+        )
+    # Python floats, as NumPy floats cannot be bound as query parameters
+    quantiles = [float(quantile) for quantile in quantiles]
+    if any(not 0 <= quantile <= 1 for quantile in quantiles):
+        raise ValueError(f"Quantiles must be between 0 and 1, but got {quantiles}")
+
+    # Resolve the names to their integer ids using the cached lookup tables
+    vs_to_vs30_correlation_id_value = lookup_id(
+        conn, "vs_to_vs30_correlation", selected_vs_to_vs30_correlation
+    )
+    cpt_to_vs_correlation_id_value = lookup_id(
+        conn, "cpt_to_vs_correlation", selected_cpt_to_vs_correlation
+    )
+    spt_to_vs_correlation_id_value = lookup_id(
+        conn, "spt_to_vs_correlation", selected_spt_to_vs_correlation
+    )
+    hammer_type_id_value = lookup_id(conn, "hammer_type", selected_hammer_type)
+
+    db_path = database_path(conn)
+    sidecar_conn = read_optimised.sidecar_connection(db_path) if db_path else None
+    query_conn = conn if sidecar_conn is None else sidecar_conn
+    if sidecar_conn is None:
+        _ensure_ln(query_conn)
+        residual_exprs = RESIDUAL_COLUMNS
+        selected_columns = (*group_by, *_RESIDUAL_SOURCE_COLUMNS)
+    else:
+        # The sidecar stores the residuals as NumPy calculates them, where the log of
+        # 0 is -inf rather than NULL as in SQLite, so infinite residuals are NULL here
+        residual_exprs = {
+            residual: f"NULLIF(NULLIF({residual}, 9e999), -9e999)"
+            for residual in RESIDUAL_COLUMNS
+        }
+        selected_columns = (*group_by, *RESIDUAL_COLUMNS)
+
+    source_columns = [column for column in VS30_COLUMNS if column in selected_columns]
+    kind_queries = []
+    params: list[Any] = []
+    for kind, correlation_ids in [
+        ("cpt", [vs_to_vs30_correlation_id_value, cpt_to_vs_correlation_id_value]),
+        (
+            "spt",
+            [
+                vs_to_vs30_correlation_id_value,
+                spt_to_vs_correlation_id_value,
+                hammer_type_id_value,
+            ],
         ),
+    ]:
+        query_template, id_column, clause_params = _filtered_vs30s_query(
+            kind, filters, source_columns, sidecar_conn is not None
+        )
+        # The NZGD IDs are bound as a single JSON array, so there is no limit on
+        # their number and they do not need to be queried in chunks
+        id_filter = ""
+        id_params = []
+        if filters.nzgd_ids is not None:
+            id_filter = f"\n        AND {id_column} IN (SELECT value FROM json_each(?))"
+            id_params = [json.dumps(core.normalise_nzgd_ids(filters.nzgd_ids))]
+
+        # Columns that only apply to the other kind of record are NULL, as in the
+        # output of filtered_vs30s
+        cpt_or_spt = 0 if kind == "cpt" else 1
+        select_exprs = [
+            column
+            if VS30_COLUMNS[column][cpt_or_spt] is not None
+            or column in RESIDUAL_COLUMNS
+            else f"NULL AS {column}"
+            for column in source_columns
+        ]
+        kind_queries.append(
+            f"SELECT {', '.join(select_exprs)} FROM "
+            f"({query_template.format(id_filter=id_filter)}\n    )"
+        )
+        params.extend(correlation_ids + id_params + clause_params)
+
+    # Each residual is calculated in its own rows, so that the rows of each group and
+    # residual can be ranked by value for the quantiles. The mean is calculated first,
+    # so the standard deviation does not suffer from cancellation. The name of each
+    # residual is bound after the parameters of the estimates.
+    partition = ", ".join(["residual", *group_by])
+    residual_selects = [
+        f"SELECT {', '.join(['? AS residual', *group_by])}, {expr} AS value "
+        "FROM estimates"
+        for expr in residual_exprs.values()
+    ]
+    params.extend(residual_exprs)
+    # The quantiles are bound after the names of the residuals, as they are used in
+    # the final SELECT, with a parameter for each of the lower and upper positions
+    quantile_exprs = [
+        f"SUM(CASE WHEN position = {position} THEN value END) AS q{index}_{bound}"
+        for index in range(len(quantiles))
+        for bound, position in [
+            ("lower", "CAST((n - 1) * ? AS INTEGER)"),
+            ("upper", "MIN(CAST((n - 1) * ? AS INTEGER) + 1, n - 1)"),
+        ]
+    ]
+    params.extend(quantile for quantile in quantiles for _ in range(2))
+    union_all = "\n        UNION ALL\n        "
+    sql = f"""
+    WITH estimates AS (
+        {union_all.join(kind_queries)}
+    ), residuals AS (
+        {union_all.join(residual_selects)}
+    ), ranked AS (
+        SELECT
+            {partition},
+            value,
+            ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY value) - 1 AS position,
+            COUNT(*) OVER (PARTITION BY {partition}) AS n,
+            AVG(value) OVER (PARTITION BY {partition}) AS mean
+        FROM residuals
+        WHERE value IS NOT NULL
     )
+    SELECT
+        {", ".join([partition, *quantile_exprs])},
+        MAX(n) AS count,
+        MAX(mean) AS mean,
+        SUM((value - mean) * (value - mean)) AS sum_squared_deviations
+    FROM ranked
+    GROUP BY {partition}"""
+    summary_df = read_sql(sql, query_conn, params=params)
+
+    # The standard deviations and interpolated quantiles are calculated from the
+    # aggregates of each group, which are small
+    n = summary_df["count"].to_numpy(dtype=float)
+    statistics = {
+        "count": n,
+        "mean": summary_df["mean"].to_numpy(dtype=float),
+        "std": np.sqrt(
+            summary_df["sum_squared_deviations"].to_numpy(dtype=float)
+            / np.where(n > 1, n - 1, np.nan)
+        ),
+    }
+    for index, quantile in enumerate(quantiles):
+        position = (n - 1) * quantile
+        fraction = position - np.floor(position)
+        lower = summary_df[f"q{index}_lower"].to_numpy(dtype=float)
+        upper = summary_df[f"q{index}_upper"].to_numpy(dtype=float)
+        # The same linear interpolation as NumPy, which pd.Series.quantile uses
+        statistics[f"q{quantile * 100:g}"] = np.where(
+            fraction >= 0.5,
+            upper - (upper - lower) * (1 - fraction),
+            lower + (upper - lower) * fraction,
+        )
 
-    spt_measurements_df = pd.read_sql("SELECT * FROM sptmeasurements", conn)
-    # Use Pandas groupby to quickly calculate the shallowest and deepest depths for each borehole
-    depth_stats_df = (
-        spt_measurements_df.groupby("borehole_id")["depth"]
-        .agg(shallowest_depth="min", deepest_depth="max")
-        .reset_index()
+    # One row per group, with the statistics of each residual as columns. The groups
+    # are merged as columns rather than aligned on an index, so that missing values in
+    # the group_by columns are matched.
+    statistics_df = summary_df[["residual", *group_by]].assign(**statistics)
+    statistics_df = functools.reduce(
+        lambda left_df, right_df: (
+            left_df.merge(right_df, how="outer", on=group_by)
+            if group_by
+            else left_df.join(right_df)
+        ),
+        [
+            statistics_df[statistics_df["residual"] == residual]
+            .drop(columns="residual")
+            .rename(columns={name: f"{residual}_{name}" for name in statistics})
+            .reset_index(drop=True)
+            for residual in RESIDUAL_COLUMNS
+        ],
     )
+    for residual in RESIDUAL_COLUMNS:
+        # Groups without any values of a residual have a count of 0
+        count_column = f"{residual}_count"
+        statistics_df[count_column] = (
+            statistics_df[count_column].fillna(0).astype(np.int64)
+        )
 
-    spt_database_df = pd.merge(
-        spt_partial_database_df,
-        depth_stats_df,
-        left_on="spt_id",
-        right_on="borehole_id",
-        how="left",
+    if group_by:
+        statistics_df = statistics_df.sort_values(group_by).set_index(group_by)
+    return statistics_df
+
+
+# The columns of vs30s_for_correlation_combinations that identify the combination of
+# correlations and hammer type of each Vs30 estimate
+COMBINATION_COLUMNS = (
+    "vs_to_vs30_correlation",
+    "cpt_to_vs_correlation",
+    "spt_to_vs_correlation",
+    "hammer_type",
+)
+
+# The columns that differ between the Vs30 estimates of a record with different
+# correlations, which are pivoted into one column per combination in the wide format
+_PER_COMBINATION_COLUMNS = ("vs30", "vs30_stddev", "vs30_log_residual")
+
+# The estimates of every selected combination, which are read in a single pass over each
+# estimate table without joining anything to them
+_MULTI_COMBINATION_ESTIMATE_QUERIES = {
+    "cpt": """SELECT cpt_id, vs_to_vs30_correlation_id, cpt_to_vs_correlation_id,
+        vs30, vs30_stddev
+    FROM cptvs30estimates
+    WHERE vs_to_vs30_correlation_id IN ({vs_to_vs30_placeholders})
+    AND cpt_to_vs_correlation_id IN ({vs_placeholders})""",
+    "spt": """SELECT spt_id AS nzgd_id, vs_to_vs30_correlation_id,
+        spt_to_vs_correlation_id, hammer_type_id, vs30, vs30_stddev
+    FROM sptvs30estimates
+    WHERE vs_to_vs30_correlation_id IN ({vs_to_vs30_placeholders})
+    AND spt_to_vs_correlation_id IN ({vs_placeholders})
+    AND hammer_type_id IN ({hammer_type_placeholders})""",
+}
+
+# The metadata of every CPT and SPT, which is joined once per investigation rather than
+# once per Vs30 estimate. The selected columns are inserted from VS30_COLUMNS.
+_MULTI_COMBINATION_METADATA_QUERIES = {
+    "cpt": """SELECT cr.cpt_id AS cpt_id, cr.nzgd_id AS nzgd_id, {columns}
+    FROM cptreport AS cr
+    JOIN nzgdrecord AS n ON cr.nzgd_id = n.nzgd_id
+    JOIN region AS r ON n.region_id = r.region_id
+    JOIN district AS d ON n.district_id = d.district_id
+    JOIN suburb AS sub ON n.suburb_id = sub.suburb_id
+    JOIN city AS cty ON n.city_id = cty.city_id""",
+    "spt": """WITH depth_extents AS (
+        SELECT borehole_id, MIN(depth) AS shallowest_depth, MAX(depth) AS deepest_depth
+        FROM sptmeasurements
+        GROUP BY borehole_id
     )
-    spt_database_df.drop(columns="borehole_id", inplace=True)
+    SELECT sr.borehole_id AS nzgd_id, {columns}
+    FROM sptreport AS sr
+    JOIN nzgdrecord AS n ON sr.borehole_id = n.nzgd_id
+    JOIN region AS r ON n.region_id = r.region_id
+    JOIN district AS d ON n.district_id = d.district_id
+    JOIN suburb AS sub ON n.suburb_id = sub.suburb_id
+    JOIN city AS cty ON n.city_id = cty.city_id
+    LEFT JOIN depth_extents AS de ON sr.borehole_id = de.borehole_id""",
+}
+
+
+def _lookup_names(
+    conn: sqlite3.Connection, lookup: str, names: Iterable[str] | None
+) -> dict[int, str]:
+    """
+    Gets the ids of the selected names of a lookup table.
 
-    # Rename and add columns needed for the web app
-    spt_database_df.rename(columns={"spt_id": "nzgd_id"}, inplace=True)
-    spt_database_df["record_name"] = (
-        spt_database_df["type_prefix"].astype(str)
-        + "_"
-        + spt_database_df["nzgd_id"].astype(str)
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    lookup : str
+        The kind of name, from LOOKUP_TABLES.
+    names : Iterable[str] or None
+        The selected names. If None, every name in the lookup table is selected.
+
+    Returns
+    -------
+    dict[int, str]
+        The selected names, keyed by their ids.
+
+    Raises
+    ------
+    ValueError
+        If any of the names are not in the database.
+    """
+    if names is None:
+        names = lookup_tables(conn)[lookup]
+    return {lookup_id(conn, lookup, name): name for name in names}
+
+
+@instrumented
+def vs30s_for_correlation_combinations(
+    vs_to_vs30_correlations: Iterable[str] | None,
+    cpt_to_vs_correlations: Iterable[str] | None,
+    spt_to_vs_correlations: Iterable[str] | None,
+    hammer_types: Iterable[str] | None,
+    conn: sqlite3.Connection | ConnectionPool,
+    wide: bool = False,
+) -> pd.DataFrame:
+    """
+    Extracts the CPT and SPT Vs30 values of several combinations of correlations and
+    hammer types at once.
+
+    This gives the same rows as calling all_vs30s_given_correlations for every
+    combination, but each estimate table is only scanned once, and the metadata of each
+    investigation is only joined once rather than once per combination.
+
+    Parameters
+    ----------
+    vs_to_vs30_correlations : Iterable[str] or None
+        The selected Vs to Vs30 correlation names, or None for all of them.
+    cpt_to_vs_correlations : Iterable[str] or None
+        The selected CPT to Vs correlation names, or None for all of them.
+    spt_to_vs_correlations : Iterable[str] or None
+        The selected SPT to Vs correlation names, or None for all of them.
+    hammer_types : Iterable[str] or None
+        The selected hammer type names, or None for all of them.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    wide : bool, optional
+        If False (default), a long DataFrame is returned, with one row per Vs30
+        estimate and the columns of COMBINATION_COLUMNS identifying its combination.
+        CPT rows have no spt_to_vs_correlation or hammer_type, and SPT rows have no
+        cpt_to_vs_correlation. If True, a wide DataFrame is returned, with one row per
+        CPT or SPT investigation and a vs30, vs30_stddev and vs30_log_residual column
+        per combination, named like "vs30__boore_2004__mcgann_2015" for CPTs and
+        "vs30__boore_2004__kwak_2015__Auto" for SPTs.
+
+    Returns
+    -------
+    pd.DataFrame
+        The Vs30 values and the columns of all_vs30s_given_correlations.
+
+    Raises
+    ------
+    ValueError
+        If any of the selected names are not in the database.
+    """
+    conn = as_connection(conn)
+
+    vs_to_vs30_names = _lookup_names(
+        conn, "vs_to_vs30_correlation", vs_to_vs30_correlations
     )
-    spt_database_df["vs30_log_residual"] = np.log(spt_database_df["vs30"]) - np.log(
-        spt_database_df["model_vs30_foster_2019"]
+    cpt_to_vs_names = _lookup_names(
+        conn, "cpt_to_vs_correlation", cpt_to_vs_correlations
     )
-    spt_database_df["gwl_residual"] = (
-        spt_database_df["measured_gwl"] - spt_database_df["model_gwl_westerhoff_2019"]
+    spt_to_vs_names = _lookup_names(
+        conn, "spt_to_vs_correlation", spt_to_vs_correlations
     )
+    hammer_type_names = _lookup_names(conn, "hammer_type", hammer_types)
+
+    kind_dfs = []
+    for kind, vs_names, key_column in [
+        ("cpt", cpt_to_vs_names, "cpt_id"),
+        ("spt", spt_to_vs_names, "nzgd_id"),
+    ]:
+        params = list(vs_to_vs30_names) + list(vs_names)
+        if kind == "spt":
+            params += list(hammer_type_names)
+        estimates_df = read_sql(
+            _MULTI_COMBINATION_ESTIMATE_QUERIES[kind].format(
+                vs_to_vs30_placeholders=",".join("?" * len(vs_to_vs30_names)),
+                vs_placeholders=",".join("?" * len(vs_names)),
+                hammer_type_placeholders=",".join("?" * len(hammer_type_names)),
+            ),
+            conn,
+            params=params,
+        )
 
-    # Concatenate the CPT and SPT dataframes so they can both be queried with a single Pandas query.
-    # Columns that are only relevant for CPTs will be NaN for rows for SPTs (and vice versa).
-    database_df = pd.concat([cpt_database_df, spt_database_df], ignore_index=True)
+        # Replace the ids with the names of the correlations and hammer types
+        estimates_df.insert(
+            0,
+            "vs_to_vs30_correlation",
+            estimates_df.pop("vs_to_vs30_correlation_id").map(vs_to_vs30_names),
+        )
+        if kind == "cpt":
+            estimates_df.insert(
+                1,
+                "cpt_to_vs_correlation",
+                estimates_df.pop("cpt_to_vs_correlation_id").map(vs_names),
+            )
+        else:
+            estimates_df.insert(
+                1,
+                "spt_to_vs_correlation",
+                estimates_df.pop("spt_to_vs_correlation_id").map(vs_names),
+            )
+            estimates_df.insert(
+                2,
+                "hammer_type",
+                estimates_df.pop("hammer_type_id").map(hammer_type_names),
+            )
+
+        cpt_or_spt = 0 if kind == "cpt" else 1
+        metadata_columns = [
+            f"{expr} AS {column}"
+            for column, exprs in VS30_COLUMNS.items()
+            if (expr := exprs[cpt_or_spt]) is not None
+            and not expr.startswith(("sf.", "tf."))
+        ]
+        metadata_df = read_sql(
+            _MULTI_COMBINATION_METADATA_QUERIES[kind].format(
+                columns=", ".join(metadata_columns)
+            ),
+            conn,
+        )
+
+        kind_dfs.append(estimates_df.merge(metadata_df, on=key_column, how="inner"))
+
+    # Empty DataFrames are dropped before concatenating, as their columns have the object dtype
+    non_empty_kind_dfs = [kind_df for kind_df in kind_dfs if not kind_df.empty]
+    database_df = pd.concat(non_empty_kind_dfs or kind_dfs, ignore_index=True)
+    database_df = database_df.reindex(columns=[*COMBINATION_COLUMNS, *VS30_COLUMNS])
+
+    # Add columns needed for the web app
+    database_df["record_name"] = (
+        database_df["type_prefix"].astype(str)
+        + "_"
+        + database_df["nzgd_id"].astype(str)
+    )
+    database_df["vs30_log_residual"] = np.log(database_df["vs30"]) - np.log(
+        database_df["model_vs30_foster_2019"]
+    )
+    database_df["gwl_residual"] = (
+        database_df["measured_gwl"] - database_df["model_gwl_westerhoff_2019"]
+    )
     database_df["type_number_code"] = database_df["type_prefix"].map(
         {"CPT": 0, "SCPT": 1, "BH": 2}
     )
 
-    # rename the columns to match the web app and add prefixes of cpt spt to columns that only
-    # apply to one of the two types of data
-    database_df.rename(
-        columns={
-            "tip_net_area_ratio": "cpt_tip_net_area_ratio",
-            "region_name": "region",
-            "district_name": "district",
-            "suburb_name": "suburb",
-            "city_name": "city",
-            "efficiency": "spt_efficiency",
-            "borehole_diameter": "spt_borehole_diameter",
-        },
-        inplace=True,
+    if not wide:
+        return database_df
+
+    # Pivot the CPTs and SPTs separately, as CPTs are identified by their cpt_id and
+    # SPTs by their nzgd_id, and they have different combinations of correlations
+    per_investigation_columns = [
+        column for column in VS30_COLUMNS if column not in _PER_COMBINATION_COLUMNS
+    ]
+    is_cpt = database_df["cpt_id"].notna()
+    wide_dfs = []
+    for kind_df, key_column, name_columns in [
+        (
+            database_df[is_cpt],
+            "cpt_id",
+            ["vs_to_vs30_correlation", "cpt_to_vs_correlation"],
+        ),
+        (
+            database_df[~is_cpt],
+            "nzgd_id",
+            ["vs_to_vs30_correlation", "spt_to_vs_correlation", "hammer_type"],
+        ),
+    ]:
+        if kind_df.empty:
+            continue
+        combination_names = kind_df[name_columns[0]].astype(str)
+        for name_column in name_columns[1:]:
+            combination_names = (
+                combination_names + "__" + kind_df[name_column].astype(str)
+            )
+
+        values_df = kind_df.assign(combination=combination_names).pivot(
+            index=key_column,
+            columns="combination",
+            values=list(_PER_COMBINATION_COLUMNS),
+        )
+        values_df.columns = [
+            f"{value}__{combination}" for value, combination in values_df.columns
+        ]
+        investigations_df = kind_df[per_investigation_columns].drop_duplicates(
+            key_column
+        )
+        wide_dfs.append(
+            investigations_df.merge(values_df, left_on=key_column, right_index=True)
+        )
+
+    if not wide_dfs:
+        return database_df[per_investigation_columns]
+    return pd.concat(wide_dfs, ignore_index=True)
+
+
+@instrumented
+def all_vs30s_given_correlations(
+    selected_vs_to_vs30_correlation: str,
+    selected_cpt_to_vs_correlation: str,
+    selected_spt_to_vs_correlation: str,
+    selected_hammer_type: str,
+    conn: sqlite3.Connection | ConnectionPool,
+    compact: bool = False,
+) -> pd.DataFrame:
+    """
+    Extracts CPT and SPT data from the SQLite database based on the selected correlations and hammer type.
+
+    Parameters
+    ----------
+    selected_vs_to_vs30_correlation : str
+        The selected Vs to Vs30 correlation name.
+        Available options are "boore_2004", and "boore_2011".
+    selected_cpt_to_vs_correlation : str
+        The selected CPT to Vs correlation name.
+        Available options are "andrus_2007_pleistocene", "andrus_2007_holocene",
+        "andrus_2007_tertiary_age_cooper_marl", "robertson_2009", "hegazy_2006",
+        "mcgann_2015", "mcgann_2018".
+    selected_spt_to_vs_correlation : str
+        The selected SPT to Vs correlation name.
+        Available options are "brandenberg_2010" and "kwak_2015".
+    selected_hammer_type : str
+        The selected hammer type name.
+        Available options are "Auto", "Safety", and "Standard".
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    compact : bool, optional
+        If True, the columns are converted to memory-efficient dtypes with
+        compact_dtypes, which uses several times less memory. Default is False.
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame containing the extracted data.
+
+    Raises
+    ------
+    ValueError
+        If any of the selected names are not in the database.
+    """
+    return filtered_vs30s(
+        selected_vs_to_vs30_correlation,
+        selected_cpt_to_vs_correlation,
+        selected_spt_to_vs_correlation,
+        selected_hammer_type,
+        conn,
+        compact=compact,
     )
 
-    return database_df
 
-def get_westerhoff_model_gwl(conn: sqlite3.Connection, nzgd_id: int | list[int] | None = None) -> pd.DataFrame:
+@instrumented
+def get_westerhoff_model_gwl(
+    conn: sqlite3.Connection | ConnectionPool, nzgd_id: int | list[int] | None = None
+) -> pd.DataFrame:
     """
     Extracts the Westerhoff et al. (2019) model groundwater level data from the SQLite database.
 
@@ -570,8 +1846,8 @@ def get_westerhoff_model_gwl(conn: sqlite3.Connection, nzgd_id: int | list[int]
 
     Parameters
     ----------
-    conn : sqlite3.Connection
-        The SQLite database connection.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
     nzgd_id : int, list[int], or None, optional
         The NZGD ID(s) to query. If None, returns all records. If int, returns
         data for a single NZGD ID. If list[int], returns data for multiple NZGD IDs.
@@ -587,6 +1863,7 @@ def get_westerhoff_model_gwl(conn: sqlite3.Connection, nzgd_id: int | list[int]
         - model_gwl_westerhoff_2019 : float
             The Westerhoff et al. (2019) model groundwater level prediction
     """
+    conn = as_connection(conn)
 
     # If nzgd_id is None, select all
     if nzgd_id is None:
@@ -595,19 +1872,18 @@ def get_westerhoff_model_gwl(conn: sqlite3.Connection, nzgd_id: int | list[int]
         FROM nzgdrecord
         ORDER BY nzgd_id ASC
         """
-        return pd.read_sql(sql_query, conn)
+        return read_sql(sql_query, conn)
 
-    # If nzgd_id is a list, only select those in the list.
+    # If nzgd_id is a list, only select those in the list. The IDs are queried in chunks
+    # so that the number of bound parameters stays below SQLite's variable limit.
     if isinstance(nzgd_id, list):
-        # Create placeholders for the IN clause
-        placeholders = ','.join(['?' for _ in nzgd_id])
-        sql_query = f"""
+        sql_query = """
         SELECT nzgd_id, model_gwl_westerhoff_2019
         FROM nzgdrecord
         WHERE nzgd_id IN ({placeholders})
-        ORDER BY nzgd_id ASC
         """
-        return pd.read_sql(sql_query, conn, params=tuple(nzgd_id))
+        gwl_df = _read_sql_for_nzgd_ids(sql_query, nzgd_id, conn)
+        return gwl_df.sort_values("nzgd_id", ignore_index=True)
 
     # If nzgd_id is a single int, select only that one
     sql_query = """
@@ -615,4 +1891,108 @@ def get_westerhoff_model_gwl(conn: sqlite3.Connection, nzgd_id: int | list[int]
     FROM nzgdrecord
     WHERE nzgd_id = ?
     """
-    return pd.read_sql(sql_query, conn, params=(nzgd_id,))
\ No newline at end of file
+    return read_sql(sql_query, conn, params=(nzgd_id,))
+
+
+class RecordDetails(NamedTuple):
+    """
+    Everything shown on the page of one or more NZGD records.
+
+    The DataFrames have the same columns as the function named in brackets.
+    Measurements and soil types are None unless they were requested.
+    """
+
+    cpt_vs30s: pd.DataFrame
+    """The CPT Vs30 estimates (cpt_vs30s_for_nzgd_ids)."""
+    spt_vs30s: pd.DataFrame
+    """The SPT Vs30 estimates, including depth extents (spt_vs30s_for_nzgd_ids)."""
+    cpt_measurements: pd.DataFrame | None = None
+    """The CPT measurements (cpt_measurements_for_nzgd_ids)."""
+    spt_measurements: pd.DataFrame | None = None
+    """The SPT measurements (spt_measurements_for_nzgd_ids)."""
+    spt_soil_types: pd.DataFrame | None = None
+    """The SPT soil layers (spt_soil_types_for_nzgd_ids)."""
+
+
+@contextlib.contextmanager
+def _read_transaction(conn: sqlite3.Connection) -> Iterator[None]:
+    """
+    Runs the queries in the body in a single read transaction.
+
+    All of the queries then see the same snapshot of the database, and SQLite only
+    acquires the shared lock once rather than once per query. If the connection is
+    already in a transaction, that transaction is used instead.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The SQLite database connection.
+    """
+    if conn.in_transaction:
+        yield
+        return
+
+    conn.execute("BEGIN")
+    try:
+        yield
+    finally:
+        # Nothing was written, so ending the transaction either way is equivalent
+        conn.rollback()
+
+
+@instrumented
+def record_details(
+    nzgd_ids: int | Iterable[int],
+    conn: sqlite3.Connection | ConnectionPool,
+    include_measurements: bool = False,
+    include_soil_types: bool = False,
+) -> RecordDetails:
+    """
+    Extracts the Vs30 estimates, depth extents and optionally the measurements and
+    soil types of one or more NZGD records in a single read transaction.
+
+    This gives the same DataFrames as calling cpt_vs30s_for_nzgd_ids,
+    spt_vs30s_for_nzgd_ids, cpt_measurements_for_nzgd_ids,
+    spt_measurements_for_nzgd_ids and spt_soil_types_for_nzgd_ids separately, but
+    all of them come from the same snapshot of the database. Records can be CPTs
+    or SPTs, and the DataFrames for the other type are empty.
+
+    Parameters
+    ----------
+    nzgd_ids : int or Iterable[int]
+        The NZGD ID of a single record, or the NZGD IDs of many records.
+    conn : sqlite3.Connection or ConnectionPool
+        The SQLite database connection, or a pool to take a connection from.
+    include_measurements : bool, optional
+        If True, the CPT and SPT measurements are included. Default is False.
+    include_soil_types : bool, optional
+        If True, the SPT soil layers are included. Default is False.
+
+    Returns
+    -------
+    RecordDetails
+        The DataFrames of the records, ordered by the given NZGD IDs.
+    """
+    conn = as_connection(conn)
+
+    if isinstance(nzgd_ids, (int, np.integer)):
+        nzgd_ids = [nzgd_ids]
+    # Materialise the IDs once as they are used by every query
+    nzgd_ids = core.normalise_nzgd_ids(nzgd_ids)
+
+    with _read_transaction(conn):
+        details = RecordDetails(
+            cpt_vs30s=cpt_vs30s_for_nzgd_ids(nzgd_ids, conn),
+            spt_vs30s=spt_vs30s_for_nzgd_ids(nzgd_ids, conn),
+        )
+        if include_measurements:
+            details = details._replace(
+                cpt_measurements=cpt_measurements_for_nzgd_ids(nzgd_ids, conn),
+                spt_measurements=spt_measurements_for_nzgd_ids(nzgd_ids, conn),
+            )
+        if include_soil_types:
+            details = details._replace(
+                spt_soil_types=spt_soil_types_for_nzgd_ids(nzgd_ids, conn)
+            )
+
+    return details
@@ -0,0 +1,368 @@
+"""
+A denormalised, read-optimised sidecar of the NZGD database.
+
+Every Vs30 query joins the Vs30 estimates to nzgdrecord, the region, district, city and
+suburb tables, and the CPT or SPT report, and the SPT queries also calculate the depth
+extents of each borehole from sptmeasurements. The sidecar stores the result of those
+joins once, with one row per Vs30 estimate, in WITHOUT ROWID tables clustered by the
+correlation ids (and hammer type for SPTs), so the estimates of a combination of
+correlations are stored next to each other and read in a single range scan. The
+residuals of each estimate (vs30_log_residual and gwl_residual) are calculated when the
+sidecar is built, rather than on every query. The sidecar is VACUUMed after it is built,
+so its pages are contiguous.
+
+The source database changes rarely, so build the sidecar after each update with
+
+    python -m sqlite_tools.read_optimised /path/to/nzgd.db
+
+query.filtered_vs30s, query.all_vs30s_given_correlations and
+query.vs30_residual_statistics then use the sidecar whenever it is next to the database
+file and was built from the current version of it, and fall back to the source database
+otherwise. The returned DataFrames are the same either way.
+
+The per-record functions (cpt_vs30s_for_one_nzgd_id, cpt_vs30s_for_nzgd_ids and their
+SPT, measurement and soil type equivalents) deliberately do not use the sidecar. They
+already read only the few rows of the selected records through the indexes of the
+source database, so the sidecar would save little, and their results include columns
+that the sidecar does not store, such as cpt_file and the correlation names.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import math
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from sqlite_tools import core
+from sqlite_tools.connection import ConnectionPool
+
+# The tables of the sidecar, keyed by the kind of record
+VS30_TABLES = {"cpt": "cpt_vs30", "spt": "spt_vs30"}
+
+# The columns that identify the combination of correlations (and hammer type) of each
+# Vs30 estimate, in the order of the filters of the source queries
+COMBINATION_ID_COLUMNS = {
+    "cpt": ("vs_to_vs30_correlation_id", "cpt_to_vs_correlation_id"),
+    "spt": (
+        "vs_to_vs30_correlation_id",
+        "spt_to_vs_correlation_id",
+        "hammer_type_id",
+    ),
+}
+
+# The derived columns of query.VS30_COLUMNS that are calculated when the sidecar is
+# built, with the same values as query.filtered_vs30s calculates with NumPy
+PRECOMPUTED_COLUMNS = ("vs30_log_residual", "gwl_residual")
+
+# The columns are declared without types, so that every value keeps the storage class
+# it has in the source database
+_SIDECAR_SCHEMA = """
+CREATE TABLE cpt_vs30 (
+    vs_to_vs30_correlation_id INTEGER NOT NULL,
+    cpt_to_vs_correlation_id INTEGER NOT NULL,
+    vs30_id INTEGER NOT NULL,
+    cpt_id, nzgd_id, vs30, vs30_stddev,
+    type_prefix, original_reference, investigation_date, published_date,
+    latitude, longitude,
+    model_vs30_foster_2019, model_vs30_stddev_foster_2019, model_gwl_westerhoff_2019,
+    cpt_tip_net_area_ratio, measured_gwl, deepest_depth, shallowest_depth,
+    region, district, suburb, city,
+    vs30_log_residual, gwl_residual,
+    PRIMARY KEY (vs_to_vs30_correlation_id, cpt_to_vs_correlation_id, vs30_id)
+) WITHOUT ROWID;
+CREATE TABLE spt_vs30 (
+    vs_to_vs30_correlation_id INTEGER NOT NULL,
+    spt_to_vs_correlation_id INTEGER NOT NULL,
+    hammer_type_id INTEGER NOT NULL,
+    vs30_id INTEGER NOT NULL,
+    nzgd_id, vs30, vs30_stddev,
+    type_prefix, original_reference, investigation_date, published_date,
+    latitude, longitude,
+    model_vs30_foster_2019, model_vs30_stddev_foster_2019, model_gwl_westerhoff_2019,
+    measured_gwl, deepest_depth, shallowest_depth,
+    region, district, suburb, city,
+    spt_efficiency, spt_borehole_diameter,
+    vs30_log_residual, gwl_residual,
+    PRIMARY KEY (
+        vs_to_vs30_correlation_id, spt_to_vs_correlation_id, hammer_type_id, vs30_id
+    )
+) WITHOUT ROWID;
+CREATE TABLE source_database (
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    wal_size INTEGER NOT NULL,
+    wal_mtime_ns INTEGER NOT NULL
+);
+"""
+
+# The estimates are inserted in the order of their vs30_id, which is the order the
+# source queries return them in, so the sidecar gives the same row order
+_INSERT_CPT_VS30 = """
+INSERT INTO cpt_vs30
+SELECT
+    e.vs_to_vs30_correlation_id, e.cpt_to_vs_correlation_id, e.vs30_id,
+    e.cpt_id, e.nzgd_id, e.vs30, e.vs30_stddev,
+    n.type_prefix, n.original_reference, n.investigation_date, n.published_date,
+    n.latitude, n.longitude,
+    n.model_vs30_foster_2019, n.model_vs30_stddev_foster_2019, n.model_gwl_westerhoff_2019,
+    cr.tip_net_area_ratio, cr.measured_gwl, cr.deepest_depth, cr.shallowest_depth,
+    r.name, d.name, sub.name, cty.name,
+    log_residual(e.vs30, n.model_vs30_foster_2019),
+    cr.measured_gwl - n.model_gwl_westerhoff_2019
+FROM source.cptvs30estimates AS e
+JOIN source.nzgdrecord AS n ON e.nzgd_id = n.nzgd_id
+JOIN source.region AS r ON n.region_id = r.region_id
+JOIN source.district AS d ON n.district_id = d.district_id
+JOIN source.suburb AS sub ON n.suburb_id = sub.suburb_id
+JOIN source.city AS cty ON n.city_id = cty.city_id
+JOIN source.cptreport AS cr ON e.cpt_id = cr.cpt_id
+ORDER BY e.vs30_id
+"""
+
+_INSERT_SPT_VS30 = """
+INSERT INTO spt_vs30
+SELECT
+    e.vs_to_vs30_correlation_id, e.spt_to_vs_correlation_id, e.hammer_type_id,
+    e.vs30_id, e.spt_id, e.vs30, e.vs30_stddev,
+    n.type_prefix, n.original_reference, n.investigation_date, n.published_date,
+    n.latitude, n.longitude,
+    n.model_vs30_foster_2019, n.model_vs30_stddev_foster_2019, n.model_gwl_westerhoff_2019,
+    sr.measured_gwl, de.deepest_depth, de.shallowest_depth,
+    r.name, d.name, sub.name, cty.name,
+    sr.efficiency, sr.borehole_diameter,
+    log_residual(e.vs30, n.model_vs30_foster_2019),
+    sr.measured_gwl - n.model_gwl_westerhoff_2019
+FROM source.sptvs30estimates AS e
+JOIN source.nzgdrecord AS n ON e.spt_id = n.nzgd_id
+JOIN source.sptreport AS sr ON e.spt_id = sr.borehole_id
+JOIN source.region AS r ON n.region_id = r.region_id
+JOIN source.district AS d ON n.district_id = d.district_id
+JOIN source.suburb AS sub ON n.suburb_id = sub.suburb_id
+JOIN source.city AS cty ON n.city_id = cty.city_id
+LEFT JOIN (
+    SELECT borehole_id, MIN(depth) AS shallowest_depth, MAX(depth) AS deepest_depth
+    FROM source.sptmeasurements
+    GROUP BY borehole_id
+) AS de ON e.spt_id = de.borehole_id
+ORDER BY e.vs30_id
+"""
+
+# Secondary indexes for the queries filtered by NZGD IDs. In a WITHOUT ROWID table,
+# every index also holds the primary key, so these also cover the correlation filters.
+_SIDECAR_INDEXES = """
+CREATE INDEX cpt_vs30_nzgd_id ON cpt_vs30 (nzgd_id);
+CREATE INDEX spt_vs30_nzgd_id ON spt_vs30 (nzgd_id);
+"""
+
+# Larger pages hold more of the wide rows of the sidecar per page
+_PAGE_SIZE = 8192
+
+# The open sidecars, keyed by the path of the sidecar file. Each value is the version
+# (inode, size and modification time) of the sidecar file the pool was opened for, the
+# version of the source database file it was built from (from core.database_version),
+# and the pool.
+_sidecars: dict[
+    str, tuple[tuple[int, int, int], tuple[int, int, int, int], ConnectionPool]
+] = {}
+_sidecars_lock = threading.Lock()
+
+
+def _numpy_log(value: float) -> float:
+    """
+    Calculates the natural logarithm with the same results as np.log.
+
+    Parameters
+    ----------
+    value : float
+        The value.
+
+    Returns
+    -------
+    float
+        The natural logarithm, which is -inf for 0 and nan for negative values.
+    """
+    if value > 0:
+        return math.log(value)
+    return -math.inf if value == 0 else math.nan
+
+
+def _log_residual(value: float | None, model_value: float | None) -> float | None:
+    """
+    Calculates ln(value) - ln(model_value) like query.filtered_vs30s does with NumPy.
+
+    NaN results are stored by SQLite as NULL, which are read back as NaN.
+
+    Parameters
+    ----------
+    value : float or None
+        The value, such as the Vs30 of an estimate.
+    model_value : float or None
+        The model value, such as the Foster et al. (2019) Vs30.
+
+    Returns
+    -------
+    float or None
+        The log residual, or None if either value is NULL.
+    """
+    if value is None or model_value is None:
+        return None
+    return _numpy_log(value) - _numpy_log(model_value)
+
+
+def default_sidecar_path(db_path: Path) -> Path:
+    """
+    Gets the default path of the read-optimised sidecar of a database file.
+
+    Parameters
+    ----------
+    db_path : Path
+        The path of the NZGD database file.
+
+    Returns
+    -------
+    Path
+        The path of the sidecar, next to the database file.
+    """
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.name}.read_optimised.db")
+
+
+def build_read_optimised_database(
+    db_path: Path, sidecar_path: Path | None = None
+) -> Path:
+    """
+    Builds the read-optimised sidecar of an NZGD database.
+
+    Parameters
+    ----------
+    db_path : Path
+        The path of the NZGD database file.
+    sidecar_path : Path or None, optional
+        The path to write the sidecar to. Any existing file is overwritten.
+        If None (default), the sidecar is written next to the database file, where
+        the query functions look for it.
+
+    Returns
+    -------
+    Path
+        The path of the sidecar.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the database file does not exist.
+    """
+    db_path = Path(db_path).resolve()
+    if not db_path.is_file():
+        raise FileNotFoundError(f"Database file not found: {db_path}")
+    sidecar_path = Path(sidecar_path or default_sidecar_path(db_path))
+
+    # Build into a temporary file that replaces the sidecar once it is complete,
+    # so a partially built sidecar is never used
+    temp_sidecar_path = sidecar_path.with_name(
+        f".{sidecar_path.name}.{os.getpid()}.tmp"
+    )
+    temp_sidecar_path.unlink(missing_ok=True)
+    db_version = core.database_version(str(db_path))
+
+    with contextlib.closing(sqlite3.connect(temp_sidecar_path)) as sidecar_conn:
+        # The temporary file is discarded if the build fails, so it does not need
+        # to survive a crash
+        sidecar_conn.execute(f"PRAGMA page_size = {_PAGE_SIZE}")
+        sidecar_conn.execute("PRAGMA journal_mode = OFF")
+        sidecar_conn.execute("PRAGMA synchronous = OFF")
+        sidecar_conn.executescript(_SIDECAR_SCHEMA)
+        sidecar_conn.create_function(
+            "log_residual", 2, _log_residual, deterministic=True
+        )
+        sidecar_conn.execute("ATTACH DATABASE ? AS source", (str(db_path),))
+        sidecar_conn.execute(_INSERT_CPT_VS30)
+        sidecar_conn.execute(_INSERT_SPT_VS30)
+        sidecar_conn.execute(
+            "INSERT INTO source_database VALUES (?, ?, ?, ?, ?)",
+            (str(db_path), *db_version),
+        )
+        sidecar_conn.commit()
+        sidecar_conn.execute("DETACH DATABASE source")
+        sidecar_conn.executescript(_SIDECAR_INDEXES)
+        sidecar_conn.execute("ANALYZE")
+        sidecar_conn.commit()
+        # Rewrites the file so the pages of each table are contiguous and full
+        sidecar_conn.execute("VACUUM")
+
+    os.replace(temp_sidecar_path, sidecar_path)
+    return sidecar_path
+
+
+def sidecar_connection(db_path: str) -> sqlite3.Connection | None:
+    """
+    Gets a connection to the read-optimised sidecar of a database file, if it is usable.
+
+    The sidecar is only used if it is at the default path and was built from the
+    current version of the database file, including any changes in its write-ahead
+    log. The connections are taken from a pool per
+    sidecar, which is reopened when the sidecar is rebuilt.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the NZGD database file.
+
+    Returns
+    -------
+    sqlite3.Connection or None
+        A read-only connection to the sidecar for the calling thread, or None if there
+        is no sidecar or it is stale.
+    """
+    sidecar_path = str(default_sidecar_path(db_path))
+    try:
+        sidecar_stat = os.stat(sidecar_path)
+    except FileNotFoundError:
+        return None
+    sidecar_version = (
+        sidecar_stat.st_ino,
+        sidecar_stat.st_size,
+        sidecar_stat.st_mtime_ns,
+    )
+
+    with _sidecars_lock:
+        sidecar = _sidecars.get(sidecar_path)
+        if sidecar is None or sidecar[0] != sidecar_version:
+            # The pool of a replaced sidecar is not closed, as other threads may be
+            # using its connections. They are closed when the pool is garbage collected.
+            pool = ConnectionPool(sidecar_path)
+            db_version = (
+                pool.connection()
+                .execute(
+                    "SELECT size, mtime_ns, wal_size, wal_mtime_ns FROM source_database"
+                )
+                .fetchone()
+            )
+            sidecar = (sidecar_version, db_version, pool)
+            _sidecars[sidecar_path] = sidecar
+
+    if sidecar[1] != core.database_version(db_path):
+        return None
+    return sidecar[2].connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the read-optimised sidecar of an NZGD SQLite database."
+    )
+    parser.add_argument("db_path", type=Path, help="Path to the NZGD SQLite database.")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Path to write the sidecar to (default: next to the database, "
+        "where the query functions use it).",
+    )
+    args = parser.parse_args()
+
+    output_path = build_read_optimised_database(args.db_path, args.output)
+    print(f"Built {output_path}")
@@ -0,0 +1,521 @@
+"""
+Spatial queries over the locations of the NZGD records.
+
+The locations of the records are indexed with an SQLite R*Tree in a small sidecar
+database, built once from the NZGD database with build_spatial_index. SpatialIndex then
+finds the records inside a bounding box, within a radius of a point, or nearest to a
+point, without scanning the nzgdrecord table.
+
+The R*Tree stores coordinates as 32-bit floats, so it is only used to find candidate
+records. The candidates are then filtered exactly using the 64-bit coordinates.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sqlite_tools import core, query
+from sqlite_tools.connection import ConnectionPool, as_connection
+
+# The mean radius of the Earth in km
+EARTH_RADIUS_KM = 6371.0
+
+_SIDECAR_SCHEMA = """
+CREATE VIRTUAL TABLE nzgd_rtree USING rtree(nzgd_id, min_lat, max_lat, min_lon, max_lon);
+CREATE TABLE nzgd_location (
+    nzgd_id INTEGER PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL
+);
+CREATE TABLE source_database (
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    wal_size INTEGER NOT NULL,
+    wal_mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+def default_index_path(db_path: Path) -> Path:
+    """
+    Gets the default path of the spatial index sidecar of a database file.
+
+    Parameters
+    ----------
+    db_path : Path
+        The path of the NZGD database file.
+
+    Returns
+    -------
+    Path
+        The path of the sidecar, next to the database file.
+    """
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.name}.spatial.db")
+
+
+def build_spatial_index(
+    conn: sqlite3.Connection | ConnectionPool, index_path: Path | None = None
+) -> Path:
+    """
+    Builds the spatial index sidecar of an NZGD database.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection or ConnectionPool
+        The connection to the NZGD database, or a pool to take a connection from.
+    index_path : Path or None, optional
+        The path to write the sidecar to. Any existing file is overwritten.
+        If None (default), the sidecar is written next to the database file.
+
+    Returns
+    -------
+    Path
+        The path of the sidecar.
+
+    Raises
+    ------
+    ValueError
+        If the database is an in-memory database.
+    """
+    conn = as_connection(conn)
+    db_path = query.database_path(conn)
+    if not db_path:
+        raise ValueError("Spatial indexes cannot be built for in-memory databases")
+    index_path = Path(index_path or default_index_path(db_path))
+
+    # Build into a temporary file that replaces the sidecar once it is complete,
+    # so a partially built sidecar is never used
+    temp_index_path = index_path.with_name(f".{index_path.name}.{os.getpid()}.tmp")
+    temp_index_path.unlink(missing_ok=True)
+    db_version = core.database_version(db_path)
+    locations = conn.execute(
+        """SELECT nzgd_id, latitude, longitude
+        FROM nzgdrecord
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL"""
+    ).fetchall()
+
+    with contextlib.closing(sqlite3.connect(temp_index_path)) as index_conn:
+        index_conn.executescript(_SIDECAR_SCHEMA)
+        index_conn.executemany(
+            "INSERT INTO nzgd_rtree VALUES (?, ?, ?, ?, ?)",
+            (
+                (nzgd_id, latitude, latitude, longitude, longitude)
+                for nzgd_id, latitude, longitude in locations
+            ),
+        )
+        index_conn.executemany("INSERT INTO nzgd_location VALUES (?, ?, ?)", locations)
+        index_conn.execute(
+            "INSERT INTO source_database VALUES (?, ?, ?, ?, ?)",
+            (os.path.realpath(db_path), *db_version),
+        )
+        index_conn.commit()
+
+    os.replace(temp_index_path, index_path)
+    return index_path
+
+
+def _haversine_km(
+    latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray
+) -> np.ndarray:
+    """
+    Calculates great-circle distances from a point with the haversine formula.
+
+    Parameters
+    ----------
+    latitude : float
+        The latitude of the point in degrees.
+    longitude : float
+        The longitude of the point in degrees.
+    latitudes : np.ndarray
+        The latitudes of the other points in degrees.
+    longitudes : np.ndarray
+        The longitudes of the other points in degrees.
+
+    Returns
+    -------
+    np.ndarray
+        The distances in km.
+    """
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class SpatialIndex:
+    """
+    Spatial queries over the locations of the NZGD records, using a sidecar R*Tree.
+
+    Parameters
+    ----------
+    index_path : Path
+        The path of the sidecar built by build_spatial_index.
+
+    Examples
+    --------
+    >>> build_spatial_index(conn)
+    >>> spatial_index = SpatialIndex(default_index_path("nzgd.db"))
+    >>> nearby_df = spatial_index.within_radius(-43.53, 172.63, radius_km=2)
+    """
+
+    def __init__(self, index_path: Path) -> None:
+        """Opens the sidecar, with one read-only connection per thread."""
+        self.index_path = Path(index_path)
+        self._pool = ConnectionPool(self.index_path)
+
+    @classmethod
+    def for_database(
+        cls, conn: sqlite3.Connection | ConnectionPool, index_path: Path | None = None
+    ) -> SpatialIndex:
+        """
+        Opens the spatial index of a database, building it first if it is missing or stale.
+
+        Parameters
+        ----------
+        conn : sqlite3.Connection or ConnectionPool
+            The connection to the NZGD database, or a pool to take a connection from.
+        index_path : Path or None, optional
+            The path of the sidecar. If None (default), the sidecar is next to the
+            database file.
+
+        Returns
+        -------
+        SpatialIndex
+            The spatial index.
+
+        Raises
+        ------
+        ValueError
+            If the database is an in-memory database.
+        """
+        db_path = query.database_path(conn)
+        if not db_path:
+            raise ValueError("Spatial indexes cannot be built for in-memory databases")
+        index_path = Path(index_path or default_index_path(db_path))
+        if index_path.exists():
+            spatial_index = cls(index_path)
+            if not spatial_index.is_stale(db_path):
+                return spatial_index
+            spatial_index.close()
+        build_spatial_index(conn, index_path)
+        return cls(index_path)
+
+    def is_stale(self, db_path: Path) -> bool:
+        """
+        Checks whether the sidecar was built from a different version of a database file.
+
+        Parameters
+        ----------
+        db_path : Path
+            The path of the NZGD database file.
+
+        Returns
+        -------
+        bool
+            True if the database file has been modified since the sidecar was built,
+            including by commits still in its write-ahead log, or if the sidecar was
+            built from a different file.
+        """
+        source = (
+            self._pool.connection()
+            .execute(
+                "SELECT path, size, mtime_ns, wal_size, wal_mtime_ns "
+                "FROM source_database"
+            )
+            .fetchone()
+        )
+        return source != (os.path.realpath(db_path), *core.database_version(db_path))
+
+    def _query_bounding_box(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Finds the records inside a bounding box, returned as arrays.
+
+        The rows are fetched straight from the cursor, without building a DataFrame,
+        as this is called for every lookup. A box with min_lon greater than max_lon
+        crosses the antimeridian, and is searched as two boxes, one on each side.
+
+        Parameters
+        ----------
+        min_lat : float
+            The minimum latitude in degrees.
+        max_lat : float
+            The maximum latitude in degrees.
+        min_lon : float
+            The minimum longitude in degrees.
+        max_lon : float
+            The maximum longitude in degrees.
+
+        Returns
+        -------
+        nzgd_ids : np.ndarray
+            The NZGD IDs of the records, in ascending order.
+        latitudes : np.ndarray
+            The latitudes of the records.
+        longitudes : np.ndarray
+            The longitudes of the records.
+        """
+        if min_lon > max_lon:
+            lon_ranges = [(min_lon, 180.0), (-180.0, max_lon)]
+        else:
+            lon_ranges = [(min_lon, max_lon)]
+
+        rows = []
+        for range_min_lon, range_max_lon in lon_ranges:
+            rows += (
+                self._pool.connection()
+                .execute(
+                    """SELECT nzgd_location.nzgd_id, nzgd_location.latitude, nzgd_location.longitude
+                    FROM nzgd_rtree
+                    JOIN nzgd_location ON nzgd_location.nzgd_id = nzgd_rtree.nzgd_id
+                    WHERE nzgd_rtree.max_lat >= ? AND nzgd_rtree.min_lat <= ?
+                      AND nzgd_rtree.max_lon >= ? AND nzgd_rtree.min_lon <= ?
+                      AND nzgd_location.latitude BETWEEN ? AND ?
+                      AND nzgd_location.longitude BETWEEN ? AND ?
+                    ORDER BY nzgd_location.nzgd_id""",
+                    (min_lat, max_lat, range_min_lon, range_max_lon) * 2,
+                )
+                .fetchall()
+            )
+        if len(lon_ranges) > 1:
+            # A record at exactly 180 or -180 degrees can be in both boxes
+            rows = sorted(set(rows))
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        nzgd_ids, latitudes, longitudes = zip(*rows)
+        return (
+            np.array(nzgd_ids, dtype=np.int64),
+            np.array(latitudes, dtype=float),
+            np.array(longitudes, dtype=float),
+        )
+
+    def bounding_box(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> pd.DataFrame:
+        """
+        Finds the records inside a latitude/longitude bounding box.
+
+        Parameters
+        ----------
+        min_lat : float
+            The minimum latitude in degrees.
+        max_lat : float
+            The maximum latitude in degrees.
+        min_lon : float
+            The minimum longitude in degrees, between -180 and 180.
+        max_lon : float
+            The maximum longitude in degrees, between -180 and 180. If it is less than
+            min_lon, the box crosses the antimeridian, and contains the longitudes from
+            min_lon to 180 and from -180 to max_lon.
+
+        Returns
+        -------
+        pd.DataFrame
+            A DataFrame with columns nzgd_id, latitude and longitude, ordered by nzgd_id.
+
+        Raises
+        ------
+        ValueError
+            If min_lat is greater than max_lat, or a longitude is outside -180 to 180.
+        """
+        if min_lat > max_lat:
+            raise ValueError(
+                f"min_lat ({min_lat}) must not be greater than max_lat ({max_lat})"
+            )
+        if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+            raise ValueError(
+                f"Longitudes must be between -180 and 180, but got min_lon={min_lon} "
+                f"and max_lon={max_lon}"
+            )
+        nzgd_ids, latitudes, longitudes = self._query_bounding_box(
+            min_lat, max_lat, min_lon, max_lon
+        )
+        return pd.DataFrame(
+            {"nzgd_id": nzgd_ids, "latitude": latitudes, "longitude": longitudes}
+        )
+
+    def _query_radius(
+        self, latitude: float, longitude: float, radius_km: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Finds the records within a radius of a point, returned as arrays.
+
+        Parameters
+        ----------
+        latitude : float
+            The latitude of the point in degrees.
+        longitude : float
+            The longitude of the point in degrees.
+        radius_km : float
+            The radius in km.
+
+        Returns
+        -------
+        nzgd_ids : np.ndarray
+            The NZGD IDs of the records, ordered by distance.
+        latitudes : np.ndarray
+            The latitudes of the records.
+        longitudes : np.ndarray
+            The longitudes of the records.
+        distances_km : np.ndarray
+            The distances of the records from the point in km.
+        """
+        # Find the candidates in the bounding box that contains the circle
+        lat_delta = np.degrees(radius_km / EARTH_RADIUS_KM)
+        cos_lat = np.cos(np.radians(latitude))
+        if abs(latitude) + lat_delta >= 90 or cos_lat < 1e-9:
+            # The circle contains a pole, so it spans every longitude
+            lon_delta = 180.0
+        else:
+            lon_delta = min(180.0, lat_delta / cos_lat)
+
+        if lon_delta >= 180:
+            min_lon, max_lon = -180.0, 180.0
+        else:
+            # Wrap the longitudes into [-180, 180). If the circle crosses the
+            # antimeridian, min_lon is then greater than max_lon.
+            min_lon = (longitude - lon_delta + 180) % 360 - 180
+            max_lon = (longitude + lon_delta + 180) % 360 - 180
+        nzgd_ids, latitudes, longitudes = self._query_bounding_box(
+            latitude - lat_delta, latitude + lat_delta, min_lon, max_lon
+        )
+
+        distances_km = _haversine_km(latitude, longitude, latitudes, longitudes)
+        within_radius = np.flatnonzero(distances_km <= radius_km)
+        order = within_radius[np.argsort(distances_km[within_radius], kind="stable")]
+        return nzgd_ids[order], latitudes[order], longitudes[order], distances_km[order]
+
+    def within_radius(
+        self, latitude: float, longitude: float, radius_km: float
+    ) -> pd.DataFrame:
+        """
+        Finds the records within a great-circle distance of a point.
+
+        Parameters
+        ----------
+        latitude : float
+            The latitude of the point in degrees.
+        longitude : float
+            The longitude of the point in degrees.
+        radius_km : float
+            The radius in km.
+
+        Returns
+        -------
+        pd.DataFrame
+            A DataFrame with columns nzgd_id, latitude, longitude and distance_km,
+            ordered by distance.
+        """
+        return pd.DataFrame(
+            dict(
+                zip(
+                    ["nzgd_id", "latitude", "longitude", "distance_km"],
+                    self._query_radius(latitude, longitude, radius_km),
+                )
+            )
+        )
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int = 1,
+        initial_radius_km: float = 1.0,
+        max_radius_km: float = 2000.0,
+    ) -> pd.DataFrame:
+        """
+        Finds the k records nearest to a point.
+
+        The search radius starts at initial_radius_km and is doubled until at least k
+        records are found or max_radius_km is reached.
+
+        Parameters
+        ----------
+        latitude : float
+            The latitude of the point in degrees.
+        longitude : float
+            The longitude of the point in degrees.
+        k : int, optional
+            The number of records to find. Default is 1.
+        initial_radius_km : float, optional
+            The initial search radius in km. Default is 1 km.
+        max_radius_km : float, optional
+            The maximum search radius in km. Default is 2000 km.
+
+        Returns
+        -------
+        pd.DataFrame
+            A DataFrame with columns nzgd_id, latitude, longitude and distance_km,
+            ordered by distance. It has fewer than k rows if fewer than k records are
+            within max_radius_km.
+        """
+        radius_km = initial_radius_km
+        while True:
+            arrays = self._query_radius(latitude, longitude, radius_km)
+            if arrays[0].size >= k or radius_km >= max_radius_km:
+                break
+            radius_km = min(2 * radius_km, max_radius_km)
+
+        return pd.DataFrame(
+            {
+                column_name: values[:k]
+                for column_name, values in zip(
+                    ["nzgd_id", "latitude", "longitude", "distance_km"], arrays
+                )
+            }
+        )
+
+    def close(self) -> None:
+        """Closes the connections to the sidecar."""
+        self._pool.close()
+
+
+def vs30s_for_spatial_result(
+    spatial_df: pd.DataFrame, conn: sqlite3.Connection | ConnectionPool
+) -> pd.DataFrame:
+    """
+    Gets the pre-computed Vs30 values of the records found by a spatial query.
+
+    Parameters
+    ----------
+    spatial_df : pd.DataFrame
+        The result of one of the SpatialIndex methods.
+    conn : sqlite3.Connection or ConnectionPool
+        The connection to the NZGD database, or a pool to take a connection from.
+
+    Returns
+    -------
+    pd.DataFrame
+        The rows of query.cpt_vs30s_for_nzgd_ids and query.spt_vs30s_for_nzgd_ids for
+        the records, in the order of spatial_df. If spatial_df has a distance_km
+        column, it is included.
+    """
+    nzgd_ids = spatial_df["nzgd_id"].tolist()
+    vs30_df = pd.concat(
+        [
+            query.cpt_vs30s_for_nzgd_ids(nzgd_ids, conn),
+            query.spt_vs30s_for_nzgd_ids(nzgd_ids, conn),
+        ],
+        ignore_index=True,
+    )
+    if "distance_km" in spatial_df.columns:
+        vs30_df["distance_km"] = vs30_df["nzgd_id"].map(
+            spatial_df.set_index("nzgd_id")["distance_km"]
+        )
+
+    # Order the rows like spatial_df, keeping the CPT and SPT row order for each record
+    id_position = {nzgd_id: position for position, nzgd_id in enumerate(nzgd_ids)}
+    sort_key = vs30_df["nzgd_id"].map(id_position).to_numpy()
+    return vs30_df.iloc[np.argsort(sort_key, kind="stable")].reset_index(drop=True)
@@ -0,0 +1,354 @@
+"""
+Generates synthetic SQLite databases with the same schema as the NZGD database.
+
+The real NZGD database cannot be distributed, so these databases are used to benchmark
+and test the functions in sqlite_tools without it. Only the tables and columns that
+sqlite_tools queries are created, and the values are random but plausible.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+from sqlite_tools import indexes
+
+SCHEMA = """
+CREATE TABLE region (region_id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE district (district_id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE city (city_id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE suburb (suburb_id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE nzgdrecord (
+    nzgd_id INTEGER PRIMARY KEY,
+    type_prefix TEXT,
+    original_reference TEXT,
+    investigation_date TEXT,
+    published_date TEXT,
+    latitude REAL,
+    longitude REAL,
+    model_vs30_foster_2019 REAL,
+    model_vs30_stddev_foster_2019 REAL,
+    model_gwl_westerhoff_2019 REAL,
+    region_id INTEGER,
+    district_id INTEGER,
+    city_id INTEGER,
+    suburb_id INTEGER
+);
+CREATE TABLE cptreport (
+    cpt_id INTEGER PRIMARY KEY,
+    nzgd_id INTEGER,
+    cpt_file TEXT,
+    tip_net_area_ratio REAL,
+    measured_gwl REAL,
+    deepest_depth REAL,
+    shallowest_depth REAL
+);
+CREATE TABLE cptmeasurements (
+    measurement_id INTEGER PRIMARY KEY,
+    cpt_id INTEGER,
+    depth REAL,
+    qc REAL,
+    fs REAL,
+    u2 REAL
+);
+CREATE TABLE sptreport (
+    borehole_id INTEGER PRIMARY KEY,
+    nzgd_id INTEGER,
+    borehole_file TEXT,
+    efficiency REAL,
+    borehole_diameter REAL,
+    measured_gwl REAL
+);
+CREATE TABLE sptmeasurements (
+    measurement_id INTEGER PRIMARY KEY,
+    borehole_id INTEGER,
+    depth REAL,
+    n INTEGER
+);
+CREATE TABLE soilmeasurements (
+    measurement_id INTEGER PRIMARY KEY,
+    report_id INTEGER,
+    top_depth REAL
+);
+CREATE TABLE soiltypes (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE soilmeasurementsoiltype (soil_measurement_id INTEGER, soil_type_id INTEGER);
+CREATE TABLE vstovs30correlation (vs_to_vs30_correlation_id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE cpttovscorrelation (cpt_to_vs_correlation_id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE spttovscorrelation (correlation_id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE spttovs30hammertype (hammer_id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE cptvs30estimates (
+    vs30_id INTEGER PRIMARY KEY,
+    cpt_id INTEGER,
+    nzgd_id INTEGER,
+    cpt_to_vs_correlation_id INTEGER,
+    vs_to_vs30_correlation_id INTEGER,
+    vs30 REAL,
+    vs30_stddev REAL
+);
+CREATE TABLE sptvs30estimates (
+    vs30_id INTEGER PRIMARY KEY,
+    spt_id INTEGER,
+    spt_to_vs_correlation_id INTEGER,
+    vs_to_vs30_correlation_id INTEGER,
+    hammer_type_id INTEGER,
+    borehole_diameter REAL,
+    vs30 REAL,
+    vs30_stddev REAL,
+    vs30_used_efficiency INTEGER,
+    vs30_used_soil_info INTEGER
+);
+"""
+
+VS_TO_VS30_CORRELATIONS = ["boore_2004", "boore_2011"]
+CPT_TO_VS_CORRELATIONS = [
+    "andrus_2007_pleistocene",
+    "andrus_2007_holocene",
+    "andrus_2007_tertiary_age_cooper_marl",
+    "robertson_2009",
+    "hegazy_2006",
+    "mcgann_2015",
+    "mcgann_2018",
+]
+SPT_TO_VS_CORRELATIONS = ["brandenberg_2010", "kwak_2015"]
+HAMMER_TYPES = ["Auto", "Safety", "Standard"]
+SOIL_TYPES = ["SAND", "SILT", "CLAY", "GRAVEL", "PEAT"]
+
+
+def _insert_lookup_tables(conn: sqlite3.Connection, n_locations: int) -> None:
+    """
+    Inserts the rows of the small lookup tables.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The connection to the database being created.
+    n_locations : int
+        The number of regions, districts, cities and suburbs.
+    """
+    for table_name in ["region", "district", "city", "suburb"]:
+        conn.executemany(
+            f"INSERT INTO {table_name} VALUES (?, ?)",
+            [(i, f"{table_name}_{i}") for i in range(1, n_locations + 1)],
+        )
+    for table_name, names in [
+        ("vstovs30correlation", VS_TO_VS30_CORRELATIONS),
+        ("cpttovscorrelation", CPT_TO_VS_CORRELATIONS),
+        ("spttovscorrelation", SPT_TO_VS_CORRELATIONS),
+        ("spttovs30hammertype", HAMMER_TYPES),
+        ("soiltypes", SOIL_TYPES),
+    ]:
+        conn.executemany(
+            f"INSERT INTO {table_name} VALUES (?, ?)", list(enumerate(names, start=1))
+        )
+
+
+def create_synthetic_database(
+    db_path: Path,
+    n_records: int = 10_000,
+    cpt_fraction: float = 0.8,
+    mean_cpt_measurements: int = 500,
+    mean_spt_measurements: int = 15,
+    n_locations: int = 50,
+    create_indexes: bool = True,
+    seed: int = 0,
+) -> Path:
+    """
+    Creates a synthetic database with the same schema as the NZGD database.
+
+    Parameters
+    ----------
+    db_path : Path
+        The path to write the database to. Any existing file is overwritten.
+    n_records : int, optional
+        The number of NZGD records. Default is 10,000.
+    cpt_fraction : float, optional
+        The fraction of records that are CPTs (or SCPTs). The rest are SPT
+        boreholes. Default is 0.8.
+    mean_cpt_measurements : int, optional
+        The mean number of depth measurements per CPT. Default is 500.
+    mean_spt_measurements : int, optional
+        The mean number of depth measurements per SPT borehole. Default is 15.
+    n_locations : int, optional
+        The number of regions, districts, cities and suburbs. Default is 50.
+    create_indexes : bool, optional
+        If True (default), the indexes in indexes.RECOMMENDED_INDEXES are created.
+    seed : int, optional
+        The seed of the random number generator. Default is 0.
+
+    Returns
+    -------
+    Path
+        The path of the created database.
+    """
+    db_path = Path(db_path)
+    db_path.unlink(missing_ok=True)
+    rng = np.random.default_rng(seed)
+
+    nzgd_ids = np.arange(1, n_records + 1)
+    is_cpt = rng.random(n_records) < cpt_fraction
+    type_prefixes = np.where(
+        is_cpt, np.where(rng.random(n_records) < 0.9, "CPT", "SCPT"), "BH"
+    )
+    investigation_years = rng.integers(1990, 2024, n_records)
+    location_ids = rng.integers(1, n_locations + 1, (n_records, 4))
+
+    with contextlib.closing(sqlite3.connect(db_path)) as conn:
+        conn.executescript(SCHEMA)
+        _insert_lookup_tables(conn, n_locations)
+
+        conn.executemany(
+            "INSERT INTO nzgdrecord VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                nzgd_ids.tolist(),
+                type_prefixes.tolist(),
+                [f"reference_{i % 500}" for i in nzgd_ids],
+                [f"{year}-06-01" for year in investigation_years],
+                [f"{year + 1}-01-01" for year in investigation_years],
+                rng.uniform(-46.5, -34.5, n_records).tolist(),
+                rng.uniform(166.5, 178.5, n_records).tolist(),
+                rng.uniform(150, 600, n_records).tolist(),
+                rng.uniform(0.2, 0.5, n_records).tolist(),
+                rng.uniform(0, 10, n_records).tolist(),
+                *location_ids.T.tolist(),
+            ),
+        )
+
+        # CPT reports and measurements. Some records contain two CPT investigations.
+        cpt_nzgd_ids = nzgd_ids[is_cpt]
+        cpt_nzgd_ids = np.sort(
+            np.concatenate(
+                [cpt_nzgd_ids, cpt_nzgd_ids[rng.random(cpt_nzgd_ids.size) < 0.05]]
+            )
+        )
+        n_cpts = cpt_nzgd_ids.size
+        cpt_ids = np.arange(1, n_cpts + 1)
+        depth_interval = 0.02
+        n_measurements = np.maximum(
+            rng.poisson(mean_cpt_measurements, n_cpts), 2
+        ).astype(np.int64)
+        conn.executemany(
+            "INSERT INTO cptreport VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                cpt_ids.tolist(),
+                cpt_nzgd_ids.tolist(),
+                [f"CPT_{cpt_id}.xls" for cpt_id in cpt_ids],
+                rng.uniform(0.7, 0.85, n_cpts).tolist(),
+                rng.uniform(0, 5, n_cpts).tolist(),
+                (n_measurements * depth_interval).tolist(),
+                [depth_interval] * n_cpts,
+            ),
+        )
+        # Insert the measurements one CPT at a time to keep memory use low
+        for cpt_id, n_depths in zip(cpt_ids.tolist(), n_measurements.tolist()):
+            depths = np.round(np.arange(1, n_depths + 1) * depth_interval, 2)
+            conn.executemany(
+                "INSERT INTO cptmeasurements (cpt_id, depth, qc, fs, u2) "
+                "VALUES (?, ?, ?, ?, ?)",
+                zip(
+                    [cpt_id] * n_depths,
+                    depths.tolist(),
+                    rng.uniform(0.1, 30, n_depths).tolist(),
+                    rng.uniform(0, 0.3, n_depths).tolist(),
+                    rng.uniform(-0.1, 1, n_depths).tolist(),
+                ),
+            )
+        vs30_combinations = np.array(
+            [
+                (vs_to_vs30_id, cpt_to_vs_id)
+                for vs_to_vs30_id in range(1, len(VS_TO_VS30_CORRELATIONS) + 1)
+                for cpt_to_vs_id in range(1, len(CPT_TO_VS_CORRELATIONS) + 1)
+            ]
+        )
+        conn.executemany(
+            "INSERT INTO cptvs30estimates (cpt_id, nzgd_id, cpt_to_vs_correlation_id, "
+            "vs_to_vs30_correlation_id, vs30, vs30_stddev) VALUES (?, ?, ?, ?, ?, ?)",
+            zip(
+                np.repeat(cpt_ids, len(vs30_combinations)).tolist(),
+                np.repeat(cpt_nzgd_ids, len(vs30_combinations)).tolist(),
+                np.tile(vs30_combinations[:, 1], n_cpts).tolist(),
+                np.tile(vs30_combinations[:, 0], n_cpts).tolist(),
+                rng.uniform(150, 600, n_cpts * len(vs30_combinations)).tolist(),
+                rng.uniform(0.1, 0.4, n_cpts * len(vs30_combinations)).tolist(),
+            ),
+        )
+
+        # SPT reports, measurements and soil types. The borehole_id is the NZGD ID.
+        spt_nzgd_ids = nzgd_ids[~is_cpt]
+        n_spts = spt_nzgd_ids.size
+        conn.executemany(
+            "INSERT INTO sptreport VALUES (?, ?, ?, ?, ?, ?)",
+            zip(
+                spt_nzgd_ids.tolist(),
+                spt_nzgd_ids.tolist(),
+                [f"BH_{nzgd_id}.pdf" for nzgd_id in spt_nzgd_ids],
+                rng.uniform(0.5, 0.9, n_spts).tolist(),
+                rng.uniform(0.05, 0.15, n_spts).tolist(),
+                rng.uniform(0, 5, n_spts).tolist(),
+            ),
+        )
+        for borehole_id in spt_nzgd_ids.tolist():
+            n_depths = max(int(rng.poisson(mean_spt_measurements)), 1)
+            conn.executemany(
+                "INSERT INTO sptmeasurements (borehole_id, depth, n) VALUES (?, ?, ?)",
+                zip(
+                    [borehole_id] * n_depths,
+                    (np.arange(1, n_depths + 1) * 1.5).tolist(),
+                    rng.integers(1, 60, n_depths).tolist(),
+                ),
+            )
+            n_layers = int(rng.integers(1, 8))
+            top_depths = np.round(
+                np.concatenate([[0], np.cumsum(rng.uniform(0.3, 4, n_layers - 1))]), 3
+            )
+            for top_depth in top_depths.tolist():
+                cursor = conn.execute(
+                    "INSERT INTO soilmeasurements (report_id, top_depth) VALUES (?, ?)",
+                    (borehole_id, top_depth),
+                )
+                soil_type_ids = rng.choice(
+                    np.arange(1, len(SOIL_TYPES) + 1),
+                    size=int(rng.integers(1, 3)),
+                    replace=False,
+                )
+                conn.executemany(
+                    "INSERT INTO soilmeasurementsoiltype VALUES (?, ?)",
+                    [
+                        (cursor.lastrowid, int(soil_type_id))
+                        for soil_type_id in soil_type_ids
+                    ],
+                )
+        spt_combinations = np.array(
+            [
+                (vs_to_vs30_id, spt_to_vs_id, hammer_id)
+                for vs_to_vs30_id in range(1, len(VS_TO_VS30_CORRELATIONS) + 1)
+                for spt_to_vs_id in range(1, len(SPT_TO_VS_CORRELATIONS) + 1)
+                for hammer_id in range(1, len(HAMMER_TYPES) + 1)
+            ]
+        )
+        n_spt_estimates = n_spts * len(spt_combinations)
+        conn.executemany(
+            "INSERT INTO sptvs30estimates (spt_id, spt_to_vs_correlation_id, "
+            "vs_to_vs30_correlation_id, hammer_type_id, borehole_diameter, vs30, "
+            "vs30_stddev, vs30_used_efficiency, vs30_used_soil_info) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                np.repeat(spt_nzgd_ids, len(spt_combinations)).tolist(),
+                np.tile(spt_combinations[:, 1], n_spts).tolist(),
+                np.tile(spt_combinations[:, 0], n_spts).tolist(),
+                np.tile(spt_combinations[:, 2], n_spts).tolist(),
+                [0.1] * n_spt_estimates,
+                rng.uniform(150, 600, n_spt_estimates).tolist(),
+                rng.uniform(0.1, 0.4, n_spt_estimates).tolist(),
+                rng.integers(0, 2, n_spt_estimates).tolist(),
+                rng.integers(0, 2, n_spt_estimates).tolist(),
+            ),
+        )
+        conn.commit()
+
+        if create_indexes:
+            indexes.create_missing_indexes(conn)
+
+    return db_path
@@ -0,0 +1,51 @@
+"""Fixtures shared by the tests, which run against a small synthetic NZGD database."""
+
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from sqlite_tools import synthetic
+
+
+@pytest.fixture(scope="session")
+def db_path(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """A small synthetic database, created once for all of the tests."""
+    return synthetic.create_synthetic_database(
+        tmp_path_factory.mktemp("nzgd") / "synthetic_nzgd.db",
+        n_records=200,
+        mean_cpt_measurements=30,
+    )
+
+
+@pytest.fixture
+def conn(db_path: Path) -> Iterator[sqlite3.Connection]:
+    """A connection to the synthetic database."""
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def cpt_nzgd_ids(conn: sqlite3.Connection) -> list[int]:
+    """The NZGD IDs of the CPT records, in descending order."""
+    return [
+        nzgd_id
+        for (nzgd_id,) in conn.execute(
+            "SELECT DISTINCT nzgd_id FROM cptreport ORDER BY nzgd_id DESC"
+        )
+    ]
+
+
+@pytest.fixture
+def spt_nzgd_ids(conn: sqlite3.Connection) -> list[int]:
+    """The NZGD IDs of the SPT records, in descending order."""
+    return [
+        nzgd_id
+        for (nzgd_id,) in conn.execute(
+            "SELECT borehole_id FROM sptreport ORDER BY borehole_id DESC"
+        )
+    ]
@@ -0,0 +1,119 @@
+"""Tests of the measurement arrays in sqlite_tools.arrays."""
+
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sqlite_tools import arrays, core, query
+from sqlite_tools.connection import ConnectionPool
+
+# The array functions, the DataFrame functions they must match, and the kind of record
+ARRAY_FUNCTIONS = [
+    (
+        arrays.cpt_measurement_arrays_for_nzgd_ids,
+        query.cpt_measurements_for_nzgd_ids,
+        "cpt",
+    ),
+    (
+        arrays.spt_measurement_arrays_for_nzgd_ids,
+        query.spt_measurements_for_nzgd_ids,
+        "spt",
+    ),
+]
+
+
+def _assert_arrays_match(
+    measurement_arrays: tuple[np.ndarray, ...], measurements_df: pd.DataFrame
+) -> None:
+    """Asserts that the arrays are the columns of the DataFrame."""
+    assert list(measurement_arrays._fields) == list(measurements_df.columns)
+    for column, array in zip(measurements_df.columns, measurement_arrays):
+        assert array.flags.c_contiguous
+        np.testing.assert_array_equal(array, measurements_df[column].to_numpy())
+
+
+@pytest.mark.parametrize("max_sql_variables", [core.MAX_SQL_VARIABLES, 3])
+@pytest.mark.parametrize(
+    "array_function, dataframe_function, kind",
+    ARRAY_FUNCTIONS,
+    ids=[kind for _, _, kind in ARRAY_FUNCTIONS],
+)
+def test_sqlite3_arrays_match_dataframe(
+    conn: sqlite3.Connection,
+    cpt_nzgd_ids: list[int],
+    spt_nzgd_ids: list[int],
+    monkeypatch: pytest.MonkeyPatch,
+    array_function: Callable[..., tuple[np.ndarray, ...]],
+    dataframe_function: Callable[..., pd.DataFrame],
+    kind: str,
+    max_sql_variables: int,
+):
+    # With 3 variables per statement, the IDs are queried in several chunks, whose
+    # rows are each reordered to follow the requested IDs
+    monkeypatch.setattr(core, "MAX_SQL_VARIABLES", max_sql_variables)
+    nzgd_ids = cpt_nzgd_ids if kind == "cpt" else spt_nzgd_ids
+    # Unordered NumPy IDs and a duplicate, so the order of the requested IDs is tested
+    nzgd_ids = np.array(nzgd_ids[1::2] + nzgd_ids[::2] + nzgd_ids[:1])
+
+    measurement_arrays = array_function(nzgd_ids, conn, backend="sqlite3")
+
+    _assert_arrays_match(measurement_arrays, dataframe_function(nzgd_ids, conn))
+
+
+def test_sqlite3_arrays_for_one_nzgd(
+    db_path: Path, conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    pool = ConnectionPool(db_path)
+    try:
+        measurement_arrays = arrays.cpt_measurement_arrays_for_one_nzgd(
+            cpt_nzgd_ids[0], pool, backend="sqlite3"
+        )
+    finally:
+        pool.close()
+
+    _assert_arrays_match(
+        measurement_arrays, query.cpt_measurements_for_one_nzgd(cpt_nzgd_ids[0], conn)
+    )
+
+
+def test_arrays_without_ids(conn: sqlite3.Connection):
+    measurement_arrays = arrays.spt_measurement_arrays_for_nzgd_ids(
+        [], conn, backend="sqlite3"
+    )
+
+    assert [array.dtype for array in measurement_arrays] == [
+        np.float64,
+        np.float64,
+        np.int64,
+    ]
+    assert all(array.size == 0 for array in measurement_arrays)
+
+
+def test_unsupported_backend(conn: sqlite3.Connection):
+    with pytest.raises(ValueError, match="Unsupported backend"):
+        arrays.cpt_measurement_arrays_for_one_nzgd(1, conn, backend="pyarrow")
+
+
+def test_adbc_arrays_match_sqlite3(conn: sqlite3.Connection, cpt_nzgd_ids: list[int]):
+    pytest.importorskip("adbc_driver_sqlite")
+    nzgd_ids = cpt_nzgd_ids[::-1]
+    try:
+        adbc_arrays = arrays.cpt_measurement_arrays_for_nzgd_ids(
+            nzgd_ids, conn, backend="adbc"
+        )
+        assert arrays._adbc_connections
+    finally:
+        arrays.close_adbc_connections(conn)
+
+    assert not arrays._adbc_connections
+    sqlite3_arrays = arrays.cpt_measurement_arrays_for_nzgd_ids(
+        nzgd_ids, conn, backend="sqlite3"
+    )
+    for adbc_array, sqlite3_array in zip(adbc_arrays, sqlite3_arrays):
+        np.testing.assert_array_equal(adbc_array, sqlite3_array)
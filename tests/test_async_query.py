@@ -0,0 +1,109 @@
+"""Tests of the awaitable queries in sqlite_tools.async_query."""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from sqlite_tools import query
+from sqlite_tools.async_query import AsyncQuery
+
+# A query that runs for far longer than the tests, unless it is interrupted
+_SLOW_QUERY = """WITH RECURSIVE counter(x) AS (
+    SELECT 1 UNION ALL SELECT x + 1 FROM counter LIMIT 1000000000
+)
+SELECT count(*) FROM counter"""
+
+
+def _slow_query(conn: sqlite3.Connection) -> int:
+    """Runs the slow query."""
+    return conn.execute(_SLOW_QUERY).fetchone()[0]
+
+
+def _fast_query(conn: sqlite3.Connection) -> tuple[int]:
+    """Runs a query that returns immediately."""
+    return conn.execute("SELECT 1").fetchone()
+
+
+def test_matches_query(
+    db_path: Path, conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    async def run_queries() -> list[pd.DataFrame]:
+        async_query = AsyncQuery(db_path, max_workers=2)
+        try:
+            return await asyncio.gather(
+                *(async_query.cpt_vs30s_for_one_nzgd_id(i) for i in cpt_nzgd_ids[:5])
+            )
+        finally:
+            await async_query.close()
+
+    for nzgd_id, vs30_df in zip(cpt_nzgd_ids, asyncio.run(run_queries())):
+        pd.testing.assert_frame_equal(
+            vs30_df, query.cpt_vs30s_for_one_nzgd_id(nzgd_id, conn)
+        )
+
+
+def test_concurrency_is_limited(db_path: Path):
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def count_running(conn: sqlite3.Connection) -> None:
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+
+    async def run_queries() -> None:
+        async_query = AsyncQuery(db_path, max_workers=4, max_concurrency=2)
+        try:
+            await asyncio.gather(*(async_query.run(count_running) for _ in range(8)))
+        finally:
+            await async_query.close()
+
+    asyncio.run(run_queries())
+
+    assert max_running == 2
+
+
+def test_used_from_several_event_loops(db_path: Path):
+    # Created outside of any event loop, and with more queries than slots, so that
+    # the queries wait for the semaphore
+    async_query = AsyncQuery(db_path, max_workers=1, max_concurrency=1)
+
+    async def run_queries() -> list[tuple[int]]:
+        return await asyncio.gather(*(async_query.run(_fast_query) for _ in range(3)))
+
+    assert asyncio.run(run_queries()) == [(1,)] * 3
+    assert asyncio.run(run_queries()) == [(1,)] * 3
+    asyncio.run(async_query.close())
+
+
+def test_cancel_interrupts_running_query(db_path: Path):
+    async def cancel_slow_query() -> tuple[float, tuple[int]]:
+        async_query = AsyncQuery(db_path, max_workers=1, max_concurrency=1)
+        try:
+            task = asyncio.create_task(async_query.run(_slow_query))
+            await asyncio.sleep(0.2)
+            cancel_start = time.perf_counter()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            cancel_duration = time.perf_counter() - cancel_start
+            # The slot and the worker thread are free again
+            next_result = await asyncio.wait_for(async_query.run(_fast_query), 5)
+        finally:
+            await async_query.close()
+        return cancel_duration, next_result
+
+    cancel_duration, next_result = asyncio.run(cancel_slow_query())
+
+    assert cancel_duration < 2
+    assert next_result == (1,)
@@ -0,0 +1,25 @@
+"""Tests of the benchmarks in sqlite_tools.benchmark."""
+
+from __future__ import annotations
+
+import inspect
+import sqlite3
+
+from sqlite_tools import benchmark, query
+
+
+def test_every_public_query_is_benchmarked(conn: sqlite3.Connection):
+    public_queries = {
+        name
+        for name, function in vars(query).items()
+        if inspect.isfunction(function)
+        and function.__module__ == query.__name__
+        and not name.startswith("_")
+        and "conn" in inspect.signature(function).parameters
+    }
+    results = benchmark.run_benchmarks(
+        conn, n_single_calls=2, batch_size=5, n_repeats=1
+    )
+
+    assert public_queries <= {result["function"] for result in results}
+    assert all(result["mean_rows"] > 0 for result in results)
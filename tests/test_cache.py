@@ -0,0 +1,70 @@
+"""Tests of the per-record result cache in sqlite_tools.cache."""
+
+from __future__ import annotations
+
+import contextlib
+import shutil
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from sqlite_tools import query
+from sqlite_tools.cache import RecordCache
+
+
+@pytest.fixture
+def wal_conn(db_path: Path, tmp_path: Path) -> Iterator[sqlite3.Connection]:
+    """A connection to a copy of the database in WAL mode, that never checkpoints."""
+    wal_db_path = shutil.copy(db_path, tmp_path / "wal.db")
+    conn = sqlite3.connect(wal_db_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    # Keep the commits in the write-ahead log, so the database file is unchanged
+    conn.execute("PRAGMA wal_autocheckpoint = 0")
+    yield conn
+    conn.close()
+
+
+def _set_vs30(conn: sqlite3.Connection, nzgd_id: int, vs30: float) -> None:
+    """Sets the Vs30 estimates of a CPT record, and commits."""
+    conn.execute(
+        "UPDATE cptvs30estimates SET vs30 = ? WHERE nzgd_id = ?", (vs30, nzgd_id)
+    )
+    conn.commit()
+
+
+def test_commit_in_wal_mode_invalidates_for_same_connection(
+    wal_conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    nzgd_id = cpt_nzgd_ids[0]
+    record_cache = RecordCache()
+    db_path = query.database_path(wal_conn)
+
+    with contextlib.closing(sqlite3.connect(db_path)) as reader_conn:
+        record_cache.call(query.cpt_vs30s_for_one_nzgd_id, nzgd_id, reader_conn)
+        _set_vs30(wal_conn, nzgd_id, 123.0)
+        vs30_df = record_cache.call(
+            query.cpt_vs30s_for_one_nzgd_id, nzgd_id, reader_conn
+        )
+
+    assert vs30_df["vs30"].eq(123.0).all()
+
+
+def test_commit_in_wal_mode_invalidates_for_new_connections(
+    wal_conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    nzgd_id = cpt_nzgd_ids[0]
+    record_cache = RecordCache()
+    db_path = query.database_path(wal_conn)
+
+    # A new connection per call, like a web server that connects per request
+    for vs30 in [123.0, 456.0]:
+        with contextlib.closing(sqlite3.connect(db_path)) as reader_conn:
+            record_cache.call(query.cpt_vs30s_for_one_nzgd_id, nzgd_id, reader_conn)
+        _set_vs30(wal_conn, nzgd_id, vs30)
+        with contextlib.closing(sqlite3.connect(db_path)) as reader_conn:
+            vs30_df = record_cache.call(
+                query.cpt_vs30s_for_one_nzgd_id, nzgd_id, reader_conn
+            )
+        assert vs30_df["vs30"].eq(vs30).all()
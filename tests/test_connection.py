@@ -0,0 +1,91 @@
+"""Tests of the read-only connections in sqlite_tools.connection."""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from sqlite_tools import query
+from sqlite_tools.connection import ConnectionPool, connect_read_only
+
+
+def test_connect_read_only_cannot_write(db_path: Path):
+    read_only_conn = connect_read_only(db_path)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="readonly|read-only"):
+            read_only_conn.execute("DELETE FROM nzgdrecord")
+    finally:
+        read_only_conn.close()
+
+
+def test_connect_read_only_missing_file(tmp_path: Path):
+    with pytest.raises(FileNotFoundError):
+        connect_read_only(tmp_path / "missing.db")
+    assert not (tmp_path / "missing.db").exists()
+
+
+def test_pool_gives_each_thread_its_own_connection(db_path: Path):
+    pool = ConnectionPool(db_path)
+    n_threads = 4
+    barrier = threading.Barrier(n_threads)
+
+    def thread_connections() -> tuple[int, int]:
+        first_conn = pool.connection()
+        # Every thread holds its connection at once, so no thread can reuse a
+        # connection of a thread that has finished
+        barrier.wait()
+        return id(first_conn), id(pool.connection())
+
+    try:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            connection_ids = list(
+                executor.map(lambda _: thread_connections(), range(n_threads))
+            )
+        main_conn = pool.connection()
+        assert main_conn is pool.connection()
+        with pytest.raises(sqlite3.OperationalError, match="readonly|read-only"):
+            main_conn.execute("DELETE FROM nzgdrecord")
+    finally:
+        pool.close()
+
+    first_ids = [first_id for first_id, _ in connection_ids]
+    assert all(first_id == second_id for first_id, second_id in connection_ids)
+    assert len(set(first_ids)) == n_threads
+    assert id(main_conn) not in first_ids
+
+
+def test_pool_close_closes_every_connection(db_path: Path):
+    pool = ConnectionPool(db_path)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        worker_conn = executor.submit(pool.connection).result()
+    main_conn = pool.connection()
+
+    pool.close()
+
+    for conn in (worker_conn, main_conn):
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    # Using the pool after it is closed opens a new connection
+    reopened_conn = pool.connection()
+    assert reopened_conn is not main_conn
+    assert reopened_conn.execute("SELECT 1").fetchone() == (1,)
+    pool.close()
+
+
+def test_pool_in_place_of_connection(
+    db_path: Path, conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    pool = ConnectionPool(db_path)
+    try:
+        pool_df = query.cpt_vs30s_for_nzgd_ids(cpt_nzgd_ids[:10], pool)
+    finally:
+        pool.close()
+
+    pd.testing.assert_frame_equal(
+        pool_df, query.cpt_vs30s_for_nzgd_ids(cpt_nzgd_ids[:10], conn)
+    )
@@ -0,0 +1,110 @@
+"""Tests of the content-hash diff in sqlite_tools.diff."""
+
+from __future__ import annotations
+
+import contextlib
+import shutil
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from sqlite_tools import diff
+
+
+@pytest.fixture
+def new_db_path(db_path: Path, tmp_path: Path) -> Path:
+    """A copy of the synthetic database, to be changed by the tests."""
+    return Path(shutil.copy(db_path, tmp_path / "new.db"))
+
+
+def _execute(db_path: Path, *statements: str) -> None:
+    """Runs SQL statements on a database and commits."""
+    with contextlib.closing(sqlite3.connect(db_path)) as conn:
+        for statement in statements:
+            conn.execute(statement)
+        conn.commit()
+
+
+def test_record_hashes_are_exact_uint64(db_path: Path, new_db_path: Path):
+    _execute(new_db_path, "DELETE FROM nzgdrecord WHERE nzgd_id = 5")
+    with contextlib.closing(sqlite3.connect(db_path)) as conn:
+        old_hashes_df = diff.record_hashes(conn)
+    with contextlib.closing(sqlite3.connect(new_db_path)) as conn:
+        new_hashes_df = diff.record_hashes(conn)
+
+    assert (old_hashes_df.dtypes == np.uint64).all()
+    assert (new_hashes_df.dtypes == np.uint64).all()
+    assert new_hashes_df.loc[5, "nzgdrecord"] == 0
+    unchanged_df = old_hashes_df.drop(index=5)
+    assert new_hashes_df.drop(index=5).equals(unchanged_df)
+
+
+def test_identical_databases(db_path: Path, new_db_path: Path):
+    assert diff.diff_databases(db_path, new_db_path).changed_nzgd_ids == []
+
+
+def test_removed_record(db_path: Path, new_db_path: Path):
+    # The other rows of the record are left behind, but it is still removed
+    _execute(new_db_path, "DELETE FROM nzgdrecord WHERE nzgd_id = 5")
+
+    database_diff = diff.diff_databases(db_path, new_db_path)
+
+    assert database_diff.removed_nzgd_ids == [5]
+    assert database_diff.changed_nzgd_ids == [5]
+
+
+def test_added_record(db_path: Path, new_db_path: Path):
+    _execute(
+        new_db_path,
+        "INSERT INTO nzgdrecord (nzgd_id, type_prefix) VALUES (1000000, 'CPT')",
+    )
+
+    database_diff = diff.diff_databases(db_path, new_db_path)
+
+    assert database_diff.added_nzgd_ids == [1000000]
+    assert database_diff.changed_nzgd_ids == [1000000]
+
+
+def test_modified_record(db_path: Path, new_db_path: Path):
+    with contextlib.closing(sqlite3.connect(new_db_path)) as conn:
+        cpt_id, nzgd_id = conn.execute(
+            "SELECT cpt_id, nzgd_id FROM cptreport ORDER BY cpt_id LIMIT 1"
+        ).fetchone()
+    _execute(
+        new_db_path,
+        f"""UPDATE cptmeasurements SET qc = qc + 1 WHERE measurement_id = (
+            SELECT MIN(measurement_id) FROM cptmeasurements WHERE cpt_id = {cpt_id}
+        )""",
+    )
+
+    database_diff = diff.diff_databases(db_path, new_db_path)
+
+    assert database_diff.modified_nzgd_ids == [nzgd_id]
+    assert database_diff.modified_tables == {nzgd_id: ["cptmeasurements"]}
+    assert database_diff.changed_nzgd_ids == [nzgd_id]
+
+
+def test_renumbered_and_reordered_rows(db_path: Path, new_db_path: Path):
+    # Renumber the surrogate ids and reverse the order of the rows, which does not
+    # change the content of any record
+    _execute(
+        new_db_path,
+        "UPDATE cptreport SET cpt_id = cpt_id + 100000",
+        "UPDATE cptmeasurements SET cpt_id = cpt_id + 100000",
+        "UPDATE cptvs30estimates SET cpt_id = cpt_id + 100000",
+        "UPDATE cptmeasurements SET measurement_id = -measurement_id",
+        "UPDATE cptvs30estimates SET vs30_id = -vs30_id",
+        "UPDATE sptvs30estimates SET vs30_id = -vs30_id",
+        "UPDATE region SET region_id = region_id + 1000",
+        "UPDATE nzgdrecord SET region_id = region_id + 1000",
+        "UPDATE vstovs30correlation "
+        "SET vs_to_vs30_correlation_id = vs_to_vs30_correlation_id + 1000",
+        "UPDATE cptvs30estimates "
+        "SET vs_to_vs30_correlation_id = vs_to_vs30_correlation_id + 1000",
+        "UPDATE sptvs30estimates "
+        "SET vs_to_vs30_correlation_id = vs_to_vs30_correlation_id + 1000",
+    )
+
+    assert diff.diff_databases(db_path, new_db_path).changed_nzgd_ids == []
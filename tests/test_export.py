@@ -0,0 +1,66 @@
+"""Tests of the sharded export in sqlite_tools.export."""
+
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from sqlite_tools import export, query
+
+pytest.importorskip("pyarrow")
+
+
+def _read_table(output_dir: Path, table: str) -> pd.DataFrame:
+    """Reads and concatenates the shard files of an exported table."""
+    return pd.concat(
+        [
+            pd.read_parquet(file_path)
+            for file_path in sorted((output_dir / table).glob("shard_*.parquet"))
+        ],
+        ignore_index=True,
+    )
+
+
+def test_export_matches_queries(
+    db_path: Path, tmp_path: Path, conn: sqlite3.Connection, spt_nzgd_ids: list[int]
+):
+    export_progress = export.export_database(
+        db_path, tmp_path / "export", n_workers=2, shard_size=30
+    )
+
+    soil_types_df = _read_table(tmp_path / "export", "spt_soil_types")
+    expected_df = query.spt_soil_types_for_nzgd_ids(
+        sorted(spt_nzgd_ids), conn, format_layer_thickness=False
+    )
+    assert export_progress.n_shards_done == export_progress.n_shards_total
+    assert pd.api.types.is_float_dtype(soil_types_df["layer_thickness"])
+    pd.testing.assert_frame_equal(soil_types_df, expected_df, check_dtype=False)
+
+
+def test_export_resumes(db_path: Path, tmp_path: Path):
+    output_dir = tmp_path / "export"
+    export.export_database(db_path, output_dir, n_workers=2, shard_size=30)
+    measurements_df = _read_table(output_dir, "cpt_measurements")
+    removed_file_path = output_dir / "cpt_measurements" / "shard_00001.parquet"
+    removed_file_path.unlink()
+
+    export_progress = export.export_database(
+        db_path, output_dir, n_workers=2, shard_size=30
+    )
+
+    assert export_progress.n_shards_total == 1
+    assert removed_file_path.exists()
+    pd.testing.assert_frame_equal(
+        _read_table(output_dir, "cpt_measurements"), measurements_df
+    )
+
+
+def test_export_of_different_database_version(db_path: Path, tmp_path: Path):
+    output_dir = tmp_path / "export"
+    export.export_database(db_path, output_dir, n_workers=1, shard_size=30)
+
+    with pytest.raises(ValueError, match="cannot be resumed"):
+        export.export_database(db_path, output_dir, n_workers=1, shard_size=40)
@@ -0,0 +1,53 @@
+"""Tests of the index checks in sqlite_tools.indexes."""
+
+from __future__ import annotations
+
+import contextlib
+import inspect
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from sqlite_tools import indexes, query
+
+
+def test_every_public_query_is_traced(conn: sqlite3.Connection):
+    public_queries = {
+        name
+        for name, function in vars(query).items()
+        if inspect.isfunction(function)
+        and function.__module__ == query.__name__
+        and not name.startswith("_")
+        and "conn" in inspect.signature(function).parameters
+    }
+    traced_statements = indexes._traced_statements(conn)
+
+    assert set(traced_statements) == public_queries
+    assert all(traced_statements.values())
+
+
+def test_no_full_scans_with_recommended_indexes(conn: sqlite3.Connection):
+    assert indexes.missing_indexes(conn) == []
+    assert indexes.full_scans(conn) == {}
+
+
+def test_copy_with_indexes_relative_path(
+    db_path: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    # A copy of the synthetic database that is missing one of the indexes
+    dropped_index = indexes.RECOMMENDED_INDEXES[0]
+    with (
+        contextlib.closing(sqlite3.connect(db_path)) as conn,
+        contextlib.closing(sqlite3.connect(tmp_path / "source.db")) as source_conn,
+    ):
+        conn.backup(source_conn)
+        source_conn.execute(f"DROP INDEX {dropped_index.name}")
+        source_conn.commit()
+
+    monkeypatch.chdir(tmp_path)
+    created = indexes.copy_with_indexes(Path("source.db"), Path("copy.db"))
+
+    assert created == [dropped_index]
+    with contextlib.closing(sqlite3.connect(tmp_path / "copy.db")) as copy_conn:
+        assert indexes.missing_indexes(copy_conn) == []
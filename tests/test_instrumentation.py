@@ -0,0 +1,84 @@
+"""Tests of the query instrumentation in sqlite_tools.instrumentation."""
+
+from __future__ import annotations
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from sqlite_tools import instrumentation, query
+
+
+def test_record_queries_records_statements(
+    conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    nzgd_id = cpt_nzgd_ids[0]
+    expected_df = query.cpt_vs30s_for_one_nzgd_id(nzgd_id, conn)
+
+    with instrumentation.record_queries() as recorder:
+        vs30_df = query.cpt_vs30s_for_one_nzgd_id(nzgd_id, conn)
+
+    pd.testing.assert_frame_equal(vs30_df, expected_df)
+    assert len(recorder.events) == 1
+    event = recorder.events[0]
+    assert event.function == "cpt_vs30s_for_one_nzgd_id"
+    assert event.n_rows == len(vs30_df)
+    assert event.statements
+    statement = event.statements[-1]
+    assert "cptvs30estimates" in statement.sql
+    assert nzgd_id in statement.params
+    assert statement.n_rows == len(vs30_df)
+    assert statement.query_plan is None
+    assert all(statement.sqlite_time_s >= 0 for statement in event.statements)
+    assert 0 <= event.sqlite_time_s <= event.total_time_s
+    assert event.pandas_time_s == pytest.approx(
+        event.total_time_s - event.sqlite_time_s
+    )
+
+
+def test_record_queries_explains_query_plans(
+    conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    with instrumentation.record_queries(explain_query_plans=True) as recorder:
+        query.cpt_vs30s_for_one_nzgd_id(cpt_nzgd_ids[0], conn)
+
+    query_plan = recorder.events[0].statements[-1].query_plan
+    assert query_plan
+    assert any("cptvs30estimates" in step for step in query_plan)
+
+
+def test_nested_calls_are_part_of_the_outermost_event(
+    conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    with instrumentation.record_queries() as recorder:
+        query.record_details(cpt_nzgd_ids[0], conn, include_measurements=True)
+
+    assert [event.function for event in recorder.events] == ["record_details"]
+    assert len(recorder.events[0].statements) > 1
+
+
+def test_stats_aggregate_calls(conn: sqlite3.Connection, cpt_nzgd_ids: list[int]):
+    with instrumentation.record_queries() as recorder:
+        for nzgd_id in cpt_nzgd_ids[:3]:
+            query.cpt_vs30s_for_one_nzgd_id(nzgd_id, conn)
+        query.cpt_measurements_for_one_nzgd(cpt_nzgd_ids[0], conn)
+
+    stats_df = recorder.stats()
+    statements_df = recorder.statements()
+
+    assert stats_df.loc["cpt_vs30s_for_one_nzgd_id", "n_calls"] == 3
+    assert stats_df.loc["cpt_measurements_for_one_nzgd", "n_calls"] == 1
+    assert stats_df["n_statements"].sum() == len(statements_df)
+    assert set(statements_df["function"]) == set(stats_df.index)
+
+
+def test_calls_after_recording_are_not_recorded(
+    conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    with instrumentation.record_queries() as recorder:
+        pass
+    query.cpt_vs30s_for_one_nzgd_id(cpt_nzgd_ids[0], conn)
+
+    assert recorder.events == []
+    assert instrumentation._hooks == []
@@ -0,0 +1,93 @@
+"""Tests of the resampled profile store in sqlite_tools.profiles."""
+
+from __future__ import annotations
+
+import contextlib
+import shutil
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from sqlite_tools import query
+from sqlite_tools.profiles import (
+    CPT_CHANNELS,
+    DepthGrid,
+    ProfileStore,
+    build_profile_store,
+)
+
+# A grid whose depths are between the depths of the synthetic measurements, so the
+# profiles are interpolated
+GRID = DepthGrid(start=0.01, step=0.05)
+
+
+@pytest.mark.parametrize(
+    "grid, shallowest_depth, deepest_depth, expected",
+    [
+        # Both depths between the same two grid depths
+        (DepthGrid(0.0, 0.02), 0.001, 0.015, range(1, 1)),
+        (DepthGrid(0.0, 0.02), 0.03, 0.035, range(2, 2)),
+        # A single depth on the grid
+        (DepthGrid(0.0, 0.02), 0.04, 0.04, range(2, 3)),
+        # Depths that are only on the grid up to rounding errors
+        (DepthGrid(0.0, 0.1), 0.1 + 0.2, 0.7, range(3, 8)),
+        # Depths above the start of the grid
+        (DepthGrid(1.0, 0.5), 0.2, 1.6, range(2)),
+        (DepthGrid(1.0, 0.5), 0.2, 0.8, range(0)),
+    ],
+)
+def test_index_range(
+    grid: DepthGrid, shallowest_depth: float, deepest_depth: float, expected: range
+):
+    assert grid.index_range(shallowest_depth, deepest_depth) == expected
+
+
+@pytest.fixture
+def store(db_path: Path, tmp_path: Path) -> ProfileStore:
+    """A float64 store of the profiles of the database, resampled onto GRID."""
+    return ProfileStore(
+        build_profile_store(db_path, tmp_path / "store", grid=GRID, dtype="float64")
+    )
+
+
+def test_cpt_profile_matches_interpolation(
+    store: ProfileStore, conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    for nzgd_id in cpt_nzgd_ids[:20]:
+        measurements_df = query.cpt_measurements_for_one_nzgd(nzgd_id, conn)
+        for cpt_id, sounding_df in measurements_df.groupby("cpt_id"):
+            profile = store.cpt_profile(cpt_id)
+            depths = sounding_df["depth"].to_numpy()
+
+            expected_depths = GRID.start + GRID.step * np.arange(1000)
+            expected_depths = expected_depths[
+                (expected_depths >= depths.min()) & (expected_depths <= depths.max())
+            ]
+            assert profile.nzgd_id == nzgd_id
+            np.testing.assert_allclose(profile.depth, expected_depths)
+            for channel_index, channel in enumerate(CPT_CHANNELS):
+                np.testing.assert_allclose(
+                    profile.values[:, channel_index],
+                    np.interp(profile.depth, depths, sounding_df[channel].to_numpy()),
+                )
+
+
+def test_profile_shallower_than_one_step(db_path: Path, tmp_path: Path):
+    copy_path = shutil.copy(db_path, tmp_path / db_path.name)
+    with contextlib.closing(sqlite3.connect(copy_path)) as copy_conn:
+        cpt_id = copy_conn.execute("SELECT MIN(cpt_id) FROM cptreport").fetchone()[0]
+        # Leaves two measurements, between the grid depths 0.01 and 0.06
+        copy_conn.execute(
+            "DELETE FROM cptmeasurements WHERE cpt_id = ? AND depth NOT IN (0.02, 0.04)",
+            (cpt_id,),
+        )
+        copy_conn.commit()
+
+    store = ProfileStore(build_profile_store(copy_path, tmp_path / "store", grid=GRID))
+    profile = store.cpt_profile(cpt_id)
+
+    assert profile.depth.shape == (0,)
+    assert profile.values.shape == (0, len(CPT_CHANNELS))
+    assert not store.is_stale(copy_path)
@@ -0,0 +1,315 @@
+"""Tests of the query functions in sqlite_tools.query."""
+
+from __future__ import annotations
+
+import shutil
+import sqlite3
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sqlite_tools import core, instrumentation, query, read_optimised
+
+# The batched functions, and the single-ID functions they must be equivalent to
+BATCHED_FUNCTIONS = [
+    (query.cpt_measurements_for_nzgd_ids, query.cpt_measurements_for_one_nzgd, "cpt"),
+    (query.spt_measurements_for_nzgd_ids, query.spt_measurements_for_one_nzgd, "spt"),
+    (query.spt_soil_types_for_nzgd_ids, query.spt_soil_types_for_one_nzgd, "spt"),
+    (query.cpt_vs30s_for_nzgd_ids, query.cpt_vs30s_for_one_nzgd_id, "cpt"),
+    (query.spt_vs30s_for_nzgd_ids, query.spt_vs30s_for_one_nzgd_id, "spt"),
+]
+
+
+@pytest.mark.parametrize(
+    "batch_function, single_function, kind",
+    BATCHED_FUNCTIONS,
+    ids=[batch_function.__name__ for batch_function, _, _ in BATCHED_FUNCTIONS],
+)
+def test_batched_matches_concatenated_single_ids(
+    conn: sqlite3.Connection,
+    cpt_nzgd_ids: list[int],
+    spt_nzgd_ids: list[int],
+    batch_function: Callable[..., pd.DataFrame],
+    single_function: Callable[..., pd.DataFrame],
+    kind: str,
+):
+    nzgd_ids = cpt_nzgd_ids if kind == "cpt" else spt_nzgd_ids
+    # Unordered IDs and a duplicate, so the order of the requested IDs is tested
+    nzgd_ids = nzgd_ids[::2] + nzgd_ids[1::2] + nzgd_ids[:1]
+
+    expected_df = pd.concat(
+        [single_function(nzgd_id, conn) for nzgd_id in dict.fromkeys(nzgd_ids)],
+        ignore_index=True,
+    )
+    pd.testing.assert_frame_equal(batch_function(nzgd_ids, conn), expected_df)
+
+
+def test_chunked_rows_match_one_chunk(
+    conn: sqlite3.Connection, cpt_nzgd_ids: list[int]
+):
+    query_template = (
+        core.CPT_VS30_QUERY
+        + """
+    WHERE cptvs30estimates.nzgd_id IN ({placeholders})"""
+        + core.CPT_VS30_ORDER_BY
+    )
+    assert core.fetch_rows_for_nzgd_ids(
+        query_template, cpt_nzgd_ids, conn, chunk_size=7
+    ) == core.fetch_rows_for_nzgd_ids(query_template, cpt_nzgd_ids, conn)
+
+
+def test_batched_without_ids(conn: sqlite3.Connection):
+    cpt_vs30_df = query.cpt_vs30s_for_nzgd_ids([], conn)
+    assert cpt_vs30_df.empty
+    assert "vs30_log_residual" in cpt_vs30_df
+
+
+def test_core_rows_match_dataframes(conn: sqlite3.Connection, cpt_nzgd_ids: list[int]):
+    rows = core.cpt_measurement_rows_for_nzgd_ids(cpt_nzgd_ids, conn)
+    rows_df = pd.DataFrame.from_records(
+        rows.rows, columns=list(rows.columns), coerce_float=True
+    )
+    pd.testing.assert_frame_equal(
+        rows_df, query.cpt_measurements_for_nzgd_ids(cpt_nzgd_ids, conn)
+    )
+
+
+@pytest.mark.parametrize("per_sounding", [True, False])
+def test_iter_cpt_measurements_matches_one_query(
+    conn: sqlite3.Connection, per_sounding: bool
+):
+    expected_df = pd.read_sql(core.ALL_CPT_MEASUREMENTS_QUERY, conn)
+
+    # A chunk size that splits most soundings across chunks
+    measurement_dfs = list(
+        query.iter_cpt_measurements(conn, chunk_size=7, per_sounding=per_sounding)
+    )
+
+    pd.testing.assert_frame_equal(
+        pd.concat(measurement_dfs, ignore_index=True), expected_df
+    )
+    if per_sounding:
+        assert [df["cpt_id"].iloc[0] for df in measurement_dfs] == list(
+            expected_df["cpt_id"].unique()
+        )
+        assert all(df["cpt_id"].nunique() == 1 for df in measurement_dfs)
+    else:
+        assert all(len(df) == 7 for df in measurement_dfs[:-1])
+
+
+def test_iter_cpt_measurements_records_statement(conn: sqlite3.Connection):
+    @instrumentation.instrumented
+    def count_measurements(conn: sqlite3.Connection) -> int:
+        return sum(
+            len(df)
+            for df in query.iter_cpt_measurements(
+                conn, chunk_size=100, per_sounding=False
+            )
+        )
+
+    with instrumentation.record_queries() as recorder:
+        n_measurements = count_measurements(conn)
+
+    (statement,) = recorder.events[0].statements
+    assert statement.sql == core.ALL_CPT_MEASUREMENTS_QUERY
+    assert statement.n_rows == n_measurements > 100
+
+
+def test_iter_cpt_measurements_without_measurements(db_path: Path, tmp_path: Path):
+    empty_conn = sqlite3.connect(shutil.copy(db_path, tmp_path / db_path.name))
+    empty_conn.execute("DELETE FROM cptmeasurements")
+
+    assert list(query.iter_cpt_measurements(empty_conn)) == []
+    empty_conn.close()
+
+
+@pytest.fixture
+def correlation_names(conn: sqlite3.Connection) -> list[str]:
+    """The first name of each lookup table, in the order of the query arguments."""
+    lookups = query.lookup_tables(conn)
+    return [next(iter(lookups[lookup])) for lookup in query.LOOKUP_TABLES]
+
+
+@pytest.fixture(params=[False, True], ids=["database", "sidecar"])
+def vs30_conn(
+    request: pytest.FixtureRequest, db_path: Path, tmp_path: Path
+) -> Iterator[sqlite3.Connection]:
+    """A connection to a copy of the database, with or without its sidecar."""
+    copy_path = tmp_path / db_path.name
+    shutil.copy(db_path, copy_path)
+    if request.param:
+        read_optimised.build_read_optimised_database(copy_path)
+    conn = sqlite3.connect(copy_path)
+    yield conn
+    conn.close()
+
+
+def _sorted(vs30_df: pd.DataFrame) -> pd.DataFrame:
+    """Sorts Vs30 estimates into a fixed order, so results can be compared."""
+    return vs30_df.sort_values(
+        [column for column in ["nzgd_id", "cpt_id", "vs30"] if column in vs30_df],
+        kind="stable",
+    ).reset_index(drop=True)
+
+
+FILTER_CASES = {
+    "type_prefixes": (
+        query.Vs30Filters(type_prefixes=["CPT", "BH"]),
+        lambda df: df["type_prefix"].isin(["CPT", "BH"]),
+    ),
+    "vs30_range": (
+        query.Vs30Filters(vs30_range=(200, 300)),
+        lambda df: df["vs30"].between(200, 300),
+    ),
+    "open_deepest_depth_range": (
+        query.Vs30Filters(deepest_depth_range=(None, 20)),
+        lambda df: df["deepest_depth"] <= 20,
+    ),
+    "bounding_box": (
+        query.Vs30Filters(bounding_box=(-44, -41, 171, 175)),
+        lambda df: df["latitude"].between(-44, -41) & df["longitude"].between(171, 175),
+    ),
+    "nzgd_ids_and_vs30_range": (
+        query.Vs30Filters(nzgd_ids=range(1, 200, 3), vs30_range=(None, 400)),
+        lambda df: df["nzgd_id"].isin(range(1, 200, 3)) & (df["vs30"] <= 400),
+    ),
+}
+
+
+@pytest.mark.parametrize(
+    "filters, pandas_filter", FILTER_CASES.values(), ids=FILTER_CASES.keys()
+)
+def test_filtered_vs30s_matches_pandas_filtering(
+    vs30_conn: sqlite3.Connection,
+    correlation_names: list[str],
+    filters: query.Vs30Filters,
+    pandas_filter: Callable[[pd.DataFrame], pd.Series],
+):
+    all_vs30_df = query.filtered_vs30s(*correlation_names, vs30_conn)
+    expected_df = all_vs30_df[pandas_filter(all_vs30_df)]
+    assert not expected_df.empty
+
+    pd.testing.assert_frame_equal(
+        _sorted(query.filtered_vs30s(*correlation_names, vs30_conn, filters)),
+        _sorted(expected_df),
+    )
+
+
+@pytest.mark.parametrize(
+    "columns", [["cpt_id"], ["spt_efficiency"], ["cpt_id", "spt_efficiency"]]
+)
+def test_filtered_vs30s_kind_specific_columns(
+    vs30_conn: sqlite3.Connection, correlation_names: list[str], columns: list[str]
+):
+    all_vs30_df = query.filtered_vs30s(*correlation_names, vs30_conn)
+
+    pd.testing.assert_frame_equal(
+        query.filtered_vs30s(*correlation_names, vs30_conn, columns=columns),
+        all_vs30_df[columns],
+    )
+
+
+def _expected_residual_statistics(
+    vs30_df: pd.DataFrame, group_by: list[str], quantiles: list[float]
+) -> pd.DataFrame:
+    """Calculates the residual statistics of Vs30 estimates with a pandas groupby."""
+    residual_statistics_dfs = []
+    for residual in query.RESIDUAL_COLUMNS:
+        residual_df = vs30_df[vs30_df[residual].notna()]
+        values = (
+            residual_df.groupby(group_by)[residual]
+            if group_by
+            else residual_df[residual].groupby(lambda _: 0)
+        )
+        residual_statistics_dfs.append(
+            pd.DataFrame(
+                {
+                    f"{residual}_count": values.count(),
+                    f"{residual}_mean": values.mean(),
+                    f"{residual}_std": values.std(),
+                    **{
+                        f"{residual}_q{quantile * 100:g}": values.quantile(quantile)
+                        for quantile in quantiles
+                    },
+                }
+            )
+        )
+    return pd.concat(residual_statistics_dfs, axis=1)
+
+
+@pytest.mark.parametrize(
+    "group_by, filters, quantiles",
+    [
+        (["region"], None, [0.1, 0.5, 0.9]),
+        (["district", "type_prefix"], None, [0.5]),
+        ([], None, [0, 0.025, 1]),
+        (["region"], query.Vs30Filters(nzgd_ids=range(1, 200, 2)), [0.25, 0.75]),
+    ],
+)
+def test_vs30_residual_statistics_matches_pandas_groupby(
+    vs30_conn: sqlite3.Connection,
+    correlation_names: list[str],
+    group_by: list[str],
+    filters: query.Vs30Filters | None,
+    quantiles: list[float],
+):
+    statistics_df = query.vs30_residual_statistics(
+        *correlation_names,
+        vs30_conn,
+        group_by=group_by,
+        filters=filters,
+        quantiles=quantiles,
+    )
+    expected_df = _expected_residual_statistics(
+        query.filtered_vs30s(*correlation_names, vs30_conn, filters),
+        group_by,
+        quantiles,
+    )
+
+    pd.testing.assert_frame_equal(
+        statistics_df,
+        expected_df,
+        check_dtype=False,
+        check_index_type=False,
+        check_names=False,
+        rtol=1e-9,
+    )
+
+
+def test_vs30_residual_statistics_numpy_quantiles(
+    conn: sqlite3.Connection, correlation_names: list[str]
+):
+    pd.testing.assert_frame_equal(
+        query.vs30_residual_statistics(
+            *correlation_names, conn, quantiles=np.array([0.1, 0.9])
+        ),
+        query.vs30_residual_statistics(*correlation_names, conn, quantiles=[0.1, 0.9]),
+    )
+
+
+def test_vs30_residual_statistics_binds_residual_names(
+    conn: sqlite3.Connection, correlation_names: list[str]
+):
+    with instrumentation.record_queries() as recorder:
+        statistics_df = query.vs30_residual_statistics(*correlation_names, conn)
+
+    (statement,) = recorder.events[0].statements
+    for residual in query.RESIDUAL_COLUMNS:
+        assert residual in statement.params
+        assert f"'{residual}'" not in statement.sql
+    assert list(statistics_df.columns) == [
+        f"{residual}_{statistic}"
+        for residual in query.RESIDUAL_COLUMNS
+        for statistic in ["count", "mean", "std", "q10", "q50", "q90"]
+    ]
+
+
+@pytest.mark.parametrize("quantiles", [[1.5], [-0.1], [np.nan]])
+def test_vs30_residual_statistics_invalid_quantiles(
+    conn: sqlite3.Connection, correlation_names: list[str], quantiles: list[float]
+):
+    with pytest.raises(ValueError, match="Quantiles must be between 0 and 1"):
+        query.vs30_residual_statistics(*correlation_names, conn, quantiles=quantiles)
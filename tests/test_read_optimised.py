@@ -0,0 +1,103 @@
+"""Tests of the read-optimised sidecar in sqlite_tools.read_optimised."""
+
+from __future__ import annotations
+
+import shutil
+import sqlite3
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from sqlite_tools import query, read_optimised
+
+
+@pytest.fixture
+def copy_conn(db_path: Path, tmp_path: Path) -> Iterator[sqlite3.Connection]:
+    """
+    A connection to a copy of the database, without a sidecar, with values whose log
+    residuals are infinite or NaN.
+    """
+    conn = sqlite3.connect(shutil.copy(db_path, tmp_path / db_path.name))
+    conn.execute(
+        """UPDATE nzgdrecord SET model_vs30_foster_2019 = 0
+        WHERE nzgd_id IN (SELECT MIN(nzgd_id) FROM cptreport UNION
+                          SELECT MIN(borehole_id) FROM sptreport)"""
+    )
+    conn.execute("UPDATE cptvs30estimates SET vs30 = 0 WHERE vs30_id % 7 = 0")
+    conn.execute("UPDATE sptvs30estimates SET vs30 = -1 WHERE vs30_id % 7 = 0")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def selected_names(copy_conn: sqlite3.Connection) -> list[str]:
+    """The first name of each lookup table."""
+    lookups = query.lookup_tables(copy_conn)
+    return [next(iter(lookups[lookup])) for lookup in query.LOOKUP_TABLES]
+
+
+QUERIES = {
+    "all_vs30s_given_correlations": query.all_vs30s_given_correlations,
+    "filtered_vs30s": lambda *args: query.filtered_vs30s(
+        *args, filters=query.Vs30Filters(vs30_range=(150, 400))
+    ),
+    "filtered_vs30s_residuals": lambda *args: query.filtered_vs30s(
+        *args, columns=["nzgd_id", "vs30_log_residual", "gwl_residual"]
+    ),
+    "vs30_residual_statistics": lambda *args: query.vs30_residual_statistics(
+        *args, group_by=["region", "type_prefix"]
+    ),
+}
+
+
+@pytest.mark.parametrize("function", QUERIES.values(), ids=QUERIES.keys())
+def test_sidecar_matches_database(
+    copy_conn: sqlite3.Connection,
+    selected_names: list[str],
+    function: Callable[..., pd.DataFrame],
+):
+    database_df = function(*selected_names, copy_conn)
+    db_path = query.database_path(copy_conn)
+    read_optimised.build_read_optimised_database(db_path)
+    assert read_optimised.sidecar_connection(db_path) is not None
+
+    sidecar_df = function(*selected_names, copy_conn)
+
+    pd.testing.assert_frame_equal(sidecar_df, database_df, check_exact=True)
+
+
+def test_sidecar_residuals_are_precomputed(
+    copy_conn: sqlite3.Connection, selected_names: list[str]
+):
+    read_optimised.build_read_optimised_database(query.database_path(copy_conn))
+    sidecar_conn = read_optimised.sidecar_connection(query.database_path(copy_conn))
+    executed = []
+    sidecar_conn.set_trace_callback(executed.append)
+    try:
+        query.filtered_vs30s(*selected_names, copy_conn, columns=["vs30_log_residual"])
+    finally:
+        sidecar_conn.set_trace_callback(None)
+
+    assert executed
+    assert all("f.vs30_log_residual" in statement for statement in executed)
+    assert not any("f.vs30 " in statement for statement in executed)
+
+
+@pytest.mark.parametrize("journal_mode", ["DELETE", "WAL"])
+def test_sidecar_is_stale_after_commit(
+    copy_conn: sqlite3.Connection, journal_mode: str
+):
+    db_path = query.database_path(copy_conn)
+    copy_conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    # Keep WAL commits in the write-ahead log, so the database file is unchanged
+    copy_conn.execute("PRAGMA wal_autocheckpoint = 0")
+    read_optimised.build_read_optimised_database(db_path)
+    assert read_optimised.sidecar_connection(db_path) is not None
+
+    copy_conn.execute("UPDATE cptvs30estimates SET vs30 = vs30 + 1")
+    copy_conn.commit()
+
+    assert read_optimised.sidecar_connection(db_path) is None
@@ -0,0 +1,117 @@
+"""Tests of the Parquet snapshots in sqlite_tools.snapshot."""
+
+from __future__ import annotations
+
+import contextlib
+import math
+import shutil
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from sqlite_tools import query, snapshot
+from sqlite_tools.connection import ConnectionPool
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def copy_conn(db_path: Path, tmp_path: Path) -> Iterator[sqlite3.Connection]:
+    """A connection to a copy of the database."""
+    conn = sqlite3.connect(shutil.copy(db_path, tmp_path / db_path.name))
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def selected_names(copy_conn: sqlite3.Connection) -> list[str]:
+    """The first name of each lookup table."""
+    lookups = query.lookup_tables(copy_conn)
+    return [next(iter(lookups[lookup])) for lookup in query.LOOKUP_TABLES]
+
+
+def _fail_query(*args: object, **kwargs: object) -> pd.DataFrame:
+    """Replaces query.all_vs30s_given_correlations where the snapshot must be used."""
+    raise AssertionError("The database was queried instead of the snapshot")
+
+
+def test_snapshot_is_created_and_reused(
+    copy_conn: sqlite3.Connection,
+    selected_names: list[str],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    snapshot_dir = tmp_path / "snapshots"
+    database_df = query.all_vs30s_given_correlations(*selected_names, copy_conn)
+
+    created_df = snapshot.all_vs30s_given_correlations(
+        *selected_names, copy_conn, snapshot_dir
+    )
+    file_path = snapshot.snapshot_path(
+        snapshot_dir, snapshot.database_token(copy_conn), *selected_names
+    )
+    assert file_path.exists()
+
+    monkeypatch.setattr(query, "all_vs30s_given_correlations", _fail_query)
+    reused_df = snapshot.all_vs30s_given_correlations(
+        *selected_names, copy_conn, snapshot_dir
+    )
+
+    pd.testing.assert_frame_equal(created_df, database_df)
+    pd.testing.assert_frame_equal(reused_df, database_df)
+
+
+@pytest.mark.parametrize("journal_mode", ["DELETE", "WAL"])
+def test_snapshot_is_invalidated_by_commit(
+    copy_conn: sqlite3.Connection,
+    selected_names: list[str],
+    tmp_path: Path,
+    journal_mode: str,
+):
+    snapshot_dir = tmp_path / "snapshots"
+    copy_conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    # Keep WAL commits in the write-ahead log, so the database file is unchanged
+    copy_conn.execute("PRAGMA wal_autocheckpoint = 0")
+    old_token = snapshot.database_token(copy_conn)
+    snapshot.all_vs30s_given_correlations(*selected_names, copy_conn, snapshot_dir)
+
+    copy_conn.execute("UPDATE cptvs30estimates SET vs30 = vs30 + 1")
+    copy_conn.commit()
+
+    assert snapshot.database_token(copy_conn) != old_token
+    pd.testing.assert_frame_equal(
+        snapshot.all_vs30s_given_correlations(*selected_names, copy_conn, snapshot_dir),
+        query.all_vs30s_given_correlations(*selected_names, copy_conn),
+    )
+
+
+def test_snapshots_accept_connection_pool(
+    copy_conn: sqlite3.Connection, selected_names: list[str], tmp_path: Path
+):
+    snapshot_dir = tmp_path / "snapshots"
+    pool = ConnectionPool(query.database_path(copy_conn))
+    try:
+        assert snapshot.database_token(pool) == snapshot.database_token(copy_conn)
+        file_paths = snapshot.prebuild_snapshots(pool, snapshot_dir)
+        pool_df = snapshot.all_vs30s_given_correlations(
+            *selected_names, pool, snapshot_dir
+        )
+    finally:
+        pool.close()
+
+    lookups = query.lookup_tables(copy_conn)
+    assert len(set(file_paths)) == math.prod(
+        len(lookups[lookup]) for lookup in query.LOOKUP_TABLES
+    )
+    assert all(file_path.exists() for file_path in file_paths)
+    pd.testing.assert_frame_equal(
+        pool_df, query.all_vs30s_given_correlations(*selected_names, copy_conn)
+    )
+
+
+def test_in_memory_database_has_no_token():
+    with contextlib.closing(sqlite3.connect(":memory:")) as memory_conn:
+        assert snapshot.database_token(memory_conn) is None
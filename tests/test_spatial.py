@@ -0,0 +1,109 @@
+"""Tests of the spatial queries in sqlite_tools.spatial."""
+
+from __future__ import annotations
+
+import shutil
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sqlite_tools import query, spatial
+
+
+@pytest.fixture
+def antimeridian_conn(db_path: Path, tmp_path: Path) -> Iterator[sqlite3.Connection]:
+    """A copy of the database with some records moved to either side of 180 degrees."""
+    conn = sqlite3.connect(shutil.copy(db_path, tmp_path / "antimeridian.db"))
+    conn.execute(
+        """UPDATE nzgdrecord
+        SET latitude = -44.0 + (nzgd_id % 10) * 0.01,
+            longitude = CASE WHEN nzgd_id % 2 THEN 179.9 ELSE -179.9 END
+        WHERE nzgd_id IN (SELECT nzgd_id FROM nzgdrecord ORDER BY nzgd_id LIMIT 20)"""
+    )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _locations(conn: sqlite3.Connection) -> pd.DataFrame:
+    """The locations of every record, ordered by NZGD ID."""
+    return pd.read_sql(
+        """SELECT nzgd_id, latitude, longitude FROM nzgdrecord
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        ORDER BY nzgd_id""",
+        conn,
+    )
+
+
+@pytest.mark.parametrize(
+    "latitude, longitude, radius_km",
+    [(-44.0, 179.95, 50.0), (-44.0, -179.95, 50.0), (-44.0, 175.0, 500.0)],
+)
+def test_within_radius_matches_brute_force(
+    antimeridian_conn: sqlite3.Connection,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+):
+    spatial_index = spatial.SpatialIndex.for_database(antimeridian_conn)
+    locations_df = _locations(antimeridian_conn)
+    distances_km = spatial._haversine_km(
+        latitude,
+        longitude,
+        locations_df["latitude"].to_numpy(),
+        locations_df["longitude"].to_numpy(),
+    )
+
+    within_radius_df = spatial_index.within_radius(latitude, longitude, radius_km)
+    spatial_index.close()
+
+    assert set(within_radius_df["nzgd_id"]) == set(
+        locations_df["nzgd_id"][distances_km <= radius_km]
+    )
+    assert within_radius_df["longitude"].gt(179).any()
+    assert within_radius_df["longitude"].lt(-179).any()
+
+
+def test_bounding_box_across_antimeridian(antimeridian_conn: sqlite3.Connection):
+    spatial_index = spatial.SpatialIndex.for_database(antimeridian_conn)
+    locations_df = _locations(antimeridian_conn)
+    expected_df = locations_df[
+        locations_df["latitude"].between(-45, -43)
+        & ~locations_df["longitude"].between(-179, 179, inclusive="neither")
+    ].reset_index(drop=True)
+
+    bounding_box_df = spatial_index.bounding_box(-45, -43, 179, -179)
+    spatial_index.close()
+
+    assert len(expected_df) == 20
+    pd.testing.assert_frame_equal(
+        bounding_box_df, expected_df, check_dtype=False, check_exact=False
+    )
+    assert np.all(np.diff(bounding_box_df["nzgd_id"]) > 0)
+
+
+def test_for_database_in_memory():
+    with pytest.raises(ValueError, match="in-memory"):
+        spatial.SpatialIndex.for_database(sqlite3.connect(":memory:"))
+
+
+@pytest.mark.parametrize("journal_mode", ["DELETE", "WAL"])
+def test_index_is_stale_after_commit(
+    antimeridian_conn: sqlite3.Connection, journal_mode: str
+):
+    antimeridian_conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    # Keep WAL commits in the write-ahead log, so the database file is unchanged
+    antimeridian_conn.execute("PRAGMA wal_autocheckpoint = 0")
+    db_path = query.database_path(antimeridian_conn)
+    spatial_index = spatial.SpatialIndex.for_database(antimeridian_conn)
+    assert not spatial_index.is_stale(db_path)
+
+    antimeridian_conn.execute("UPDATE nzgdrecord SET latitude = latitude + 0.001")
+    antimeridian_conn.commit()
+
+    assert spatial_index.is_stale(db_path)
+    spatial_index.close()